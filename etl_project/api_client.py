@@ -0,0 +1,257 @@
+"""
+HTTP client of the Socrata API of the Chicago crimes dataset, shared by every API call of the pipeline and of the one-shot CLI.
+
+Throttled (429) and failed (5xx, connection errors, timeouts) requests are retried with jittered exponential backoff,
+waiting at least the Retry-After of the response. Requests of all fetcher threads go through one token bucket:
+its rate is halved on every 429 and recovers step by step on successful requests (additive increase, multiplicative decrease),
+so the client settles just below the rate the portal allows. Every request has a connect and a read timeout.
+
+Also holds the URL of the dataset and the max(:updated_at) query, used by the CLI to check for new updates before 
+importing etl_project.pipeline. Only imports requests, so that etl_project.cli stays light.
+
+Usage example:
+    set_api_client(ApiClient(requests_per_second=5, max_retries=5))
+    response = get_api_client().get(f"{CRIME_API_URL}?$select=max(:updated_at)")
+"""
+from requests.adapters import HTTPAdapter
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Callable, Union
+import os
+import random
+import requests
+import threading
+import time
+
+CRIME_API_URL = os.environ.get("CRIME_API_URL", "https://data.cityofchicago.org/resource/x2n5-8w5q.json") # overridden e.g. by benchmarks against a local API
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+TOKEN_EPSILON = 1e-9 # a refill short of a whole token by rounding only counts as one, else the wait left is too small to move the clock
+
+class TokenBucket:
+    """
+    Thread-safe token bucket allowing requests_per_second requests on average and bursts of up to capacity requests.
+    The rate adapts between min_rate and requests_per_second: decrease halves it (after a 429), increase adds
+    a tenth of requests_per_second back (after a successful request).
+
+    Usage example:
+        token_bucket = TokenBucket(requests_per_second=5)
+        token_bucket.acquire()
+
+    Args:
+        requests_per_second: provide a float for the highest rate (None for no limit).
+        capacity: provide a float for the largest burst (defaults to one second of requests, at least 1).
+        min_rate: provide a float for the lowest rate decrease goes down to.
+        clock: provide a monotonic clock returning seconds (time.monotonic, replaced in tests).
+        sleep: provide a function sleeping for a number of seconds (time.sleep, replaced in tests).
+    """
+    def __init__(self, requests_per_second: Union[float, None], capacity: float = None, min_rate: float = 0.1,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.max_rate = requests_per_second
+        self.rate = requests_per_second
+        self.capacity = capacity if capacity is not None else max(1.0, requests_per_second or 1.0)
+        self.min_rate = min_rate
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.capacity
+        self.updated_at = clock()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self) -> float:
+        """
+        Takes one token, waiting until one is available and any pause is over. Returns the seconds waited.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self.clock()
+                if now < self.paused_until:
+                    wait_seconds = self.paused_until - now
+                elif self.rate is None:
+                    return waited
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1 - TOKEN_EPSILON:
+                        self.tokens = max(0.0, self.tokens - 1)
+                        return waited
+                    wait_seconds = (1 - self.tokens) / self.rate
+            self.sleep(wait_seconds)
+            waited += wait_seconds
+
+    def pause(self, seconds: float) -> None:
+        """
+        Holds back every request for seconds (e.g. the Retry-After of a 429), without shortening a longer pause. 
+        The bucket is empty when the pause ends, so requests resume one token (1 / rate seconds) after it rather than in a burst.
+        """
+        with self._lock:
+            self.paused_until = max(self.paused_until, self.clock() + seconds)
+            self.tokens = 0.0
+            self.updated_at = max(self.updated_at, self.paused_until)
+
+    def decrease(self) -> None:
+        """
+        Halves the rate, down to min_rate.
+        """
+        with self._lock:
+            if self.rate is not None:
+                self._refill(max(self.clock(), self.updated_at))
+                self.rate = max(self.min_rate, self.rate / 2)
+
+    def increase(self) -> None:
+        """
+        Adds a tenth of the highest rate back to the rate, up to the highest rate.
+        """
+        with self._lock:
+            if self.rate is not None and self.rate < self.max_rate:
+                self._refill(max(self.clock(), self.updated_at))
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+def create_http_session(pool_maxsize: int = 16) -> requests.Session:
+    """
+    Creates a requests.Session that keeps up to pool_maxsize connections to the API host alive and asks for gzip-compressed responses.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip"})
+    return session
+
+def retry_after_seconds(response: requests.Response) -> Union[float, None]:
+    """
+    Returns the seconds to wait from the Retry-After header of response (a number of seconds or an HTTP date), or None without one.
+    """
+    retry_after = response.headers.get("Retry-After")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+class ApiClient:
+    """
+    Sends GET requests to the API through one pooled session and one TokenBucket shared by all threads,
+    retrying throttled and failed requests (see the module docstring).
+
+    Usage example:
+        api_client = ApiClient(requests_per_second=5, max_retries=5)
+        response = api_client.get(url=f"{CRIME_API_URL}?$select=max(:updated_at)")
+
+    Args:
+        requests_per_second: provide a float for the highest request rate of all threads together (None for no limit).
+        max_retries: provide an int for the retries of a request before giving up.
+        backoff_seconds: provide a float for the backoff before the first retry, doubled on every retry.
+        max_backoff_seconds: provide a float for the longest backoff.
+        connect_timeout_seconds: provide a float for the timeout of opening a connection.
+        read_timeout_seconds: provide a float for the longest wait for data of the response.
+        pool_maxsize: provide an int for the connections kept alive (at least the number of fetcher threads).
+        clock: provide a monotonic clock returning seconds (time.monotonic, replaced in tests).
+        sleep: provide a function sleeping for a number of seconds (time.sleep, replaced in tests).
+    """
+    def __init__(self, requests_per_second: float = None, max_retries: int = 5, backoff_seconds: float = 1.0, max_backoff_seconds: float = 60.0,
+                 connect_timeout_seconds: float = 10.0, read_timeout_seconds: float = 120.0, pool_maxsize: int = 16,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.session = create_http_session(pool_maxsize=pool_maxsize)
+        self.token_bucket = TokenBucket(requests_per_second=requests_per_second, clock=clock, sleep=sleep)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.timeout = (connect_timeout_seconds, read_timeout_seconds)
+        self.sleep = sleep
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Returns the backoff before retry number attempt + 1: half of the exponential backoff plus a random jitter
+        of up to the other half, so that threads failing together do not retry together.
+        """
+        backoff = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** attempt)
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+    def get(self, url: str, metrics=None) -> requests.Response:
+        """
+        Returns the response of a GET request to url once it has status code 200, retrying 429, 5xx, connection errors and timeouts.
+
+        Args:
+            url: provide a str with the URL of the request.
+            metrics: provide a PipelineMetrics to count retries in http_retries and throttled responses in http_throttled (None to skip).
+
+        Raises:
+            Exception when the response has a status code that is not retried (e.g. 400 or 403).
+            Exception when the request still fails after max_retries retries.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.token_bucket.acquire()
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                if attempt == self.max_retries:
+                    raise Exception(f"API request failed after {attempt + 1} attempts: {error}") from error
+                backoff = self.backoff(attempt)
+            else:
+                if response.status_code == 200:
+                    self.token_bucket.increase()
+                    return response
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    raise Exception(f"API request failed with status code {response.status_code}: {response.text[:200]}")
+                backoff = max(self.backoff(attempt), retry_after_seconds(response) or 0.0)
+                if response.status_code == 429:
+                    # Every thread holds back and the rate is halved, so the other fetchers do not trip the throttle too
+                    self.token_bucket.decrease()
+                    self.token_bucket.pause(backoff)
+                    backoff = 0.0
+                    if metrics is not None:
+                        metrics.increment("http_throttled")
+            if metrics is not None:
+                metrics.increment("http_retries")
+            self.sleep(backoff)
+
+_api_client = None
+_api_client_lock = threading.Lock()
+
+def get_api_client() -> ApiClient:
+    """
+    Returns the ApiClient shared by all API calls, creating one with the default settings on first use.
+    """
+    global _api_client
+    with _api_client_lock:
+        if _api_client is None:
+            _api_client = ApiClient()
+        return _api_client
+
+def set_api_client(api_client: ApiClient) -> None:
+    """
+    Replaces the ApiClient shared by all API calls, e.g. with the settings of the pipeline YAML file.
+    """
+    global _api_client
+    with _api_client_lock:
+        _api_client = api_client
+
+def get_max_update_time_crime_api(APP_TOKEN:str) -> str:
+    """
+    Retrieves the maximum value of the :updated_at field in the Chicago crimes dataset.
+
+    Usage example:
+        get_max_update_time_crime_api(APP_TOKEN="abc123")
+
+    Returns:
+        A str object with the date written in 'yyyy-mm-ddThh:mm:ss.sssZ' format. 
+
+    Args:
+        APP_TOKEN: provide a str with generated App Token credentials.
+
+    Raises:
+        Exception if the API does not respond with status code 200 (after the retries of ApiClient.get).
+    """
+    response = get_api_client().get(f"{CRIME_API_URL}?"
+                                    f"$$app_token={APP_TOKEN}"
+                                    f"&$select=max(:updated_at)")
+    return response.json()[0].get('max_updated_at')
@@ -0,0 +1,254 @@
+"""
+Command line entry point for one-shot runs of the pipeline, e.g. as an ECS scheduled task instead of a long-lived container.
+
+Usage example:
+    python -m etl_project.cli once           # backfill or incremental run, skipped when nothing changed
+    python -m etl_project.cli backfill       # run only if the crime table is missing or a backfill did not finish
+    python -m etl_project.cli incremental    # incremental run, fails if a backfill is needed first
+    python -m etl_project.cli refresh-views  # deploy changed views and refresh the materialized views
+    python -m etl_project.cli bench pipeline --rows 10000   # or bench load / bench cold-start
+
+etl_project.pipeline (pandas, SQLAlchemy, pyarrow, schedule) is only imported once there is work to do.
+Before that, get_pending_work checks for new API updates and pending maintenance with etl_project.api_client (requests) and pg8000 only,
+so a run without updates finishes in a fraction of the import time of the pipeline.
+"""
+from dotenv import load_dotenv
+from etl_project.partitions import add_months, month_partition_suffix
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import yaml
+
+DEFAULT_CONFIG_PATH = str(Path(__file__).with_name("pipeline.yaml"))
+BENCHMARKS = {
+    "pipeline": "etl_project_benchmarks.bench_pipeline",
+    "load": "etl_project_benchmarks.bench_load",
+    "cold-start": "etl_project_benchmarks.bench_cold_start",
+}
+
+def create_cli_logger(pipeline_name:str) -> logging.Logger:
+    """
+    Returns a console logger with the format of PipelineLogging, for the messages of the CLI itself.
+    """
+    logger = logging.getLogger(f"{pipeline_name} CLI")
+    if not logger.handlers:
+        logger.setLevel(logging.INFO)
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+        logger.addHandler(stream_handler)
+        logger.propagate = False
+    return logger
+
+def connect_postgres():
+    """
+    Returns a pg8000.native connection (autocommit, UTC time zone) to the database given by the pipeline's environment variables.
+    """
+    import pg8000.native
+    connection = pg8000.native.Connection(
+        user=os.environ.get("DB_USERNAME"),
+        password=os.environ.get("DB_PASSWORD") or None,
+        host=os.environ.get("SERVER_NAME"),
+        port=int(os.environ.get("PORT") or 5432),
+        database=os.environ.get("DATABASE_NAME"))
+    connection.run("set time zone 'UTC'")
+    return connection
+
+def _query_scalar(connection, query:str, **params):
+    return connection.run(query, **params)[0][0]
+
+def get_pending_work(pipeline_config:dict, connection, APP_TOKEN:str, today:datetime=None) -> dict:
+    """
+    Checks, without importing etl_project.pipeline, whether a run of the pipeline would do anything.
+
+    Usage example:
+        get_pending_work(pipeline_config=pipeline_config, connection=connect_postgres(), APP_TOKEN="abc123")
+
+    Returns:
+        A dict with the next run_id and the reasons a run is needed (an empty list when a run would only find no new updates):
+        ```
+            {'run_id': 42, 'backfill': False, 'reasons': ['new API updates']}
+        ```
+        backfill is True when the crime table does not exist, a backfill did not finish, or the crime table is empty without checkpoints.
+
+    Args:
+        pipeline_config: provide a dict with the contents of the pipeline YAML file.
+        connection: provide the pg8000.native connection returned by connect_postgres.
+        APP_TOKEN: provide a str with generated App Token credentials.
+        today: provide a datetime to check partitions and retention against (defaults to now).
+    """
+    config = pipeline_config.get("config")
+    crime_table_name = config.get("crime_table_name", "crime_data")
+    checkpoint_table_name = config.get("checkpoint_table_name", "backfill_checkpoints")
+    logs_table_name = config.get("logs_table_name", "logs")
+    today = today or datetime.now(timezone.utc)
+
+    run_id = 1
+    if _query_scalar(connection, "select to_regclass(:name) is not null", name=logs_table_name):
+        run_id = (_query_scalar(connection, f"select max(run_id) from {logs_table_name}") or 0) + 1
+    pending_work = {"run_id": run_id, "backfill": False, "reasons": []}
+
+    if not _query_scalar(connection, "select to_regclass(:name) is not null", name=crime_table_name):
+        pending_work.update(backfill=True, reasons=[f"table {crime_table_name} does not exist"])
+        return pending_work
+    checkpoint_count, pending_count = 0, 0
+    if _query_scalar(connection, "select to_regclass(:name) is not null", name=checkpoint_table_name):
+        checkpoint_count, pending_count = connection.run(
+            f"select count(*), count(*) filter (where status <> 'complete') from {checkpoint_table_name}")[0]
+    if pending_count:
+        pending_work.update(backfill=True, reasons=["backfill did not finish"])
+        return pending_work
+    max_table = _query_scalar(connection, f"select max(updated_at) from {crime_table_name}")
+    if max_table is None and not checkpoint_count:
+        pending_work.update(backfill=True, reasons=[f"table {crime_table_name} is empty and has no backfill checkpoints"])
+        return pending_work
+
+    if not _query_scalar(connection, "select to_regclass(:name) is not null", name=config.get("rollup_table_name", "crime_daily_rollup")):
+        pending_work["reasons"].append("rollup table does not exist")
+
+    # Partitions ahead and retention, checked against the names of the monthly partitions
+    partitions = set(row[0] for row in connection.run(
+        "select child.relname from pg_inherits "
+        "join pg_class parent on parent.oid = pg_inherits.inhparent "
+        "join pg_class child on child.oid = pg_inherits.inhrelid "
+        "where parent.relname = :table_name", table_name=crime_table_name))
+    if not partitions:
+        pending_work["reasons"].append(f"table {crime_table_name} is not partitioned")
+    elif f"{crime_table_name}_{month_partition_suffix(add_months(month_start=today, months=config.get('partition_months_ahead', 1)))}" not in partitions:
+        pending_work["reasons"].append("crime partitions ahead are missing")
+    retention_months = config.get("partition_retention_months")
+    if retention_months is not None:
+        retention_suffix = month_partition_suffix(add_months(month_start=today, months=-retention_months))
+        monthly_partitions = [partition[len(crime_table_name) + 1:] for partition in partitions if partition != f"{crime_table_name}_default"]
+        if any(suffix < retention_suffix for suffix in monthly_partitions):
+            pending_work["reasons"].append("crime partitions expired")
+
+    reconcile_action = config.get("reconcile_action")
+    if reconcile_action and run_id % config.get("reconcile_every_runs", 1) == 0:
+        pending_work["reasons"].append("reconciliation is due")
+
+    from etl_project.api_client import get_max_update_time_crime_api
+    max_api = datetime.strptime(get_max_update_time_crime_api(APP_TOKEN=APP_TOKEN), '%Y-%m-%dT%H:%M:%S.%fZ')
+    if max_table is None or max_api > max_table.astimezone(timezone.utc).replace(tzinfo=None):
+        pending_work["reasons"].append("new API updates")
+    return pending_work
+
+def record_skipped_run(pipeline_config:dict, connection, run_id:int, logs:str) -> None:
+    """
+    Records a run that found nothing to do in the logs table, with status 'skipped', so run_id keeps counting runs.
+    """
+    connection.run(
+        f"insert into {pipeline_config['config'].get('logs_table_name', 'logs')} (run_id, status, pipeline_name, timestamp, config, logs) "
+        f"values (:run_id, 'skipped', :pipeline_name, :timestamp, cast(:config as json), :logs)",
+        run_id=run_id,
+        pipeline_name=pipeline_config.get("name"),
+        timestamp=datetime.now(timezone.utc),
+        config=json.dumps(pipeline_config.get("config")),
+        logs=logs)
+
+def run_pipeline_once(pipeline_config:dict) -> str:
+    """
+    Imports etl_project.pipeline and runs it once. Returns the status recorded in the logs table ('success' or 'fail').
+    """
+    from etl_project import pipeline
+    pipeline.run_pipeline_schedule(pipeline_config=pipeline_config)
+    connection = connect_postgres()
+    try:
+        return _query_scalar(connection, f"select status from {pipeline_config['config'].get('logs_table_name', 'logs')} order by run_id desc, timestamp desc limit 1")
+    finally:
+        connection.close()
+
+def run_command(command:str, pipeline_config:dict, logger:logging.Logger, force:bool=False) -> int:
+    """
+    Runs the once, backfill or incremental command. Returns the exit code of the process (0 on success).
+    """
+    APP_TOKEN = os.environ.get("APP_TOKEN")
+    check_start_time = time.perf_counter()
+    connection = connect_postgres()
+    try:
+        pending_work = get_pending_work(pipeline_config=pipeline_config, connection=connection, APP_TOKEN=APP_TOKEN)
+        check_seconds = time.perf_counter() - check_start_time
+        logger.info(f"Checked for pending work in {check_seconds:.3f} seconds: {', '.join(pending_work['reasons']) or 'none'}")
+
+        if command == "backfill" and not pending_work["backfill"]:
+            logger.info("Crime table is backfilled - Nothing to backfill")
+            return 0
+        if command == "incremental" and pending_work["backfill"]:
+            logger.error("Crime table needs a backfill - Run the backfill command first")
+            return 1
+        if not pending_work["reasons"] and not force:
+            message = "No new records to upsert - Skipping run"
+            logger.info(message)
+            record_skipped_run(pipeline_config=pipeline_config, connection=connection, run_id=pending_work["run_id"], logs=message)
+            return 0
+    finally:
+        connection.close()
+
+    status = run_pipeline_once(pipeline_config=pipeline_config)
+    return 0 if status == "success" else 1
+
+def refresh_views(pipeline_config:dict, logger:logging.Logger) -> int:
+    """
+    Deploys the views whose SQL changed and refreshes the materialized views that were not just created.
+    """
+    from etl_project import pipeline
+    config = pipeline_config.get("config")
+    materialized_views = config.get("materialized_views") or {}
+    engine = pipeline.create_postgres_connection(
+        username=os.environ.get("DB_USERNAME"),
+        password=os.environ.get("DB_PASSWORD"),
+        host=os.environ.get("SERVER_NAME"),
+        port=os.environ.get("PORT"),
+        database=os.environ.get("DATABASE_NAME"))
+    try:
+        created_views = pipeline.deploy_sql_views(
+            sql_folder_path=config.get("sql_folder_path"),
+            engine=engine,
+            logger=logger,
+            materialized_views=materialized_views)
+        pipeline.refresh_materialized_views(
+            materialized_views=[view for view in materialized_views if view not in created_views],
+            engine=engine,
+            logger=logger)
+    finally:
+        engine.dispose()
+    return 0
+
+def main(argv:list[str]=None) -> int:
+    """
+    Parses the command line and runs the command. Returns the exit code of the process.
+    """
+    parser = argparse.ArgumentParser(prog="python -m etl_project.cli", description="Run the Chicago crime pipeline once.")
+    parser.add_argument("--config", default=DEFAULT_CONFIG_PATH, help="pipeline YAML file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command, help_text in [
+        ("once", "backfill or incremental run, skipped when there is nothing to do"),
+        ("backfill", "run only if the crime table is missing or a backfill did not finish"),
+        ("incremental", "incremental run, fails if a backfill is needed first")]:
+        subparser = subparsers.add_parser(command, help=help_text)
+        subparser.add_argument("--force", action="store_true", help="run the pipeline even when there are no new updates")
+    subparsers.add_parser("refresh-views", help="deploy changed views and refresh the materialized views")
+    bench_parser = subparsers.add_parser("bench", help="run one of the benchmarks in etl_project_benchmarks")
+    bench_parser.add_argument("benchmark", choices=list(BENCHMARKS))
+    bench_parser.add_argument("benchmark_args", nargs=argparse.REMAINDER, help="arguments of the benchmark, e.g. --rows 10000")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    if args.command == "bench":
+        import importlib
+        importlib.import_module(BENCHMARKS[args.benchmark]).main(args.benchmark_args)
+        return 0
+
+    with open(args.config) as yaml_file:
+        pipeline_config = yaml.safe_load(yaml_file)
+    logger = create_cli_logger(pipeline_name=pipeline_config.get("name"))
+    if args.command == "refresh-views":
+        return refresh_views(pipeline_config=pipeline_config, logger=logger)
+    return run_command(command=args.command, pipeline_config=pipeline_config, logger=logger, force=args.force)
+
+if __name__ == "__main__":
+    sys.exit(main())
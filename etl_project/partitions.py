@@ -0,0 +1,22 @@
+"""
+Month arithmetic of the monthly partitions of the crime table, shared by etl_project.pipeline and the one-shot CLI.
+
+Only imports datetime, so that etl_project.cli stays light.
+
+Usage example:
+    month_partition_suffix(add_months(month_start=datetime(2024, 1, 20), months=-13)) # 'p2022_12'
+"""
+from datetime import datetime
+
+def add_months(month_start:datetime, months:int) -> datetime:
+    """
+    Returns the first day of the month months after (or before, when negative) the month of month_start.
+    """
+    month_index = month_start.year * 12 + month_start.month - 1 + months
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
+def month_partition_suffix(month_start:datetime) -> str:
+    """
+    Returns the name suffix of the partition of the crime table holding the month of month_start, e.g. 'p2024_01'.
+    """
+    return month_start.strftime('p%Y_%m')
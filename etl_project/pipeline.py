@@ -1,21 +1,51 @@
-import requests
+from etl_project import api_client
+from etl_project.api_client import ApiClient, get_api_client, set_api_client, get_max_update_time_crime_api
+from etl_project.partitions import add_months, month_partition_suffix
 import pandas as pd
+import numpy as np
 from dotenv import load_dotenv
 import os
-from sqlalchemy import create_engine, Table, Column, String, Integer, Float, JSON, DateTime, Date, MetaData, inspect
+from sqlalchemy import create_engine, event, text, select, func, tuple_, Table, Column, String, Integer, Float, Boolean, JSON, DateTime, Date, MetaData, inspect, literal, literal_column
 from sqlalchemy.engine import URL
 from sqlalchemy.dialects import postgresql
 from sqlalchemy.engine.base import Engine
+from sqlalchemy.sql.expression import Select
 from datetime import datetime, timedelta, timezone
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 import schedule
 import time
 import logging
+import threading
+import multiprocessing
 import yaml
+import json
+import hashlib
+import shutil
+import uuid
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pathlib import Path
+from contextlib import contextmanager
+from collections import deque
+from typing import Callable, Iterator, Union
+import signal
+import re
+
+class _LogBufferHandler(logging.Handler):
+    """
+    Keeps the last max_lines formatted log records in memory.
+    """
+    def __init__(self, max_lines: int):
+        super().__init__()
+        self.lines = deque(maxlen=max_lines)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.lines.append(self.format(record))
 
 class PipelineLogging:
     """
     Creates logging object with specific format and file name to log pipeline run. 
+    The last max_buffer_lines log lines are also kept in memory for get_logs.
 
     Usage example:
         PipelineLogging(pipeline_name="Chicago Crime ETL", log_folder_path="./logs")
@@ -23,8 +53,9 @@ class PipelineLogging:
     Args:
         pipeline_name: provide a str indicating preferred name for pipeline.
         log_folder_path: provide a str indicating the path of the folder to which log files will be written.
+        max_buffer_lines: provide an int for the number of log lines kept in memory for get_logs.
     """
-    def __init__(self, pipeline_name: str, log_folder_path: str):
+    def __init__(self, pipeline_name: str, log_folder_path: str, max_buffer_lines: int = 10000):
         self.pipeline_name = pipeline_name
         self.log_folder_path = log_folder_path
         logger = logging.getLogger(pipeline_name)
@@ -36,21 +67,162 @@ class PipelineLogging:
         file_handler.setLevel(logging.INFO)
         stream_handler = logging.StreamHandler()
         stream_handler.setLevel(logging.INFO)
+        buffer_handler = _LogBufferHandler(max_lines=max_buffer_lines)
+        buffer_handler.setLevel(logging.INFO)
         formatter = logging.Formatter(
             "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
         )
         file_handler.setFormatter(formatter)
         stream_handler.setFormatter(formatter)
+        buffer_handler.setFormatter(formatter)
         logger.addHandler(file_handler)
         logger.addHandler(stream_handler)
+        logger.addHandler(buffer_handler)
         self.logger = logger
+        self.handlers = [file_handler, stream_handler, buffer_handler]
+        self.buffer_handler = buffer_handler
 
     def get_logs(self) -> str:
         """
-        Returns contents of log file as str object.
+        Returns the log lines kept in memory (since the last clear_logs) as str object.
+        """
+        return "".join(f"{line}\n" for line in self.buffer_handler.lines)
+
+    def clear_logs(self) -> None:
+        """
+        Empties the log lines kept in memory, e.g. at the start of a run.
+        """
+        self.buffer_handler.lines.clear()
+
+    def close(self) -> None:
+        """
+        Removes and closes the handlers added to the logger.
+        """
+        for handler in self.handlers:
+            self.logger.removeHandler(handler)
+            handler.close()
+
+class PipelineMetrics:
+    """
+    Collects thread-safe counters, stage timers and HTTP request latencies for one pipeline run. 
+    Each window gets a child created with window(), whose values are also added to the run totals.
+
+    Usage example:
+        metrics = PipelineMetrics()
+        window_metrics = metrics.window(start_time="2023-11-14T00:00:00.000")
+        with window_metrics.timer("transform"):
+            crime_df = transform_crime_data(df=crime_df)
+        window_metrics.increment("rows_transformed", len(crime_df))
+        metrics.summary()
+
+    Args:
+        parent: provide the PipelineMetrics of the run for a window's metrics (None for the run itself).
+    """
+    def __init__(self, parent: "PipelineMetrics" = None):
+        self.parent = parent
+        self.counters = {}
+        self.http_request_seconds = []
+        self.windows = {}
+        self._lock = threading.Lock()
+
+    def _record(self, counters: dict[str, float], http_request_seconds: float = None) -> None:
+        with self._lock:
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            if http_request_seconds is not None:
+                self.http_request_seconds.append(http_request_seconds)
+        if self.parent is not None:
+            self.parent._record(counters=counters, http_request_seconds=http_request_seconds)
+
+    def increment(self, name: str, value: float = 1) -> None:
+        """
+        Adds value to the counter name.
+        """
+        self._record(counters={name: value})
+
+    def set(self, name: str, value: float) -> None:
+        """
+        Sets the value of name for this run or window only (not added to the parent).
+        """
+        with self._lock:
+            self.counters[name] = value
+
+    def observe_http_request(self, seconds: float, num_bytes: int) -> None:
+        """
+        Records one API request with its latency and the bytes received (as sent over the wire, i.e. compressed).
+        """
+        self._record(counters={"http_requests": 1, "http_bytes": num_bytes}, http_request_seconds=seconds)
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        """
+        Adds the wall time of the with block to the counter <stage>_seconds.
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.increment(f"{stage}_seconds", time.perf_counter() - start_time)
+
+    def window(self, start_time: str) -> "PipelineMetrics":
+        """
+        Returns the metrics of the window starting at start_time.
+        """
+        window_metrics = PipelineMetrics(parent=self)
+        with self._lock:
+            self.windows[start_time] = window_metrics
+        return window_metrics
+
+    def summary(self) -> dict[str, float]:
         """
-        with open(self.file_path, "r") as file:
-            return "".join(file.readlines())
+        Returns the counters with the p50, p95, p99 and max HTTP request latency.
+        """
+        with self._lock:
+            summary = dict(self.counters)
+            http_request_seconds = list(self.http_request_seconds)
+        if http_request_seconds:
+            quantiles = pd.Series(http_request_seconds).quantile([0.5, 0.95, 0.99])
+            summary["http_request_seconds_p50"] = quantiles[0.5]
+            summary["http_request_seconds_p95"] = quantiles[0.95]
+            summary["http_request_seconds_p99"] = quantiles[0.99]
+            summary["http_request_seconds_max"] = max(http_request_seconds)
+        return summary
+
+    def to_records(self, run_id: int) -> list[dict]:
+        """
+        Returns a list[dict] object to be used as data argument in load_data_to_postgres for the run metrics table, 
+        one record per metric with scope 'run' for the run totals and the start time of the window for each window.
+        """
+        timestamp = datetime.now(timezone.utc)
+        scopes = [("run", self)] + sorted(self.windows.items())
+        return [
+            {"run_id": run_id, "scope": scope, "metric_name": name, "value": float(value), "timestamp": timestamp}
+            for scope, metrics in scopes
+            for name, value in metrics.summary().items()
+        ]
+
+def write_prometheus_textfile(file_path: str, pipeline_name: str, metrics: dict[str, float]) -> None:
+    """
+    Writes the run metrics as gauges in the Prometheus text format, for the textfile collector of node_exporter. 
+    The file is written next to file_path and renamed, so the collector never reads a partial file.
+
+    Usage example:
+        write_prometheus_textfile(file_path="/var/lib/node_exporter/chicago_crime_etl.prom", pipeline_name="Chicago Crime ETL", metrics=metrics.summary())
+
+    Args:
+        file_path: provide a str with the path of the .prom file.
+        pipeline_name: provide a str with the name of the pipeline, used as the pipeline label.
+        metrics: provide a dict of metric values, as returned by PipelineMetrics.summary.
+    """
+    lines = []
+    for name, value in sorted(metrics.items()):
+        metric_name = "etl_pipeline_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+        lines.append(f"# TYPE {metric_name} gauge")
+        lines.append(f'{metric_name}{{pipeline="{pipeline_name}"}} {float(value)}')
+    temp_file_path = f"{file_path}.tmp"
+    with open(temp_file_path, "w") as prom_file:
+        prom_file.write("\n".join(lines) + "\n")
+    os.replace(temp_file_path, file_path)
 
 def _generate_date_ranges(start_date:str, end_date:str, days_delta:int) -> list[dict[str, str]]:
     """
@@ -93,6 +265,61 @@ def _generate_date_ranges(start_date:str, end_date:str, days_delta:int) -> list[
 
     return date_ranges
 
+def _generate_count_aware_date_ranges(start_date:str, end_date:str, daily_counts:dict[str, int], window_target_rows:int) -> list[dict[str, str]]:
+    """
+    Generates a list of date ranges that each hold about window_target_rows records, by packing consecutive days 
+    until the next day would push the window over the target. A day with more than window_target_rows records 
+    gets a window of its own, since a day is the smallest window.
+
+    Usage example:
+        _generate_count_aware_date_ranges(
+            start_date="2023-10-01T00:00:00.000", 
+            end_date="2023-10-04T23:59:59.999", 
+            daily_counts={"2023-10-01": 300, "2023-10-02": 500, "2023-10-03": 900, "2023-10-04": 100}, 
+            window_target_rows=1000)
+
+    Returns:
+        A list of dictionaries in the format of _generate_date_ranges:
+        ```
+            [
+                {'start_time': '2023-10-01T00:00:00.000', 'end_time': '2023-10-02T23:59:59.999'},
+                {'start_time': '2023-10-03T00:00:00.000', 'end_time': '2023-10-04T23:59:59.999'}
+            ]
+        ```
+
+    Args:
+        start_date: provide a str with the format "yyyy-mm-ddThh:mm:ss.sss".
+        end_date: provide a str with the format "yyyy-mm-ddThh:mm:ss.sss".
+        daily_counts: provide a dict of record counts keyed by day ("yyyy-mm-dd"), as returned by get_daily_counts_crime_api. Missing days count as 0.
+        window_target_rows: provide an int for the number of records each window should aim for.
+    """
+    date_ranges = []
+    raw_start_time = datetime.strptime(start_date, '%Y-%m-%dT%H:%M:%S.%f')
+    raw_end_time = datetime.strptime(end_date, '%Y-%m-%dT%H:%M:%S.%f')
+
+    window_start_time = raw_start_time
+    window_rows = 0
+    day = raw_start_time.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day <= raw_end_time:
+        day_rows = daily_counts.get(day.strftime('%Y-%m-%d'), 0)
+        if window_rows > 0 and window_rows + day_rows > window_target_rows:
+            date_ranges.append({
+                'start_time': window_start_time.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3],
+                'end_time': (day - timedelta(milliseconds=1)).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] # ensures end_time does not overlap with next start_time
+            })
+            window_start_time = day
+            window_rows = 0
+        window_rows += day_rows
+        day += timedelta(days=1)
+
+    if window_start_time <= raw_end_time: # an end_date at midnight still gets the window of its day
+        date_ranges.append({
+            'start_time': window_start_time.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3],
+            'end_time': raw_end_time.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
+        })
+
+    return date_ranges
+
 def get_min_date_crime_api(APP_TOKEN:str) -> str:
     """
     Retrieves the minimum value of the date_of_occurence field in the Chicago crimes dataset.
@@ -106,9 +333,9 @@ def get_min_date_crime_api(APP_TOKEN:str) -> str:
     Args:
         APP_TOKEN: provide a str with generated App Token credentials.
     """
-    response = requests.get(f"https://data.cityofchicago.org/resource/x2n5-8w5q.json?"
-                            f"$$app_token={APP_TOKEN}"
-                            f"&$select=min(date_of_occurrence)")
+    response = get_api_client().get(f"{api_client.CRIME_API_URL}?"
+                                    f"$$app_token={APP_TOKEN}"
+                                    f"&$select=min(date_of_occurrence)")
     return response.json()[0].get('min_date_of_occurrence')
 
 def get_max_date_crime_api(APP_TOKEN:str) -> str:
@@ -124,37 +351,201 @@ def get_max_date_crime_api(APP_TOKEN:str) -> str:
     Args:
         APP_TOKEN: provide a str with generated App Token credentials.
     """
-    response = requests.get(f"https://data.cityofchicago.org/resource/x2n5-8w5q.json?"
-                            f"$$app_token={APP_TOKEN}"
-                            f"&$select=max(date_of_occurrence)")
+    response = get_api_client().get(f"{api_client.CRIME_API_URL}?"
+                                    f"$$app_token={APP_TOKEN}"
+                                    f"&$select=max(date_of_occurrence)")
     return response.json()[0].get('max_date_of_occurrence')
 
-def get_max_update_time_crime_api(APP_TOKEN:str) -> str:
+def get_daily_counts_crime_api(APP_TOKEN:str) -> dict[str, int]:
     """
-    Retrieves the maximum value of the :updated_at field in the Chicago crimes dataset.
+    Retrieves the number of records per day of date_of_occurrence in the Chicago crimes dataset, with one grouped query.
 
     Usage example:
-        get_max_update_time_crime_data(APP_TOKEN="abc123")
+        get_daily_counts_crime_api(APP_TOKEN="abc123")
 
     Returns:
-        A str object with the date written in 'yyyy-mm-ddThh:mm:ss.sssZ' format. 
+        A dict of record counts keyed by day in 'yyyy-mm-dd' format, e.g. {'2023-01-01': 812, '2023-01-02': 640}. 
+        Days without records are left out.
 
     Args:
         APP_TOKEN: provide a str with generated App Token credentials.
+
+    Raises:
+        Exception if the API does not respond with status code 200 (after the retries of ApiClient.get).
     """
-    response = requests.get(f"https://data.cityofchicago.org/resource/x2n5-8w5q.json?"
-                            f"$$app_token={APP_TOKEN}"
-                            f"&$select=max(:updated_at)")
-    return response.json()[0].get('max_updated_at')
+    response = get_api_client().get(f"{api_client.CRIME_API_URL}?"
+                                    f"$$app_token={APP_TOKEN}"
+                                    f"&$select=date_trunc_ymd(date_of_occurrence) as day, count(*) as row_count"
+                                    f"&$group=day"
+                                    f"&$order=day"
+                                    f"&$limit=50000") # one row per day, far more days than the dataset spans
+    return {record["day"][:10]: int(record["row_count"]) for record in response.json()}
 
 def get_max_update_time_crime_table(crime_table_name:str, engine:Engine) -> datetime:
     """
     Returns maximum of value of the updated_at field from the Chicago crimes table in datetime format (UTC-adjusted).
+    Returns None when the crime table is empty.
     """
     select_max_update_query = f"select max(updated_at) from {crime_table_name}"
     max_update = [dict(row) for row in engine.execute(select_max_update_query).all()][0].get("max")
+    if max_update is None:
+        return None
     return max_update.astimezone(timezone.utc).replace(tzinfo=None)
 
+def extract_crime_api_pages(APP_TOKEN:str, column_name:str, start_time:str, end_time:str, limit:int, metrics:PipelineMetrics=None, decode_executor:Executor=None) -> Iterator[pd.DataFrame]:
+    """
+    Extracts Chicago crimes data from API endpoint for a given date range, yielding one pd.DataFrame per API page 
+    so that only a single page (at most limit records) is held in memory at a time.
+
+    Usage example:
+        for page_df in extract_crime_api_pages(
+            APP_TOKEN="abc123",
+            column_name=":updated_at", 
+            start_time="2023-11-14T00:00:00.000", 
+            end_time="2023-11-19T23:59:59.999", 
+            limit=1000
+        ):
+            ...
+
+    Returns:
+        An iterator of pd.DataFrame objects with the columns of CRIME_COLUMNS, decoded by decode_crime_page.
+
+    Args:
+        APP_TOKEN: provide a str with generated App Token credentials.
+        column_name: provide a str ('date_of_occurrence' or ':updated_at') of needed column to filter data.
+        start_time: provide a str with the format "yyyy-mm-ddThh:mm:ss.SSS".
+        end_time: provide a str with the format "yyyy-mm-ddThh:mm:ss.SSS".
+        limit: provide an int for maximum records retrieved per each API call.
+        metrics: provide a PipelineMetrics to record the latency and bytes of each API request and the decode time of each page (None to skip).
+        decode_executor: provide a ProcessPoolExecutor to decode each page in another process while the next page is fetched (None to decode in this thread).
+
+    Raises:
+        Exception when HTTP response code is not 200 (after the retries of ApiClient.get).
+        Exception when the last :id of a page does not advance past the previous page (stuck in while loop).
+    """
+    contents = _extract_api_pages(
+        APP_TOKEN=APP_TOKEN, 
+        soql_date=f"{column_name} between '{start_time}' and '{end_time}'", 
+        limit=limit, 
+        select=CRIME_API_SELECT, # only the fields of the crime table, including metadata fields (:id, :version, ...)
+        metrics=metrics
+    )
+    if decode_executor is None:
+        decoded_pages = (_timed_decode_crime_page(content) for content in contents)
+    else:
+        decoded_pages = _decode_ahead(contents=contents, decode_executor=decode_executor)
+
+    for page_df, decode_seconds, num_bytes in decoded_pages:
+        if metrics is not None:
+            metrics.increment("pages_decoded")
+            metrics.increment("decode_seconds", decode_seconds)
+            metrics.increment("decode_bytes", num_bytes)
+        yield page_df
+
+def _decode_ahead(contents:Iterator[bytes], decode_executor:Executor) -> Iterator[tuple[pd.DataFrame, float, int]]:
+    """
+    Yields the decoded pages of contents in order, submitting each page to decode_executor as soon as it is fetched 
+    so that the decode of a page overlaps with the request of the next one.
+    """
+    futures = deque()
+    for content in contents:
+        futures.append(decode_executor.submit(_timed_decode_crime_page, content))
+        if len(futures) > 1:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
+# :id of each record of a raw API page. Quotes inside JSON strings are escaped, so only keys match.
+API_ID_PATTERN = re.compile(rb'":id"\s*:\s*"([^"]*)"')
+
+def _extract_api_pages(APP_TOKEN:str, soql_date:str, limit:int, select:str, metrics:PipelineMetrics=None) -> Iterator[bytes]:
+    """
+    Yields the raw JSON bytes of every API page matching soql_date, with the fields in select (which must include :id). 
+    See extract_crime_api_pages.
+    """
+    # Pages are walked by keyset (:id > last :id seen) instead of $offset, so every page is an index seek 
+    # on the API side and page latency stays flat on large windows.
+    # The record count and last :id of a page are read from the raw bytes, so pages can be decoded elsewhere (see decode_crime_page).
+    client = get_api_client()
+    last_id = None
+
+    while True:
+        soql_where = soql_date if last_id is None else f"{soql_date} and :id > '{last_id}'"
+        request_start_time = time.perf_counter()
+        response = client.get(f"{api_client.CRIME_API_URL}?"
+                                  f"$$app_token={APP_TOKEN}"
+                                  f"&$order=:id"  
+                                  f"&$where={soql_where}"
+                                  f"&$limit={limit}"
+                                  f"&$select={select}", 
+                                  metrics=metrics)
+        content = response.content
+        if metrics is not None:
+            metrics.observe_http_request(seconds=time.perf_counter() - request_start_time, num_bytes=response.raw.tell())
+
+        page_ids = API_ID_PATTERN.findall(content)
+        if page_ids:
+            yield content
+
+        if len(page_ids) < limit:
+            break
+
+        # Only progress is checked: the order of :id on the API side is not guaranteed to match Python string order
+        page_last_id = page_ids[-1].decode()
+        if page_last_id == last_id:
+            raise Exception(f"API paging did not advance past :id {last_id}")
+        last_id = page_last_id
+
+def decode_crime_page(content:bytes) -> pd.DataFrame:
+    """
+    Decodes the raw JSON bytes of an API page straight into a pd.DataFrame with the columns of CRIME_COLUMNS, 
+    each built from its API field of CRIME_API_FIELDS and parsed with CRIME_COLUMN_PARSERS, null where a record has no value. 
+    Fields that are not in CRIME_API_FIELDS are ignored.
+
+    Usage example:
+        page_df = decode_crime_page(content=response.content)
+    """
+    records = json.loads(content)
+    page_df = pd.DataFrame({column: [record.get(field) for record in records] for field, column in CRIME_API_FIELDS.items()})
+    return page_df.assign(**{column: parser(page_df[column]) for column, parser in CRIME_COLUMN_PARSERS.items()})
+
+def _timed_decode_crime_page(content:bytes) -> tuple[pd.DataFrame, float, int]:
+    """
+    Returns the decode_crime_page of content with the seconds it took and the size of content (also run in decode worker processes).
+    """
+    start_time = time.perf_counter()
+    page_df = decode_crime_page(content=content)
+    return page_df, time.perf_counter() - start_time, len(content)
+
+def extract_crime_api_ids(APP_TOKEN:str, start_time:str, end_time:str, limit:int, metrics:PipelineMetrics=None) -> Iterator[list[tuple[str, str]]]:
+    """
+    Extracts only the :id and :version of the Chicago crimes records with date_of_occurrence in a date range, 
+    yielding one list of (:id, :version) tuples per API page. A page of ids is a small fraction of the bytes of full records, 
+    so limit can be much larger than for extract_crime_api_pages.
+
+    Usage example:
+        for ids in extract_crime_api_ids(APP_TOKEN="abc123", start_time="2023-01-01T00:00:00.000", end_time="2023-12-31T23:59:59.999", limit=50000):
+            ...
+
+    Args:
+        APP_TOKEN: provide a str with generated App Token credentials.
+        start_time: provide a str with the format "yyyy-mm-ddThh:mm:ss.SSS".
+        end_time: provide a str with the format "yyyy-mm-ddThh:mm:ss.SSS".
+        limit: provide an int for maximum ids retrieved per each API call.
+        metrics: provide a PipelineMetrics to record the latency and bytes of each API request (None to skip).
+
+    Raises:
+        Exception when HTTP response code is not 200 (after the retries of ApiClient.get).
+    """
+    for page in _extract_api_pages(
+        APP_TOKEN=APP_TOKEN, 
+        soql_date=f"date_of_occurrence between '{start_time}' and '{end_time}'", 
+        limit=limit, 
+        select=":id,:version", 
+        metrics=metrics
+    ):
+        yield [(record[":id"], record.get(":version")) for record in json.loads(page)]
+
 def extract_crime_api(APP_TOKEN:str, column_name:str, start_time:str, end_time:str, limit:int) -> pd.DataFrame:
     """
     Extracts Chicago crimes data from API endpoint for a given date range.
@@ -188,38 +579,257 @@ def extract_crime_api(APP_TOKEN:str, column_name:str, start_time:str, end_time:s
         limit: provide an int for maximum records retrieved per each API call.
 
     Raises:
-        Exception when HTTP response code is not 200.
-        Exception when paging over API endpoint for more than 1000 times (stuck in while loop). 
+        Exception when HTTP response code is not 200 (after the retries of ApiClient.get).
+        Exception when the last :id of a page does not advance past the previous page (stuck in while loop).
     """
-    soql_date = f"where={column_name} between '{start_time}' and '{end_time}'" 
-    response_data = []
-    i = 0
-    
-    while True:
-        offset = i * limit # if limit = 1000 -> offset = 0, 1000, 2000, etc.
-        response = requests.get(f"https://data.cityofchicago.org/resource/x2n5-8w5q.json?"
-                                f"$$app_token={APP_TOKEN}"
-                                f"&$order=:id"  
-                                f"&${soql_date}"
-                                f"&$limit={limit}"
-                                f"&$offset={offset}"
-                                f"&$select=:*,*") # include metadata field info
-
-        if not response.status_code==200:
-            raise Exception
-
-        if i >= 1000:
-            raise Exception
-
-        if response.json() == []:
-            break
+    pages = list(extract_crime_api_pages(
+        APP_TOKEN=APP_TOKEN,
+        column_name=column_name,
+        start_time=start_time,
+        end_time=end_time,
+        limit=limit
+    ))
+    if not pages:
+        return pd.DataFrame()
+
+    crime_df = pd.concat(pages, ignore_index=True)
+
+    return crime_df
 
-        response_data.extend(response.json())
-        i += 1
+class CrimePageCache:
+    """
+    On-disk cache of raw API pages (the pd.DataFrame objects yielded by extract_crime_api_pages) stored as Parquet files.
 
-    crime_df = pd.json_normalize(data=response_data)
+    Every window is cached in its own folder with one Parquet file per page. A folder is only used once the whole 
+    window has been downloaded (a _SUCCESS marker is written last), so a run that fails halfway never leaves a partial window behind. 
+    When the folders take more than max_bytes, the least recently used windows are deleted.
 
-    return crime_df
+    Usage example:
+        page_cache = CrimePageCache(cache_folder_path="etl_project/cache", max_bytes=2_000_000_000)
+        pages = page_cache.cached_pages(
+            pages=extract_crime_api_pages(APP_TOKEN="abc123", column_name="date_of_occurrence", start_time=start_time, end_time=end_time, limit=1000),
+            column_name="date_of_occurrence", 
+            start_time=start_time, 
+            end_time=end_time, 
+            max_updated_at="2024-01-10T10:02:11.508Z"
+        )
+
+    Args:
+        cache_folder_path: provide a str indicating the path of the folder to which pages will be written.
+        max_bytes: provide an int for the maximum size of the cache folder in bytes.
+        enabled: provide a bool, False bypasses the cache (pages are neither read from nor written to disk).
+    """
+    def __init__(self, cache_folder_path: str, max_bytes: int, enabled: bool = True):
+        self.cache_folder_path = Path(cache_folder_path)
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._in_use = set() # window folders being read or written, never evicted
+        if self.enabled:
+            self.cache_folder_path.mkdir(parents=True, exist_ok=True)
+            self.evict()
+
+    @staticmethod
+    def window_key(column_name: str, start_time: str, end_time: str, max_updated_at: str) -> str:
+        """
+        Returns the folder name of a window: a hash of the dataset, selected fields, filter column, window bounds and max :updated_at of the dataset.
+        """
+        key = "|".join([api_client.CRIME_API_URL, CRIME_API_SELECT, column_name, start_time, end_time, str(max_updated_at)])
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def cached_pages(self, pages: Iterator[pd.DataFrame], column_name: str, start_time: str, end_time: str, max_updated_at: str) -> Iterator[pd.DataFrame]:
+        """
+        Yields the pages of a window from disk if the window is cached, otherwise yields pages while writing them to the cache.
+        pages is only iterated (i.e. the API is only called) on a cache miss.
+        """
+        if not self.enabled:
+            yield from pages
+            return
+
+        key = self.window_key(column_name=column_name, start_time=start_time, end_time=end_time, max_updated_at=max_updated_at)
+        window_path = self.cache_folder_path / key
+        with self._lock:
+            hit = (window_path / "_SUCCESS").exists()
+            if hit:
+                os.utime(window_path / "_SUCCESS") # mark as recently used
+                self._in_use.add(key)
+
+        if hit:
+            try:
+                for page_path in sorted(window_path.glob("page-*.parquet")):
+                    yield pq.read_table(page_path).to_pandas()
+            finally:
+                with self._lock:
+                    self._in_use.discard(key)
+            return
+
+        temp_key = f"tmp-{key}-{uuid.uuid4().hex}"
+        temp_path = self.cache_folder_path / temp_key
+        with self._lock:
+            self._in_use.add(temp_key)
+        try:
+            temp_path.mkdir()
+            for page_number, page_df in enumerate(pages):
+                pq.write_table(pa.Table.from_pandas(page_df, preserve_index=False), temp_path / f"page-{page_number:06d}.parquet")
+                yield page_df
+            (temp_path / "_SUCCESS").touch()
+            with self._lock:
+                if window_path.exists():
+                    shutil.rmtree(temp_path) # written concurrently by another run
+                else:
+                    temp_path.rename(window_path)
+        finally:
+            with self._lock:
+                self._in_use.discard(temp_key)
+            shutil.rmtree(temp_path, ignore_errors=True)
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Deletes least recently used windows (and leftovers of failed downloads) until the cache folder is at most max_bytes.
+        """
+        with self._lock:
+            windows = []
+            for window_path in self.cache_folder_path.iterdir():
+                if window_path.name in self._in_use or not window_path.is_dir():
+                    continue
+                marker_path = window_path / "_SUCCESS"
+                if not marker_path.exists():
+                    shutil.rmtree(window_path, ignore_errors=True)
+                    continue
+                size = sum(file_path.stat().st_size for file_path in window_path.iterdir())
+                windows.append((marker_path.stat().st_mtime, size, window_path))
+
+            total_bytes = sum(size for _, size, _ in windows)
+            for _, size, window_path in sorted(windows):
+                if total_bytes <= self.max_bytes:
+                    break
+                shutil.rmtree(window_path, ignore_errors=True)
+                total_bytes -= size
+
+# Schema of the API pages: the API field of each crime column, from which the $select of extract_crime_api_pages is built, 
+# and the crime table column decode_crime_page names it. The :@computed_region_* fields and the nested location object are never requested.
+CRIME_API_FIELDS = {
+    ':id': 'crime_id', ':created_at': 'created_at', ':updated_at': 'updated_at', ':version': 'version', 'case_': 'case', 
+    'date_of_occurrence': 'date_of_occurrence', 'block': 'block', '_iucr': 'iucr', '_primary_decsription': 'primary_description', 
+    '_secondary_description': 'secondary_description', '_location_description': 'location_description', 'arrest': 'arrest', 
+    'domestic': 'domestic', 'beat': 'beat', 'ward': 'ward', 'fbi_cd': 'fbi_cd', 'x_coordinate': 'x_coordinate', 
+    'y_coordinate': 'y_coordinate', 'latitude': 'latitude', 'longitude': 'longitude',
+}
+# Columns of the crime table loaded from the API, in the order of CRIME_API_FIELDS
+CRIME_COLUMNS = list(CRIME_API_FIELDS.values())
+# Columns are named by decode_crime_page rather than by SoQL aliases, which would make keys such as :id longer on every record 
+# (and case is a SoQL keyword)
+CRIME_API_SELECT = ",".join(CRIME_API_FIELDS)
+# Vectorized parsers of the crime columns that are not text (nulls kept as NaT/<NA>/NaN). Parsing an already parsed column returns it unchanged.
+CRIME_COLUMN_PARSERS = {
+    'created_at': lambda values: pd.to_datetime(values, utc=True),
+    'updated_at': lambda values: pd.to_datetime(values, utc=True),
+    'date_of_occurrence': lambda values: pd.to_datetime(values, format='%Y-%m-%dT%H:%M:%S.%f'),
+    'beat': lambda values: pd.to_numeric(values).astype('Int64'),
+    'ward': lambda values: pd.to_numeric(values).astype('Int64'),
+    'x_coordinate': lambda values: pd.to_numeric(values).astype('Int64'),
+    'y_coordinate': lambda values: pd.to_numeric(values).astype('Int64'),
+    'latitude': lambda values: pd.to_numeric(values).astype('float64'),
+    'longitude': lambda values: pd.to_numeric(values).astype('float64'),
+}
+
+DISTRICT_STATION_PATTERN = r'^\d+$' # district of the district police stations, the only candidates of nearest_station (not Headquarters)
+GRID_CELL_FEET = 1000 # side of the square cells of grid_cell, in feet of x_coordinate/y_coordinate (Illinois State Plane)
+GRID_CELL_ROWS = 10000 # grid_cell = column * GRID_CELL_ROWS + row, with column = x_coordinate // GRID_CELL_FEET and row = y_coordinate // GRID_CELL_FEET
+
+# Columns derived from date_of_occurrence, beat and the x/y coordinates by transform_crime_data, stored so the views join and filter 
+# on plain columns. Each has the SQL expression computing it from a stored record (aliased c), used to fill the columns of records 
+# loaded before they existed. The nearest police station is found in police_stations, which is loaded before the crime table.
+CRIME_DERIVED_COLUMNS = {
+    'district': "cast(floor(beat/100.0) as varchar)",
+    'occurrence_date': "date(date_of_occurrence at time zone 'UTC')",
+    'hour': "cast(extract(hour from date_of_occurrence at time zone 'UTC') as integer)",
+    'time_of_day': "case when extract(hour from date_of_occurrence at time zone 'UTC') < 6 then 'night' "
+                   "when extract(hour from date_of_occurrence at time zone 'UTC') < 12 then 'morning' "
+                   "when extract(hour from date_of_occurrence at time zone 'UTC') < 18 then 'afternoon' "
+                   "when extract(hour from date_of_occurrence at time zone 'UTC') < 24 then 'evening' else 'unknown' end",
+    'nearest_station': f"(select p.district from police_stations p where p.district ~ '{DISTRICT_STATION_PATTERN}' "
+                       "and c.x_coordinate is not null and c.y_coordinate is not null "
+                       "order by (p.x_coordinate - c.x_coordinate)^2 + (p.y_coordinate - c.y_coordinate)^2 limit 1)",
+    'station_distance': "(select sqrt(min((p.x_coordinate - c.x_coordinate)^2 + (p.y_coordinate - c.y_coordinate)^2)) "
+                        f"from police_stations p where p.district ~ '{DISTRICT_STATION_PATTERN}')",
+    'grid_cell': f"cast(floor(x_coordinate/{GRID_CELL_FEET}.0) * {GRID_CELL_ROWS} + floor(y_coordinate/{GRID_CELL_FEET}.0) as integer)",
+}
+# Text columns repeated on many records, dictionary-encoded: crime_data stores the integer code ({column}_id) of each value, 
+# kept with the value in a lookup table per column (see CrimeDictionary)
+CRIME_DICTIONARY_TABLES = {
+    'block': 'blocks',
+    'iucr': 'iucr_codes',
+    'primary_description': 'primary_descriptions',
+    'secondary_description': 'secondary_descriptions',
+    'location_description': 'location_descriptions',
+    'fbi_cd': 'fbi_codes',
+}
+TIME_OF_DAY_BINS = [0, 6, 12, 18, 24]
+TIME_OF_DAY_LABELS = ['night', 'morning', 'afternoon', 'evening']
+POLICE_STATIONS_CSV_PATH = str(Path(__file__).parent / "data" / "Police_Stations.csv")
+
+class PoliceStations:
+    """
+    Coordinates of the Chicago police stations, read once from Police_Stations.csv, to find the nearest station of every record 
+    of a page at once. With a few dozen stations, the distances from every record to every station are one NumPy array 
+    (records x stations), which is faster than building and querying a spatial tree. Only district stations are candidates: 
+    rows whose district is not a number (Headquarters) are left out.
+
+    Usage example:
+        police_stations = PoliceStations()
+        nearest_station, station_distance = police_stations.nearest(x=crime_df['x_coordinate'], y=crime_df['y_coordinate'])
+    """
+    def __init__(self, csv_file_path: str = POLICE_STATIONS_CSV_PATH):
+        stations_df = extract_csv(csv_file_path=csv_file_path)
+        stations_df = stations_df[stations_df['district'].astype(str).str.match(DISTRICT_STATION_PATTERN)]
+        self.districts = stations_df['district'].astype(str).to_numpy()
+        self.x = stations_df['x_coordinate'].to_numpy(dtype='float64')
+        self.y = stations_df['y_coordinate'].to_numpy(dtype='float64')
+
+    def nearest(self, x: pd.Series, y: pd.Series) -> tuple[pd.Series, pd.Series]:
+        """
+        Returns the district of the nearest station (the police_stations key) and the distance to it in feet for each pair of x/y coordinates, 
+        null where a coordinate is null.
+        """
+        record_x = x.astype('float64').to_numpy(na_value=np.nan)
+        record_y = y.astype('float64').to_numpy(na_value=np.nan)
+        distances = np.hypot(record_x[:, None] - self.x[None, :], record_y[:, None] - self.y[None, :])
+        located = ~(np.isnan(record_x) | np.isnan(record_y))
+        nearest_index = np.argmin(np.where(located[:, None], distances, 0), axis=1)
+        nearest_station = pd.Series(self.districts[nearest_index], index=x.index, dtype='string').where(located)
+        station_distance = pd.Series(distances[np.arange(len(nearest_index)), nearest_index], index=x.index) # NaN where not located
+        return nearest_station, station_distance
+
+_police_stations = None
+_police_stations_lock = threading.Lock()
+
+def get_police_stations() -> PoliceStations:
+    """
+    Returns the PoliceStations shared by all transforms, reading the CSV file on first use.
+    """
+    global _police_stations
+    with _police_stations_lock:
+        if _police_stations is None:
+            _police_stations = PoliceStations()
+        return _police_stations
+
+def grid_cell_keys(x: pd.Series, y: pd.Series) -> pd.Series:
+    """
+    Returns the grid_cell (GRID_CELL_FEET square cells) of each pair of x/y coordinates as Int64, null where a coordinate is null.
+    """
+    return (x // GRID_CELL_FEET * GRID_CELL_ROWS + y // GRID_CELL_FEET).astype('Int64')
+
+def grid_cells_within_radius(x: float, y: float, radius_feet: float) -> list[int]:
+    """
+    Returns the grid_cell keys of the cells overlapping the square around (x, y) with half side radius_feet, to filter crime_data 
+    on its grid_cell index before checking the exact distance, e.g. 
+    "where grid_cell = any(:cells) and (x_coordinate - :x)^2 + (y_coordinate - :y)^2 <= :radius^2".
+    """
+    columns = range(int((x - radius_feet) // GRID_CELL_FEET), int((x + radius_feet) // GRID_CELL_FEET) + 1)
+    rows = range(int((y - radius_feet) // GRID_CELL_FEET), int((y + radius_feet) // GRID_CELL_FEET) + 1)
+    return [column * GRID_CELL_ROWS + row for column in columns for row in rows]
 
 def transform_crime_data(df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -232,55 +842,50 @@ def transform_crime_data(df: pd.DataFrame) -> pd.DataFrame:
     - pd.DataFrame: Transformed DataFrame.
 
     Transformations:
-    1. Drop specified columns:
-        - ':@computed_region_awaf_s7ux', 
-        - ':@computed_region_6mkv_f3dw',
-        - ':@computed_region_vrxf_vc4k', 
-        - ':@computed_region_bdys_3d7i',
-        - ':@computed_region_43wa_7qmu', 
-        - ':@computed_region_rpca_8um6',
-        - 'location.latitude',
-        - 'location.longitude',
-        - 'location.human_address'
-
-    2. Rename columns based on the specified mapping:
-        - ':id' -> 'id'
-        - ':created_at' -> 'created_at'
-        - ':updated_at' -> 'updated_at'
-        - ':version' -> 'version'
-        - 'case_' -> 'case'
-        - '_iucr' -> 'iucr'
-        - '_primary_decsription' -> 'primary_description'
-        - '_secondary_description' -> 'secondary_description'
-        - '_location_description' -> 'location_description'
-    """
-    # Transformation 1: Drop columns
-    cols_to_drop = [
-        ':@computed_region_awaf_s7ux', 
-        ':@computed_region_6mkv_f3dw',
-        ':@computed_region_vrxf_vc4k', 
-        ':@computed_region_bdys_3d7i',
-        ':@computed_region_43wa_7qmu', 
-        ':@computed_region_rpca_8um6',
-        'location.latitude',
-        'location.longitude',
-        'location.human_address'
-    ]
-    df = df.drop(columns=cols_to_drop)
-
-    # Transformation 2: Rename columns
-    col_mapping = {
-        ':id':'crime_id',
-        ':created_at':'created_at',
-        ':updated_at':'updated_at',
-        ':version':'version',
-        'case_':'case',
-        '_iucr':'iucr',
-        '_primary_decsription':'primary_description',
-        '_secondary_description':'secondary_description',
-        '_location_description':'location_description',
-    }
-    df = df.rename(columns=col_mapping)
+    1. Reorder columns to CRIME_COLUMNS, adding any column missing from the input as null. 
+       The input has the column names of the crime table (see decode_crime_page), other columns are dropped.
+
+    2. Parse column types with CRIME_COLUMN_PARSERS (vectorized, nulls kept as NaT/<NA>/NaN):
+        - 'created_at', 'updated_at' -> datetime64 (UTC)
+        - 'date_of_occurrence' -> datetime64 (local time as published)
+        - 'beat', 'ward', 'x_coordinate', 'y_coordinate' -> Int64
+        - 'latitude', 'longitude' -> float64
+
+    3. Add the columns of CRIME_DERIVED_COLUMNS (vectorized, same values as their SQL expressions):
+        - 'district' -> beat // 100 as a string, e.g. beat 733 -> '7' (matches police_stations.district)
+        - 'occurrence_date' -> date of 'date_of_occurrence' (matches date.date)
+        - 'hour' -> Int64 hour of 'date_of_occurrence'
+        - 'time_of_day' -> 'night' (0-5), 'morning' (6-11), 'afternoon' (12-17), 'evening' (18-23) or 'unknown'
+        - 'nearest_station', 'station_distance' -> district of the nearest police station and distance to it in feet (see PoliceStations)
+        - 'grid_cell' -> Int64 key of the GRID_CELL_FEET square cell of 'x_coordinate', 'y_coordinate' (see grid_cell_keys)
+
+    4. Convert the columns of CRIME_DICTIONARY_TABLES to categoricals, so CrimeDictionary.encode resolves the codes 
+       of the distinct values of the page only.
+    """
+    # Transformation 1: Align columns with crime table (every page is loaded with the same columns in the same order), 
+    # as a new DataFrame so the caller's page is left unchanged
+    df = df.reindex(columns=CRIME_COLUMNS)
+
+    # Transformation 2: Parse column types (already parsed by decode_crime_page for pages from the API)
+    df = df.assign(**{column: parser(df[column]) for column, parser in CRIME_COLUMN_PARSERS.items()})
+
+    # Transformation 3: Add derived columns
+    hour = df['date_of_occurrence'].dt.hour.astype('Int64')
+    df = df.assign(
+        district=(df['beat'] // 100).astype('string'),
+        occurrence_date=df['date_of_occurrence'].dt.date,
+        hour=hour,
+        time_of_day=pd.cut(hour, bins=TIME_OF_DAY_BINS, labels=TIME_OF_DAY_LABELS, right=False).astype(object).fillna('unknown'),
+    )
+    nearest_station, station_distance = get_police_stations().nearest(x=df['x_coordinate'], y=df['y_coordinate'])
+    df = df.assign(
+        nearest_station=nearest_station,
+        station_distance=station_distance,
+        grid_cell=grid_cell_keys(x=df['x_coordinate'], y=df['y_coordinate']),
+    )
+
+    # Transformation 4: Dictionary-encode repeated text columns
+    df = df.astype({column: 'category' for column in CRIME_DICTIONARY_TABLES})
 
     return df
 
@@ -337,9 +942,13 @@ def extract_csv(csv_file_path:str) -> pd.DataFrame:
     df.columns = [column.lower().replace(" ","_") for column in df.columns]
     return df
 
-def create_postgres_connection(username:str, password:str, host:str, port:int, database:str) -> Engine:
+def create_postgres_connection(username:str, password:str, host:str, port:int, database:str, pool_size:int=5) -> Engine:
     """
     Connect to postgres server using provided pgAdmin credentials.
+
+    pool_size should be at least the number of threads sharing the engine (e.g. backfill max_workers + 1).
+    Sessions use the UTC time zone, so date_of_occurrence (published without time zone) is stored and read back 
+    (at time zone 'UTC') the same way whatever the server default is.
     """
     connection_url = URL.create(
         drivername = "postgresql+pg8000", 
@@ -349,7 +958,15 @@ def create_postgres_connection(username:str, password:str, host:str, port:int, d
         port = port,
         database = database)
 
-    return create_engine(connection_url)
+    engine = create_engine(connection_url, pool_size=pool_size)
+
+    @event.listens_for(engine, "connect")
+    def set_utc_time_zone(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("set time zone 'UTC'")
+        dbapi_connection.commit()
+
+    return engine
 
 def create_logs_table(engine:Engine) -> Table:
     """
@@ -390,37 +1007,624 @@ def create_logs_data(run_id:int, status:str, pipeline_name:str, config:dict, log
         "config": config, 
         "logs":logs}]
 
-def create_crime_table(engine:Engine) -> Table:
+def create_run_metrics_table(engine:Engine, table_name:str="run_metrics") -> Table:
+    """
+    Create table for the metrics of each pipeline run, one row per run_id, scope ('run' or the start time of a window) and metric.
+    """
+    meta = MetaData()
+    table = Table(
+        table_name, meta, 
+        Column('run_id',Integer,primary_key=True),
+        Column('scope',String,primary_key=True),
+        Column('metric_name',String,primary_key=True),
+        Column('value',Float),
+        Column('timestamp',DateTime(timezone=True))
+    )
+    meta.create_all(bind=engine, checkfirst=True) # does not re-create table if it already exists
+    return table
+
+def write_run_metrics(metrics:PipelineMetrics, run_id:int, status:str, pipeline_name:str, metrics_table:Table, engine:Engine, prometheus_textfile_path:str=None) -> None:
+    """
+    Loads the metrics of a pipeline run to the run metrics table and, when prometheus_textfile_path is set, 
+    writes the run totals to a Prometheus textfile.
+    """
+    metrics.set("run_success", 1 if status == "success" else 0)
+    metrics.set("run_timestamp_seconds", time.time())
+    load_data_to_postgres(chunksize=1000, data=metrics.to_records(run_id=run_id), table=metrics_table, engine=engine)
+    if prometheus_textfile_path:
+        write_prometheus_textfile(file_path=prometheus_textfile_path, pipeline_name=pipeline_name, metrics=metrics.summary())
+
+def create_backfill_checkpoint_table(engine:Engine, table_name:str="backfill_checkpoints") -> Table:
+    """
+    Create table recording every backfill window with its status ('pending' or 'complete'), row count and timing. 
+    """
+    meta = MetaData()
+    table = Table(
+        table_name, meta, 
+        Column('window_start',String,primary_key=True),
+        Column('window_end',String),
+        Column('status',String),
+        Column('run_id',Integer),
+        Column('row_count',Integer),
+        Column('started_at',DateTime(timezone=True)),
+        Column('completed_at',DateTime(timezone=True)),
+        Column('duration_seconds',Float)
+    )
+    meta.create_all(bind=engine, checkfirst=True) # does not re-create table if it already exists
+    return table
+
+def create_backfill_checkpoint_data(date_range:dict[str, str], status:str, run_id:int, row_count:int=None, started_at:datetime=None, duration_seconds:float=None) -> dict:
+    """
+    Returns a dict for one backfill window to be used in the data argument of load_data_to_postgres for the checkpoint table.
+    """
+    return {
+        "window_start": date_range['start_time'],
+        "window_end": date_range['end_time'],
+        "status": status,
+        "run_id": run_id,
+        "row_count": row_count,
+        "started_at": started_at,
+        "completed_at": datetime.now(timezone.utc) if status == "complete" else None,
+        "duration_seconds": duration_seconds}
+
+def get_pending_backfill_windows(checkpoint_table_name:str, engine:Engine) -> list[dict[str, str]]:
+    """
+    Returns the backfill windows that are not complete yet, ordered by start time, in the same format as _generate_date_ranges.
+    """
+    select_pending_query = f"select window_start, window_end from {checkpoint_table_name} where status <> 'complete' order by window_start"
+    return [{'start_time': row["window_start"], 'end_time': row["window_end"]} for row in engine.execute(select_pending_query).all()]
+
+def create_crime_table(engine:Engine, table_name:str="crime_data") -> Table:
     """
     Create table for crimes data with applicable column names. 
+
+    The table is partitioned by range of date_of_occurrence (one partition per month, see create_crime_partitions), 
+    so the primary key includes date_of_occurrence. The columns of CRIME_DICTIONARY_TABLES are stored as their codes ({column}_id).
     """
     meta = MetaData()
     table = Table(
-        "crime_data", meta, 
+        table_name, meta, 
         Column("crime_id", String, primary_key=True),
         Column("created_at", DateTime(timezone=True)),
         Column("updated_at", DateTime(timezone=True)),
         Column("version", String),
         Column("case", String),
-        Column("date_of_occurrence", DateTime(timezone="US/Central")),
-        Column("block", String),
-        Column("iucr", String),
-        Column("primary_description", String),
-        Column("secondary_description", String),
-        Column("location_description", String),
+        Column("date_of_occurrence", DateTime(timezone="US/Central"), primary_key=True),
+        Column("block_id", Integer),
+        Column("iucr_id", Integer),
+        Column("primary_description_id", Integer),
+        Column("secondary_description_id", Integer),
+        Column("location_description_id", Integer),
         Column("arrest", String),
         Column("domestic", String),
         Column("beat", Integer),
         Column("ward", Integer),
-        Column("fbi_cd", String),
+        Column("fbi_cd_id", Integer),
         Column("x_coordinate", Integer),
         Column("y_coordinate", Integer),
         Column("latitude", Float),
-        Column("longitude", Float)
+        Column("longitude", Float),
+        Column("district", String),
+        Column("occurrence_date", Date),
+        Column("hour", Integer),
+        Column("time_of_day", String),
+        Column("nearest_station", String),
+        Column("station_distance", Float),
+        Column("grid_cell", Integer),
+        postgresql_partition_by="RANGE (date_of_occurrence)"
+    )
+    meta.create_all(bind=engine, checkfirst=True) # does not re-create table if it already exists
+    return table
+
+def _crime_dictionary_table(column:str, table_name:str, meta:MetaData) -> Table:
+    """
+    Returns the Table of the lookup table of a dictionary-encoded crime column: {column}_id (serial) and the unique value.
+    """
+    return Table(
+        table_name, meta,
+        Column(f"{column}_id", Integer, primary_key=True),
+        Column(column, String, nullable=False, unique=True)
+    )
+
+def create_crime_dictionary_tables(engine:Engine) -> dict[str, Table]:
+    """
+    Create the lookup tables of CRIME_DICTIONARY_TABLES and return their Tables by crime column.
+    """
+    meta = MetaData()
+    tables = {column: _crime_dictionary_table(column=column, table_name=table_name, meta=meta) for column, table_name in CRIME_DICTIONARY_TABLES.items()}
+    meta.create_all(bind=engine, checkfirst=True) # does not re-create tables if they already exist
+    return tables
+
+def decoded_crime_query(crime_table:Table) -> Select:
+    """
+    Returns a select of the records of crime_table with the values of the dictionary-encoded columns instead of their codes 
+    (joined with their lookup tables), with the columns in the order of crime_table.
+    """
+    meta = MetaData()
+    columns = []
+    from_clause = crime_table
+    for column in crime_table.columns:
+        dictionary_column = column.name[:-len("_id")]
+        if dictionary_column not in CRIME_DICTIONARY_TABLES:
+            columns.append(column)
+            continue
+        dictionary_table = _crime_dictionary_table(column=dictionary_column, table_name=CRIME_DICTIONARY_TABLES[dictionary_column], meta=meta)
+        from_clause = from_clause.outerjoin(dictionary_table, dictionary_table.c[column.name] == column)
+        columns.append(dictionary_table.c[dictionary_column])
+    return select(*columns).select_from(from_clause)
+
+class CrimeDictionary:
+    """
+    Codes of the values of the dictionary-encoded crime columns (CRIME_DICTIONARY_TABLES). 
+    encode replaces the categorical columns of a transformed page by their codes, resolving the values not seen before 
+    in bulk (one upsert and one select per column and page), and keeps the codes in memory, shared by the worker threads: 
+    the codes of a lookup table never change, so once its values are known a page is encoded without any query.
+
+    Usage example:
+        crime_dictionary = CrimeDictionary()
+        crime_df = crime_dictionary.encode(crime_df=transform_crime_data(df=crime_df), engine=engine)
+    """
+    def __init__(self):
+        self.codes = {column: {} for column in CRIME_DICTIONARY_TABLES}
+        self.lock = threading.Lock()
+
+    def fetch_codes(self, column: str, values: list[str], engine: Engine) -> dict[str, int]:
+        """
+        Adds the values missing from the lookup table of column (in value order, so concurrent pages lock the same rows in the same order) 
+        and returns the codes of values.
+        """
+        table_name = CRIME_DICTIONARY_TABLES[column]
+        engine.execute(
+            text(f"insert into {table_name} ({column}) select unnest(cast(:values as varchar[])) order by 1 on conflict ({column}) do nothing"), 
+            values=values)
+        rows = engine.execute(text(f"select {column}, {column}_id from {table_name} where {column} = any(cast(:values as varchar[]))"), values=values)
+        return dict(rows.all())
+
+    def encode(self, crime_df: pd.DataFrame, engine: Engine) -> pd.DataFrame:
+        """
+        Returns crime_df with each column of CRIME_DICTIONARY_TABLES replaced, at the same position, by the Int64 column {column}_id of its codes 
+        (null values stay null). Codes are mapped per distinct value (the categories), not per row.
+        """
+        encoded_columns = {}
+        for column in CRIME_DICTIONARY_TABLES:
+            values = crime_df[column].astype("category")
+            categories = [str(value) for value in values.cat.categories]
+            with self.lock:
+                new_values = [value for value in categories if value not in self.codes[column]]
+            if new_values:
+                fetched_codes = self.fetch_codes(column=column, values=new_values, engine=engine)
+                with self.lock:
+                    self.codes[column].update(fetched_codes)
+            category_codes = pd.array([self.codes[column][value] for value in categories] + [None], dtype="Int64")
+            encoded_columns[column] = pd.Series(category_codes[values.cat.codes.to_numpy()], index=crime_df.index) # code -1 (null) takes the trailing None
+        crime_df = crime_df.assign(**encoded_columns)
+        return crime_df.rename(columns={column: f"{column}_id" for column in CRIME_DICTIONARY_TABLES})
+
+def _month_partition_bounds(start_date:datetime, end_date:datetime) -> list[tuple[str, datetime, datetime]]:
+    """
+    Returns the name suffix and bounds of the monthly partitions covering start_date to end_date (both months included).
+
+    Usage example:
+        _month_partition_bounds(start_date=datetime(2023, 12, 15), end_date=datetime(2024, 1, 2))
+
+    Returns:
+        A list of tuples (suffix, lower bound included, upper bound excluded):
+        ```
+            [
+                ('p2023_12', datetime(2023, 12, 1), datetime(2024, 1, 1)),
+                ('p2024_01', datetime(2024, 1, 1), datetime(2024, 2, 1))
+            ]
+        ```
+    """
+    partition_bounds = []
+    month_start = datetime(start_date.year, start_date.month, 1)
+    while month_start <= end_date:
+        next_month_start = add_months(month_start=month_start, months=1)
+        partition_bounds.append((month_partition_suffix(month_start), month_start, next_month_start))
+        month_start = next_month_start
+    return partition_bounds
+
+def get_crime_partitions(crime_table_name:str, engine:Engine) -> list[str]:
+    """
+    Returns the names of the partitions attached to the crime table, ordered by name.
+    """
+    select_partitions_query = f"""
+        select child.relname as partition_name
+        from pg_inherits
+        join pg_class parent on parent.oid = pg_inherits.inhparent
+        join pg_class child on child.oid = pg_inherits.inhrelid
+        where parent.relname = '{crime_table_name}'
+        order by child.relname
+    """
+    return [row["partition_name"] for row in engine.execute(select_partitions_query).all()]
+
+def create_crime_partitions(crime_table_name:str, engine:Engine, logger:logging.Logger, start_date:datetime, end_date:datetime) -> list[str]:
+    """
+    Creates the monthly partitions of the crime table covering start_date to end_date that do not exist yet, 
+    and a default partition for records outside of every monthly partition.
+
+    Records of a new month that were routed to the default partition are moved to the new partition.
+
+    Usage example:
+        create_crime_partitions(crime_table_name="crime_data", engine=engine, logger=pipeline_logging.logger, start_date=datetime(2023, 1, 1), end_date=datetime(2024, 3, 1))
+
+    Returns:
+        A list with the names of the partitions created.
+
+    Args:
+        crime_table_name: provide a str with the name of the crime table.
+        engine: provide the sqlalchemy Engine returned by create_postgres_connection.
+        logger: provide the logger used for the pipeline run.
+        start_date: provide a datetime in the first month to cover.
+        end_date: provide a datetime in the last month to cover.
+    """
+    default_partition = f"{crime_table_name}_default"
+    engine.execute(f"create table if not exists {default_partition} partition of {crime_table_name} default")
+    existing_partitions = set(get_crime_partitions(crime_table_name=crime_table_name, engine=engine))
+
+    created_partitions = []
+    for suffix, lower_bound, upper_bound in _month_partition_bounds(start_date=start_date, end_date=end_date):
+        partition_name = f"{crime_table_name}_{suffix}"
+        if partition_name in existing_partitions:
+            continue
+        bounds = f"date_of_occurrence >= '{lower_bound.isoformat()}' and date_of_occurrence < '{upper_bound.isoformat()}'"
+        create_partition_query = f"create table {partition_name} partition of {crime_table_name} for values from ('{lower_bound.isoformat()}') to ('{upper_bound.isoformat()}')"
+        if engine.execute(f"select exists (select from {default_partition} where {bounds})").scalar():
+            # Postgres refuses a new partition while the default partition holds records of its range
+            with engine.begin() as connection:
+                connection.execute(f"alter table {crime_table_name} detach partition {default_partition}")
+                connection.execute(create_partition_query)
+                connection.execute(f"insert into {partition_name} select * from {default_partition} where {bounds}")
+                connection.execute(f"delete from {default_partition} where {bounds}")
+                connection.execute(f"alter table {crime_table_name} attach partition {default_partition} default")
+        else:
+            engine.execute(create_partition_query)
+        created_partitions.append(partition_name)
+
+    if created_partitions:
+        logger.info(f"Created {len(created_partitions)} partitions of {crime_table_name}: {', '.join(created_partitions)}")
+    return created_partitions
+
+def get_retention_start(retention_months:int, today:datetime=None) -> datetime:
+    """
+    Returns the first day of the oldest month kept by the retention period (the current month minus retention_months).
+    """
+    return add_months(month_start=today or datetime.now(timezone.utc), months=-retention_months)
+
+def drop_expired_crime_partitions(crime_table_name:str, engine:Engine, logger:logging.Logger, retention_months:int, retention_action:str="drop", today:datetime=None, rollup_table_name:str=None) -> list[str]:
+    """
+    Drops (or detaches) the monthly partitions of the crime table that end before the retention period, 
+    i.e. older than the current month minus retention_months. Removing a partition is a metadata operation, 
+    unlike deleting its records. Records before the retention period in the default partition are deleted.
+
+    Usage example:
+        drop_expired_crime_partitions(crime_table_name="crime_data", engine=engine, logger=pipeline_logging.logger, retention_months=13)
+
+    Returns:
+        A list with the names of the partitions dropped or detached, and of the default partition if expired records were deleted from it.
+
+    Args:
+        crime_table_name: provide a str with the name of the crime table.
+        engine: provide the sqlalchemy Engine returned by create_postgres_connection.
+        logger: provide the logger used for the pipeline run.
+        retention_months: provide an int for the number of months kept before the current month.
+        retention_action: provide a str ('drop' or 'detach'). Detached partitions are kept as standalone tables.
+        today: provide a datetime to compute the retention period from (None for now).
+        rollup_table_name: provide a str with the name of the rollup table whose days of the expired partitions are deleted with them (None if there is none).
+
+    Raises:
+        ValueError when retention_action is not 'drop' or 'detach'.
+    """
+    if retention_action not in ("drop", "detach"):
+        raise ValueError(f"Unknown retention_action {retention_action}, expected 'drop' or 'detach'")
+
+    retention_start = get_retention_start(retention_months=retention_months, today=today)
+    expired_partitions = []
+    default_partition = f"{crime_table_name}_default"
+    default_deleted_rows = 0
+    for partition_name in get_crime_partitions(crime_table_name=crime_table_name, engine=engine):
+        if partition_name == default_partition:
+            # Records of months without a partition are never removed with one, so expired ones are deleted
+            with engine.begin() as connection:
+                default_deleted_rows = connection.execute(f"delete from {default_partition} where date_of_occurrence < '{retention_start.isoformat()}'").rowcount
+                if default_deleted_rows and rollup_table_name is not None:
+                    connection.execute(f"delete from {rollup_table_name} where occurrence_date < '{retention_start.date()}'")
+            continue
+        month_match = re.fullmatch(rf"{re.escape(crime_table_name)}_p(\d{{4}})_(\d{{2}})", partition_name)
+        if month_match is None:
+            continue
+        partition_start = datetime(int(month_match[1]), int(month_match[2]), 1)
+        partition_end = add_months(month_start=partition_start, months=1)
+        if partition_end <= retention_start:
+            with engine.begin() as connection:
+                if retention_action == "drop":
+                    connection.execute(f"drop table {partition_name}")
+                else:
+                    connection.execute(f"alter table {crime_table_name} detach partition {partition_name}")
+                if rollup_table_name is not None:
+                    connection.execute(f"delete from {rollup_table_name} where occurrence_date >= '{partition_start.date()}' and occurrence_date < '{partition_end.date()}'")
+            expired_partitions.append(partition_name)
+
+    if expired_partitions:
+        logger.info(f"Retention ({retention_months} months) - {retention_action} {len(expired_partitions)} partitions of {crime_table_name}: {', '.join(expired_partitions)}")
+    if default_deleted_rows:
+        logger.info(f"Retention ({retention_months} months) - deleted {default_deleted_rows} records before {retention_start.date()} from {default_partition}")
+        expired_partitions.append(default_partition)
+    return expired_partitions
+
+def migrate_crime_table_to_partitions(crime_table_name:str, engine:Engine, logger:logging.Logger, end_date:datetime) -> bool:
+    """
+    Rebuilds a crime table created before partitioning as a partitioned table, in one transaction: 
+    the old table is renamed, its records are copied to the new table (with monthly partitions up to end_date) 
+    and it is dropped together with the views depending on it, which deploy_sql_views re-creates.
+
+    Returns:
+        True if the table was migrated, False if it was already partitioned.
+    """
+    relkind = engine.execute(f"select relkind from pg_class where oid = to_regclass('{crime_table_name}')").scalar()
+    if relkind != "r":
+        return False
+
+    logger.info(f"Migrating {crime_table_name} to a table partitioned by month of date_of_occurrence")
+    old_table_name = f"{crime_table_name}_unpartitioned"
+    with engine.begin() as connection:
+        connection.execute(f"alter table {crime_table_name} rename to {old_table_name}")
+        connection.execute(f"alter table {old_table_name} rename constraint {crime_table_name}_pkey to {old_table_name}_pkey")
+        for index_suffix in CRIME_TABLE_INDEXES:
+            connection.execute(f"drop index if exists {crime_table_name}_{index_suffix}")
+
+        crime_table = create_crime_table(engine=connection, table_name=crime_table_name)
+        connection.execute(f"create table {crime_table_name}_default partition of {crime_table_name} default")
+        start_date = connection.execute(f"select min(date_of_occurrence) from {old_table_name}").scalar()
+        if start_date is not None:
+            for suffix, lower_bound, upper_bound in _month_partition_bounds(start_date=start_date.replace(tzinfo=None), end_date=end_date):
+                connection.execute(f"create table {crime_table_name}_{suffix} partition of {crime_table_name} for values from ('{lower_bound.isoformat()}') to ('{upper_bound.isoformat()}')")
+
+        column_list = ", ".join(f'"{column.name}"' for column in crime_table.columns)
+        connection.execute(f"insert into {crime_table_name} ({column_list}) select {column_list} from {old_table_name}")
+        connection.execute(f"drop table {old_table_name} cascade")
+    return True
+
+def add_crime_derived_columns(crime_table_name:str, engine:Engine, logger:logging.Logger, rollup_table_name:str=None) -> list[str]:
+    """
+    Adds the columns of CRIME_DERIVED_COLUMNS missing from a crime table created before they were stored, and computes them 
+    for its records with their SQL expressions, in one transaction. Indexes named after an added column were expression 
+    indexes computing it and are dropped, so create_crime_table_indexes re-creates them on the column. 
+    The district column of the rollup table (if it exists) is added and computed with the crime columns.
+
+    Returns:
+        The names of the added columns (an empty list if the table already has them).
+    """
+    existing_columns = {row[0] for row in engine.execute(
+        text("select column_name from information_schema.columns where table_schema = current_schema() and table_name = :table_name"), 
+        table_name=crime_table_name)}
+    added_columns = [column for column in CRIME_DERIVED_COLUMNS if column not in existing_columns]
+    if not added_columns:
+        return []
+
+    logger.info(f"Adding derived columns {', '.join(added_columns)} to {crime_table_name}")
+    with engine.begin() as connection:
+        crime_table = create_crime_table(engine=connection, table_name=crime_table_name)
+        for column in added_columns:
+            connection.execute(f"alter table {crime_table_name} add column if not exists {column} {crime_table.c[column].type.compile(dialect=connection.dialect)}")
+            connection.execute(f"drop index if exists {crime_table_name}_{column}_idx")
+        connection.execute(f"update {crime_table_name} as c set {', '.join(f'{column} = {CRIME_DERIVED_COLUMNS[column]}' for column in added_columns)}")
+        if rollup_table_name is not None:
+            connection.execute(f"alter table if exists {rollup_table_name} add column if not exists district varchar")
+            if connection.execute(f"select to_regclass('{rollup_table_name}')").scalar() is not None:
+                connection.execute(f"update {rollup_table_name} set district = {CRIME_DERIVED_COLUMNS['district']} where district is null")
+    return added_columns
+
+def migrate_crime_table_to_dictionary_codes(crime_table_name:str, engine:Engine, logger:logging.Logger, rollup_table_name:str=None) -> list[str]:
+    """
+    Replaces the text columns of CRIME_DICTIONARY_TABLES of a crime table created before they were dictionary-encoded by their codes, 
+    in one transaction: the distinct values are added to the lookup tables, the {column}_id columns are computed and the text columns 
+    are dropped together with the views depending on them, which deploy_sql_views re-creates. The rollup table (if it exists) 
+    is migrated to primary_description_id the same way.
+
+    Returns:
+        The names of the migrated columns (an empty list if the table already stores codes).
+    """
+    existing_columns = {row[0] for row in engine.execute(
+        text("select column_name from information_schema.columns where table_schema = current_schema() and table_name = :table_name"), 
+        table_name=crime_table_name)}
+    migrated_columns = [column for column in CRIME_DICTIONARY_TABLES if column in existing_columns]
+    if not migrated_columns:
+        return []
+
+    logger.info(f"Dictionary-encoding columns {', '.join(migrated_columns)} of {crime_table_name}")
+    with engine.begin() as connection:
+        create_crime_dictionary_tables(engine=connection)
+        for column in migrated_columns:
+            table_name = CRIME_DICTIONARY_TABLES[column]
+            connection.execute(f"insert into {table_name} ({column}) select distinct {column} from {crime_table_name} where {column} is not null order by 1 on conflict ({column}) do nothing")
+            connection.execute(f"alter table {crime_table_name} add column if not exists {column}_id integer")
+        connection.execute(f"update {crime_table_name} c set " + ", ".join(
+            f"{column}_id = (select {column}_id from {CRIME_DICTIONARY_TABLES[column]} l where l.{column} = c.{column})" for column in migrated_columns))
+        for column in migrated_columns:
+            connection.execute(f"alter table {crime_table_name} drop column {column} cascade")
+
+        rollup_has_text = connection.execute(text(
+            "select count(*) from information_schema.columns where table_schema = current_schema() and table_name = :table_name and column_name = 'primary_description'"), 
+            table_name=rollup_table_name).scalar() if rollup_table_name is not None else 0
+        if rollup_has_text:
+            connection.execute(f"alter table {rollup_table_name} add column primary_description_id integer")
+            connection.execute(f"update {rollup_table_name} r set primary_description_id = l.primary_description_id from {CRIME_DICTIONARY_TABLES['primary_description']} l where l.primary_description = r.primary_description")
+            connection.execute(f"drop index if exists {rollup_table_name}_group_idx")
+            connection.execute(f"alter table {rollup_table_name} drop column primary_description cascade")
+            connection.execute(f"create unique index {rollup_table_name}_group_idx on {rollup_table_name} ({CRIME_ROLLUP_GROUP_KEY})")
+    return migrated_columns
+
+def _delete_moved_crime_sql(crime_table_name:str, moved_sql:str, rollup_table_name:str=None) -> str:
+    """
+    Returns a statement deleting the records of the crime table that have a crime_id of moved_sql (a from item with 
+    crime_id and date_of_occurrence columns, aliased moved) but a different date_of_occurrence, and selecting their count. 
+    Since date_of_occurrence is part of the primary key of the partitioned table, a record whose date_of_occurrence 
+    was corrected is upserted as a new row, and its old row has to be deleted (and removed from the rollup table, if given) 
+    in the transaction of the upsert, so a crime_id is never left in two partitions.
+    """
+    delete_moved_query = f"""
+        delete from {crime_table_name} c
+        using {moved_sql}
+        where c.crime_id = moved.crime_id and c.date_of_occurrence <> moved.date_of_occurrence
+        returning {', '.join(f'c.{column}' for column in CRIME_ROLLUP_SOURCE_COLUMNS)}
+    """
+    if rollup_table_name is not None:
+        deltas_sql = f"select {', '.join(CRIME_ROLLUP_SOURCE_COLUMNS)}, -1 as sign from deleted"
+        return (
+            f"with deleted as ({delete_moved_query}), rollup_merged as ({_crime_rollup_merge_sql(rollup_table_name=rollup_table_name, deltas_sql=deltas_sql)}) "
+            f"select count(*) from deleted")
+    return f"with deleted as ({delete_moved_query}) select count(*) from deleted"
+
+def create_crime_deletions_table(engine:Engine, table_name:str="crime_data_deletions") -> Table:
+    """
+    Create table for the crime records found by reconcile_crime_data that no longer exist in the API, 
+    with whether they were deleted from the crime table or only flagged.
+    """
+    meta = MetaData()
+    table = Table(
+        table_name, meta, 
+        Column('crime_id',String,primary_key=True),
+        Column('date_of_occurrence',DateTime(timezone=True)),
+        Column('version',String),
+        Column('run_id',Integer),
+        Column('detected_at',DateTime(timezone=True)),
+        Column('deleted',Boolean)
     )
     meta.create_all(bind=engine, checkfirst=True) # does not re-create table if it already exists
     return table
 
+CRIME_TABLE_INDEXES = {
+    "updated_at_idx": "(updated_at)", # max(updated_at) at the start of every incremental run
+    "occurrence_date_idx": "(occurrence_date)", # joins with date table in the views
+    "ward_idx": "(ward)", # joins with ward_offices
+    "beat_idx": "(beat)",
+    "district_idx": "(district)", # joins with police_stations
+    "grid_cell_idx": "(grid_cell)", # hot-spot and radius queries (see grid_cells_within_radius)
+}
+
+def create_crime_table_indexes(crime_table_name:str, engine:Engine, logger:logging.Logger) -> None:
+    """
+    Creates the secondary indexes in CRIME_TABLE_INDEXES on the crime table if they do not exist yet. 
+    Index names are prefixed with the table name, e.g. crime_data_updated_at_idx.
+    """
+    for index_suffix, index_expression in CRIME_TABLE_INDEXES.items():
+        index_name = f"{crime_table_name}_{index_suffix}"
+        engine.execute(f"create index if not exists {index_name} on {crime_table_name} {index_expression}")
+    logger.info(f"Checked {len(CRIME_TABLE_INDEXES)} indexes on {crime_table_name}")
+
+CRIME_ROLLUP_SOURCE_COLUMNS = ["date_of_occurrence", "beat", "ward", "primary_description_id", "arrest"] # crime columns a rollup row depends on
+CRIME_ROLLUP_GROUP_KEY = "occurrence_date, (coalesce(beat, -1)), (coalesce(ward, -1)), (coalesce(primary_description_id, -1))"
+
+def create_crime_rollup_table(engine:Engine, table_name:str="crime_daily_rollup") -> Table:
+    """
+    Create table with the number of crimes and arrests per day of date_of_occurrence (UTC), beat, ward and primary_description_id 
+    (with the district of the beat, joined with police_stations), kept in step with the crime table by every upsert and delete of the pipeline (see _crime_rollup_merge_sql), 
+    so aggregate views read a few thousand groups instead of every crime record.
+
+    beat, ward and primary_description_id may be null, so the group is unique on an index treating nulls as a value 
+    (rows are matched on conflict with the same expressions), and a partial index finds the groups whose count dropped to 0.
+    """
+    meta = MetaData()
+    table = Table(
+        table_name, meta, 
+        Column('occurrence_date',Date),
+        Column('beat',Integer),
+        Column('ward',Integer),
+        Column('primary_description_id',Integer),
+        Column('district',String),
+        Column('crime_count',Integer),
+        Column('arrest_count',Integer)
+    )
+    meta.create_all(bind=engine, checkfirst=True) # does not re-create table if it already exists
+    engine.execute(f"create unique index if not exists {table_name}_group_idx on {table_name} ({CRIME_ROLLUP_GROUP_KEY})")
+    engine.execute(f"create index if not exists {table_name}_empty_idx on {table_name} (crime_count) where crime_count = 0")
+    return table
+
+def _crime_rollup_merge_sql(rollup_table_name:str, deltas_sql:str) -> str:
+    """
+    Returns an INSERT ... ON CONFLICT statement adding the rows of deltas_sql to the counts of the rollup table. 
+    deltas_sql selects the CRIME_ROLLUP_SOURCE_COLUMNS of crime records and a sign column: 1 for a record added 
+    to the crime table (or the new values of an updated record) and -1 for a record removed (or the old values of an updated record).
+    Groups are merged in key order, so concurrent loads lock rollup rows in the same order.
+    """
+    return f"""
+        insert into {rollup_table_name} as rollup (occurrence_date, beat, ward, primary_description_id, district, crime_count, arrest_count)
+        select 
+            {CRIME_DERIVED_COLUMNS['occurrence_date']}, beat, ward, primary_description_id, {CRIME_DERIVED_COLUMNS['district']}, 
+            sum(sign), sum(case when arrest = 'Y' then sign else 0 end)
+        from ({deltas_sql}) crime_deltas
+        group by 1, 2, 3, 4
+        having sum(sign) <> 0 or sum(case when arrest = 'Y' then sign else 0 end) <> 0
+        order by 1, 2, 3, 4
+        on conflict ({CRIME_ROLLUP_GROUP_KEY}) do update set 
+            crime_count = rollup.crime_count + excluded.crime_count, 
+            arrest_count = rollup.arrest_count + excluded.arrest_count
+    """
+
+def _delete_empty_rollup_groups(connection, rollup_table_name:str) -> None:
+    """
+    Deletes the groups of the rollup table whose count dropped to 0 (found with its partial index), 
+    with the DB-API cursor or sqlalchemy Connection of the transaction that merged the deltas.
+    """
+    connection.execute(f"delete from {rollup_table_name} where crime_count = 0")
+
+def merge_crime_rollup_rows(connection, rollup_table_name:str, added_rows:list[tuple], removed_rows:list[tuple]) -> None:
+    """
+    Adds added_rows and removes removed_rows (tuples of CRIME_ROLLUP_SOURCE_COLUMNS values) from the rollup table, 
+    in the transaction of the sqlalchemy Connection connection.
+    """
+    signed_rows = [(*row, 1) for row in added_rows] + [(*row, -1) for row in removed_rows]
+    if not signed_rows:
+        return
+    dates, beats, wards, descriptions, arrests, signs = [list(values) for values in zip(*signed_rows)]
+    deltas_sql = """
+        select * from unnest(
+            cast(:dates as timestamptz[]), cast(cast(:beats as varchar[]) as integer[]), cast(cast(:wards as varchar[]) as integer[]), 
+            cast(cast(:descriptions as varchar[]) as integer[]), cast(:arrests as varchar[]), cast(cast(:signs as varchar[]) as integer[])
+        ) as deltas(date_of_occurrence, beat, ward, primary_description_id, arrest, sign)
+    """
+    connection.execute(
+        text(_crime_rollup_merge_sql(rollup_table_name=rollup_table_name, deltas_sql=deltas_sql)),
+        dates=[value.isoformat() if value is not None else None for value in dates],
+        beats=[str(value) if value is not None else None for value in beats],
+        wards=[str(value) if value is not None else None for value in wards],
+        descriptions=[str(value) if value is not None else None for value in descriptions],
+        arrests=arrests,
+        signs=[str(value) for value in signs])
+    _delete_empty_rollup_groups(connection=connection, rollup_table_name=rollup_table_name)
+
+def rebuild_crime_rollup(crime_table_name:str, rollup_table_name:str, engine:Engine, logger:logging.Logger) -> None:
+    """
+    Re-computes the rollup table from the whole crime table in one transaction, e.g. when the rollup table is new.
+    """
+    rebuild_start_time = time.time()
+    deltas_sql = f"select {', '.join(CRIME_ROLLUP_SOURCE_COLUMNS)}, 1 as sign from {crime_table_name}"
+    with engine.begin() as connection:
+        connection.execute(f"delete from {rollup_table_name}")
+        connection.execute(_crime_rollup_merge_sql(rollup_table_name=rollup_table_name, deltas_sql=deltas_sql))
+    logger.info(f"Rebuilt {rollup_table_name} from {crime_table_name} in {time.time() - rebuild_start_time:.2f} seconds")
+
+def log_index_usage(table_name:str, engine:Engine, logger:logging.Logger) -> list[dict]:
+    """
+    Logs the number of scans and the size of every index of a table (from pg_stat_user_indexes, summed over partitions) and returns them as a list[dict].
+    """
+    # Indexes of partitions are reported under the index of the partitioned table they belong to
+    select_index_usage_query = f"""
+        select coalesce(parent_index.relname, s.indexrelname) as index_name, sum(s.idx_scan) as scans, sum(pg_relation_size(s.indexrelid)) as size_bytes
+        from pg_stat_user_indexes s
+        left join pg_inherits i on i.inhrelid = s.indexrelid
+        left join pg_class parent_index on parent_index.oid = i.inhparent
+        where s.relid = to_regclass('{table_name}') 
+            or s.relid in (select inhrelid from pg_inherits where inhparent = to_regclass('{table_name}'))
+        group by 1
+        order by 1
+    """
+    index_usage = [dict(row) for row in engine.execute(select_index_usage_query).all()]
+    for index in index_usage:
+        logger.info(f"Index {index['index_name']} - {index['scans']} scans - {index['size_bytes'] / 1024 / 1024:.1f} MB")
+    return index_usage
+
 def create_date_table(engine:Engine) -> Table:
     """
     Create table for 2023 and 2024 dates and holiday data. 
@@ -494,12 +1698,141 @@ def create_ward_table(engine:Engine) -> Table:
     meta.create_all(bind=engine)
     return table
 
-def load_data_to_postgres(chunksize:int, data:list[dict], table:Table, engine:Engine) -> None:
+def _copy_value(value) -> str:
+    """
+    Returns value written as a field of a COPY ... (FORMAT csv) row. None is written unquoted (NULL) 
+    and every other value is quoted, so an empty string is not loaded as NULL.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    elif isinstance(value, datetime):
+        value = value.isoformat()
+    elif isinstance(value, bool):
+        value = "true" if value else "false"
+    else:
+        value = str(value)
+    return '"' + value.replace('"', '""') + '"'
+
+def _copy_csv_blocks(rows:list[tuple], rows_per_block:int=1000) -> Iterator[str]:
+    """
+    Yields rows as CSV text for COPY ... FROM STDIN, rows_per_block rows per str (each str is sent as one COPY message).
+    """
+    for i in range(0, len(rows), rows_per_block):
+        yield "".join(
+            ",".join(_copy_value(value) for value in row) + "\n"
+            for row in rows[i:i + rows_per_block]
+        )
+
+def _copy_upsert_chunk(columns:list[str], rows:list[tuple], table:Table, engine:Engine, version_column:str=None, rollup_table_name:str=None, delete_moved:bool=False) -> tuple[int, int, int]:
+    """
+    Upserts rows (tuples ordered as columns) into table by streaming them with COPY into a temporary staging table 
+    and merging the staging table with one INSERT ... SELECT ... ON CONFLICT statement. 
+    With rollup_table_name, the same statement moves the old values of the updated rows out of the rollup table 
+    and adds the values of the inserted and updated rows. With delete_moved (crime table only), the old rows of the staged 
+    records whose date_of_occurrence changed are deleted in the same transaction (see _delete_moved_crime_sql).
+    Returns the number of rows that already existed in table, the number of rows inserted or updated and the number of moved rows deleted.
+    """
+    quote = engine.dialect.identifier_preparer.quote
+    key_columns = [pk_column.name for pk_column in table.primary_key.columns.values()]
+    stage_name = quote(f"stage_{table.name}")
+    column_list = ", ".join(quote(column) for column in columns)
+    update_list = ", ".join(f"{quote(column)} = excluded.{quote(column)}" for column in columns if column not in key_columns)
+    conflict_action = f"do update set {update_list}" if update_list else "do nothing"
+    if update_list and version_column is not None:
+        conflict_action += f" where {quote(table.name)}.{quote(version_column)} is distinct from excluded.{quote(version_column)}"
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        # Staging table lives for the session (pooled connection) and is emptied on every commit
+        cursor.execute(f"create temporary table if not exists {stage_name} (like {quote(table.name)}) on commit delete rows")
+        cursor.execute(
+            f"copy {stage_name} ({column_list}) from stdin with (format csv)", 
+            stream=_copy_csv_blocks(rows=rows)
+        )
+        moved_rows = 0
+        if delete_moved:
+            cursor.execute(_delete_moved_crime_sql(crime_table_name=quote(table.name), moved_sql=f"{stage_name} moved", rollup_table_name=rollup_table_name))
+            moved_rows = cursor.fetchone()[0]
+        # Every part of the statement sees the table as it was before the insert, so the join counts the rows that already existed 
+        # and reads the old values of the rows being updated
+        key_list = ", ".join(quote(column) for column in key_columns)
+        rollup_ctes = ""
+        if rollup_table_name is not None:
+            rollup_list = ", ".join(CRIME_ROLLUP_SOURCE_COLUMNS)
+            updated_condition = f"where t.{quote(version_column)} is distinct from s.{quote(version_column)}" if version_column is not None else ""
+            deltas_sql = (
+                f"select {rollup_list}, 1 as sign from upserted union all "
+                f"select {', '.join(f't.{column}' for column in CRIME_ROLLUP_SOURCE_COLUMNS)}, -1 as sign "
+                f"from {stage_name} s join {quote(table.name)} t using ({key_list}) {updated_condition}")
+            rollup_ctes = f", rollup_merged as ({_crime_rollup_merge_sql(rollup_table_name=rollup_table_name, deltas_sql=deltas_sql)}) "
+        cursor.execute(
+            f"with upserted as ("
+            f"insert into {quote(table.name)} ({column_list}) "
+            f"select {column_list} from {stage_name} "
+            f"on conflict ({key_list}) {conflict_action} "
+            f"returning {', '.join(CRIME_ROLLUP_SOURCE_COLUMNS) if rollup_table_name is not None else '1'}){rollup_ctes}"
+            f"select (select count(*) from {stage_name} join {quote(table.name)} using ({key_list})), (select count(*) from upserted)"
+        )
+        existing_rows, upserted_rows = cursor.fetchone()
+        if rollup_table_name is not None:
+            _delete_empty_rollup_groups(connection=cursor, rollup_table_name=rollup_table_name)
+        connection.commit()
+        return existing_rows, upserted_rows, moved_rows
+    except BaseException:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+def _dataframe_to_rows(df:pd.DataFrame) -> tuple[list[str], list[tuple]]:
+    """
+    Returns the column names of df and its rows as tuples of python values, with every null (NaN/NaT/<NA>) as None.
+    Each column is converted as a whole, no per-row dict is created.
+    """
+    column_values = [
+        df[column].astype(object).where(df[column].notna(), None).tolist()
+        for column in df.columns
+    ]
+    return list(df.columns), list(zip(*column_values))
+
+def load_data_to_postgres(chunksize:int, data:Union[list[dict], pd.DataFrame], table:Table, engine:Engine, load_method:str="insert", version_column:str=None, rollup_table_name:str=None, delete_moved:bool=False) -> dict[str, int]:
     """
     Upsert data incrementally (chunking) into specific postgres table. 
+
+    data can be a list[dict] or a pd.DataFrame (typed columns are converted column by column, nulls are loaded as NULL).
+
+    load_method "insert" sends one INSERT ... ON CONFLICT statement with bound values per chunk. 
+    load_method "copy" streams each chunk with COPY into a staging table and merges it with one set-based 
+    INSERT ... SELECT ... ON CONFLICT, which avoids compiling and binding a statement per chunk.
+    Both methods update every non-key column of existing rows matching on the table's primary key. 
+    When version_column is set, existing rows are only updated if their version_column differs from the new value, 
+    so unchanged rows are not rewritten (no dead tuples or WAL). When rollup_table_name is set (crime table only), 
+    the rollup table is updated with the rows each chunk inserted and updated, in the transaction of the chunk: 
+    the old values of an updated row are removed from their group and the new values added to theirs. 
+    When delete_moved is set (crime table only), the old rows of records whose date_of_occurrence changed are deleted 
+    in the transaction of each chunk (see _delete_moved_crime_sql).
+
+    Returns:
+        A dict with the number of rows inserted, updated and skipped (unchanged version_column), 
+        e.g. {"inserted": 10, "updated": 2, "skipped": 988}, and the number of moved rows deleted with delete_moved, e.g. {..., "moved": 1}.
     """
-    max_length = len(data)
+    if load_method not in ("insert", "copy"):
+        raise ValueError(f"Unknown load_method {load_method}, expected 'insert' or 'copy'")
+
+    if isinstance(data, pd.DataFrame):
+        columns, rows = _dataframe_to_rows(df=data)
+    else:
+        columns = list(data[0].keys()) if data else []
+        rows = [tuple(record.get(column) for column in columns) for record in data]
+
+    max_length = len(rows)
     key_columns = [pk_column.name for pk_column in table.primary_key.columns.values()]
+    existing_rows = 0
+    upserted_rows = 0
+    moved_rows = 0
 
     for i in range(0, max_length, chunksize):
         if i + chunksize >= max_length:
@@ -508,56 +1841,784 @@ def load_data_to_postgres(chunksize:int, data:list[dict], table:Table, engine:En
         else:
             lower_bound = i
             upper_bound = i + chunksize
-        insert_statement = postgresql.insert(table).values(
-            data[lower_bound:upper_bound]
-        )
+
+        if load_method == "copy":
+            chunk_existing_rows, chunk_upserted_rows, chunk_moved_rows = _copy_upsert_chunk(columns=columns, rows=rows[lower_bound:upper_bound], table=table, engine=engine, version_column=version_column, rollup_table_name=rollup_table_name, delete_moved=delete_moved)
+            existing_rows += chunk_existing_rows
+            upserted_rows += chunk_upserted_rows
+            moved_rows += chunk_moved_rows
+            continue
+
+        chunk_records = [dict(zip(columns, row)) for row in rows[lower_bound:upper_bound]]
+        key_values = [tuple(record[column] for column in key_columns) for record in chunk_records]
+        key_list = [table.c[column] for column in key_columns]
+        rollup_list = [table.c[column] for column in CRIME_ROLLUP_SOURCE_COLUMNS] if rollup_table_name is not None else []
+        insert_statement = postgresql.insert(table).values(chunk_records)
         upsert_statement = insert_statement.on_conflict_do_update(
             index_elements=key_columns,
             set_={
                 c.key: c for c in insert_statement.excluded if c.key not in key_columns
             },
+            where=table.c[version_column].is_distinct_from(insert_statement.excluded[version_column]) if version_column is not None else None
+        ).returning(*key_list, *rollup_list)
+        with engine.begin() as connection:
+            if delete_moved:
+                chunk_moved_rows = connection.execute(
+                    text(_delete_moved_crime_sql(
+                        crime_table_name=table.name, 
+                        moved_sql="unnest(cast(:crime_ids as varchar[]), cast(:dates as timestamptz[])) as moved(crime_id, date_of_occurrence)", 
+                        rollup_table_name=rollup_table_name)),
+                    crime_ids=[record["crime_id"] for record in chunk_records],
+                    dates=[record["date_of_occurrence"].isoformat() for record in chunk_records]).scalar()
+                if rollup_table_name is not None and chunk_moved_rows:
+                    _delete_empty_rollup_groups(connection=connection, rollup_table_name=rollup_table_name)
+                moved_rows += chunk_moved_rows
+            # Rows that already existed, with their values before the upsert (locked until the rollup is updated)
+            existing_query = select(*key_list, *rollup_list).where(tuple_(*key_list).in_(key_values))
+            chunk_existing_rows = connection.execute(existing_query.with_for_update() if rollup_list else existing_query).all()
+            chunk_upserted_rows = connection.execute(upsert_statement).all()
+            if rollup_table_name is not None:
+                upserted_keys = {tuple(row[:len(key_columns)]) for row in chunk_upserted_rows}
+                merge_crime_rollup_rows(
+                    connection=connection, 
+                    rollup_table_name=rollup_table_name, 
+                    added_rows=[tuple(row[len(key_columns):]) for row in chunk_upserted_rows], 
+                    removed_rows=[tuple(row[len(key_columns):]) for row in chunk_existing_rows if tuple(row[:len(key_columns)]) in upserted_keys])
+        existing_rows += len(chunk_existing_rows)
+        upserted_rows += len(chunk_upserted_rows)
+
+    inserted = max_length - existing_rows
+    row_counts = {"inserted": inserted, "updated": upserted_rows - inserted, "skipped": max_length - upserted_rows}
+    if delete_moved:
+        row_counts["moved"] = moved_rows
+    return row_counts
+
+def load_crime_window(APP_TOKEN:str, column_name:str, start_time:str, end_time:str, limit:int, chunksize:int, crime_table:Table, engine:Engine, logger:logging.Logger, load_method:str="insert", page_cache:CrimePageCache=None, max_updated_at:str=None, metrics:PipelineMetrics=None, delete_moved:bool=False, retention_start:datetime=None, rollup_table_name:str=None, crime_dictionary:CrimeDictionary=None, decode_executor:Executor=None) -> int:
+    """
+    Extracts, transforms and loads Chicago crimes data for a single date range, one API page at a time.
+
+    Usage example:
+        load_crime_window(
+            APP_TOKEN="abc123",
+            column_name="date_of_occurrence",
+            start_time="2023-11-14T00:00:00.000",
+            end_time="2023-11-20T23:59:59.999",
+            limit=1000,
+            chunksize=1000,
+            crime_table=crime_table,
+            engine=engine,
+            logger=pipeline_logging.logger
+        )
+
+    Returns:
+        An int with the number of records inserted or updated in the crime table (records whose version did not change are skipped).
+
+    Args:
+        APP_TOKEN: provide a str with generated App Token credentials.
+        column_name: provide a str ('date_of_occurrence' or ':updated_at') of needed column to filter data.
+        start_time: provide a str with the format "yyyy-mm-ddThh:mm:ss.SSS".
+        end_time: provide a str with the format "yyyy-mm-ddThh:mm:ss.SSS".
+        limit: provide an int for maximum records retrieved per each API call.
+        chunksize: provide an int for number of records upserted per insert statement.
+        crime_table: provide the sqlalchemy Table returned by create_crime_table.
+        engine: provide the sqlalchemy Engine returned by create_postgres_connection.
+        logger: provide the logger used for the pipeline run.
+        load_method: provide a str ('insert' or 'copy') passed to load_data_to_postgres.
+        page_cache: provide a CrimePageCache to replay the window from disk when cached (None to always call the API).
+        max_updated_at: provide a str with the dataset's max :updated_at, part of the cache key.
+        metrics: provide the PipelineMetrics of the run to record the window's requests, row counts and stage times (None to skip).
+        delete_moved: provide a bool to delete the old rows of records whose date_of_occurrence changed, with their upsert (see _delete_moved_crime_sql). 
+            Only needed for :updated_at windows, since a backfill reads every record once at its current date_of_occurrence.
+        retention_start: provide a datetime to skip records that occurred before it, i.e. in partitions removed by retention (None to load all).
+        rollup_table_name: provide a str with the name of the rollup table updated with every chunk upserted (None if there is none).
+        crime_dictionary: provide the CrimeDictionary encoding the pages (None to use a new one, without known codes).
+        decode_executor: provide a ProcessPoolExecutor decoding the API pages (None to decode them in the window's thread).
+    """
+    logger.info(f"Extracting API data - {start_time} - {end_time}")
+    crime_dictionary = crime_dictionary if crime_dictionary is not None else CrimeDictionary()
+    window_metrics = metrics.window(start_time=start_time) if metrics is not None else PipelineMetrics()
+    window_counts = {"inserted": 0, "updated": 0, "skipped": 0, "moved": 0}
+    pages = extract_crime_api_pages(
+        APP_TOKEN=APP_TOKEN, 
+        column_name=column_name,
+        start_time=start_time, 
+        end_time=end_time, 
+        limit=limit,
+        metrics=window_metrics,
+        decode_executor=decode_executor
+    )
+    if page_cache is not None:
+        pages = page_cache.cached_pages(
+            pages=pages,
+            column_name=column_name,
+            start_time=start_time,
+            end_time=end_time,
+            max_updated_at=max_updated_at
+        )
+
+    # Each page is transformed and loaded as soon as it arrives, so memory stays bounded by the page size
+    while True:
+        with window_metrics.timer("extract"):
+            crime_df = next(pages, None)
+        if crime_df is None:
+            break
+        window_metrics.increment("rows_extracted", len(crime_df))
+
+        with window_metrics.timer("transform"):
+            crime_df = transform_crime_data(df=crime_df)
+            if retention_start is not None:
+                crime_df = crime_df[crime_df["date_of_occurrence"] >= retention_start]
+        window_metrics.increment("rows_transformed", len(crime_df))
+
+        with window_metrics.timer("load"):
+            crime_df = crime_dictionary.encode(crime_df=crime_df, engine=engine)
+            row_counts = load_data_to_postgres(chunksize=chunksize, data=crime_df, table=crime_table, engine=engine, load_method=load_method, version_column="version", rollup_table_name=rollup_table_name, delete_moved=delete_moved)
+        window_metrics.increment("rows_upserted", row_counts["inserted"] + row_counts["updated"]) # rows written, without the unchanged rows skipped
+        for count_name, count in row_counts.items():
+            window_metrics.increment(f"rows_{count_name}", count)
+            window_counts[count_name] += count
+
+    logger.info(
+        f"Loaded {window_counts['inserted']} new, {window_counts['updated']} updated and "
+        f"{window_counts['skipped']} unchanged records - {start_time} - {end_time}")
+    if window_counts["moved"]:
+        logger.info(f"Deleted old rows of {window_counts['moved']} records whose date_of_occurrence changed - {start_time} - {end_time}")
+    return window_counts["inserted"] + window_counts["updated"] + window_counts["moved"]
+
+def backfill_crime_data(APP_TOKEN:str, date_ranges:list[dict[str, str]], limit:int, chunksize:int, crime_table:Table, engine:Engine, logger:logging.Logger, max_workers:int=1, load_method:str="insert", page_cache:CrimePageCache=None, max_updated_at:str=None, checkpoint_table:Table=None, run_id:int=None, metrics:PipelineMetrics=None, retention_start:datetime=None, stop_event:threading.Event=None, rollup_table_name:str=None, crime_dictionary:CrimeDictionary=None, decode_executor:Executor=None) -> int:
+    """
+    Runs load_crime_window over every date range on a pool of worker threads.
+
+    At most max_workers windows are in flight at any time. A failing window does not stop the others: 
+    its error is logged and, once every window has finished, an Exception listing the failed windows is raised.
+    Windows do not overlap and rows are upserted on crime_id, so the loaded rows are the same as a serial run (max_workers=1).
+
+    Usage example:
+        backfill_crime_data(
+            APP_TOKEN="abc123",
+            date_ranges=_generate_date_ranges(start_date=start_date, end_date=end_date, days_delta=7),
+            limit=1000,
+            chunksize=1000,
+            crime_table=crime_table,
+            engine=engine,
+            logger=pipeline_logging.logger,
+            max_workers=4
         )
-        engine.execute(upsert_statement)
 
-def run_pipeline_schedule(pipeline_config:dict):
+    Returns:
+        An int with the total number of records inserted or updated in the crime table.
+
+    Args:
+        APP_TOKEN: provide a str with generated App Token credentials.
+        date_ranges: provide a list of dictionaries as returned by _generate_date_ranges.
+        limit: provide an int for maximum records retrieved per each API call.
+        chunksize: provide an int for number of records upserted per insert statement.
+        crime_table: provide the sqlalchemy Table returned by create_crime_table.
+        engine: provide the sqlalchemy Engine returned by create_postgres_connection.
+        logger: provide the logger used for the pipeline run.
+        max_workers: provide an int for the number of windows processed concurrently.
+        load_method: provide a str ('insert' or 'copy') passed to load_data_to_postgres.
+        page_cache: provide a CrimePageCache to replay windows from disk when cached (None to always call the API).
+        max_updated_at: provide a str with the dataset's max :updated_at, part of the cache key.
+        checkpoint_table: provide the sqlalchemy Table returned by create_backfill_checkpoint_table to mark each window 
+            complete (with row count and timing) as soon as it is loaded (None to skip checkpoints).
+        run_id: provide an int with the run_id of the pipeline run, recorded in the checkpoint table.
+        metrics: provide the PipelineMetrics of the run to record per-window metrics (None to skip).
+        retention_start: provide a datetime to skip records that occurred before it (None to load all).
+        stop_event: provide a threading.Event that stops submitting new windows once set (e.g. on SIGTERM). 
+            The windows in flight are finished and the windows not started stay pending in the checkpoint table.
+        rollup_table_name: provide a str with the name of the rollup table updated with every chunk upserted (None if there is none).
+        crime_dictionary: provide the CrimeDictionary shared by the windows (None to use a new one).
+        decode_executor: provide a ProcessPoolExecutor decoding the API pages of all windows (None to decode them in the worker threads).
+
+    Raises:
+        Exception when one or more windows failed.
+        Exception when stop_event was set before every window was started.
+    """
+    total_rows = 0
+    failed_windows = []
+    pending_ranges = iter(date_ranges)
+    crime_dictionary = crime_dictionary if crime_dictionary is not None else CrimeDictionary()
+    in_flight = {}
+
+    def run_window(date_range:dict[str, str]) -> int:
+        started_at = datetime.now(timezone.utc)
+        window_start_time = time.time()
+        row_count = load_crime_window(
+            APP_TOKEN=APP_TOKEN,
+            column_name="date_of_occurrence",
+            start_time=date_range['start_time'],
+            end_time=date_range['end_time'],
+            limit=limit,
+            chunksize=chunksize,
+            crime_table=crime_table,
+            engine=engine,
+            logger=logger,
+            load_method=load_method,
+            page_cache=page_cache,
+            max_updated_at=max_updated_at,
+            metrics=metrics,
+            retention_start=retention_start,
+            rollup_table_name=rollup_table_name,
+            crime_dictionary=crime_dictionary,
+            decode_executor=decode_executor
+        )
+        if checkpoint_table is not None:
+            checkpoint_data = [create_backfill_checkpoint_data(
+                date_range=date_range, 
+                status="complete", 
+                run_id=run_id, 
+                row_count=row_count, 
+                started_at=started_at, 
+                duration_seconds=time.time() - window_start_time
+            )]
+            load_data_to_postgres(chunksize=1, data=checkpoint_data, table=checkpoint_table, engine=engine)
+        return row_count
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        def submit_next() -> bool:
+            if stop_event is not None and stop_event.is_set():
+                return False
+            date_range = next(pending_ranges, None)
+            if date_range is None:
+                return False
+            future = executor.submit(run_window, date_range)
+            in_flight[future] = date_range
+            return True
+
+        while len(in_flight) < max_workers and submit_next():
+            pass
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                date_range = in_flight.pop(future)
+                try:
+                    total_rows += future.result()
+                except Exception as e:
+                    logger.error(f"Window failed - {date_range['start_time']} - {date_range['end_time']} - {e!r}")
+                    failed_windows.append(date_range)
+                    if metrics is not None:
+                        metrics.increment("windows_failed")
+                submit_next()
+
+    if failed_windows:
+        raise Exception(
+            f"Backfill failed for {len(failed_windows)} of {len(date_ranges)} windows: "
+            + ", ".join(f"{w['start_time']} - {w['end_time']}" for w in failed_windows)
+        )
+
+    not_started_windows = len(list(pending_ranges))
+    if not_started_windows:
+        raise Exception(f"Backfill stopped with {not_started_windows} of {len(date_ranges)} windows not started")
+
+    return total_rows
+
+def reconcile_crime_data(APP_TOKEN:str, crime_table:Table, deletions_table:Table, engine:Engine, logger:logging.Logger, run_id:int, action:str="delete", limit:int=50000, max_missing_fraction:float=0.1, metrics:PipelineMetrics=None, rollup_table_name:str=None) -> int:
+    """
+    Finds the records of the crime table that no longer exist in the API (deleted by the portal or out of its one-year window) 
+    without downloading the records themselves: only :id and :version are fetched, streamed with COPY into a temporary table, 
+    and compared to the crime table with an anti-join, from its oldest date_of_occurrence to the max date_of_occurrence of the API.
+    The missing records are recorded in the deletions table and, with action 'delete', deleted from the crime table, in one transaction.
+
+    Usage example:
+        reconcile_crime_data(
+            APP_TOKEN="abc123",
+            crime_table=crime_table,
+            deletions_table=deletions_table,
+            engine=engine,
+            logger=pipeline_logging.logger,
+            run_id=run_id
+        )
+
+    Returns:
+        An int with the number of records deleted (0 with action 'flag').
+
+    Args:
+        APP_TOKEN: provide a str with generated App Token credentials.
+        crime_table: provide the sqlalchemy Table returned by create_crime_table.
+        deletions_table: provide the sqlalchemy Table returned by create_crime_deletions_table.
+        engine: provide the sqlalchemy Engine returned by create_postgres_connection.
+        logger: provide the logger used for the pipeline run.
+        run_id: provide an int with the run_id of the pipeline run, recorded in the deletions table.
+        action: provide a str ('delete' or 'flag'). 'flag' only records the missing records in the deletions table.
+        limit: provide an int for maximum ids retrieved per each API call.
+        max_missing_fraction: provide a float for the largest fraction of the local records that may be missing from the API. 
+            More than that is taken as an incomplete API response and nothing is deleted.
+        metrics: provide the PipelineMetrics of the run to record the API requests and counts (None to skip).
+        rollup_table_name: provide a str with the name of the rollup table to remove the deleted records from (None if there is none).
+
+    Raises:
+        ValueError when action is not 'delete' or 'flag'.
+        Exception when more than max_missing_fraction of the local records are missing from the API.
+    """
+    if action not in ("delete", "flag"):
+        raise ValueError(f"Unknown action {action}, expected 'delete' or 'flag'")
+
+    min_local_date = engine.execute(f"select min(date_of_occurrence) from {crime_table.name}").scalar()
+    if min_local_date is None:
+        return 0
+    start_time = min_local_date.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
+    end_time = get_max_date_crime_api(APP_TOKEN=APP_TOKEN)
+    logger.info(f"Reconciling {crime_table.name} with API ids - {start_time} - {end_time}")
+    reconcile_start_time = time.time()
+
+    id_pages = extract_crime_api_ids(APP_TOKEN=APP_TOKEN, start_time=start_time, end_time=end_time, limit=limit, metrics=metrics)
+    in_range = f"c.date_of_occurrence between '{start_time}' and '{end_time}'"
+    missing = f"{in_range} and not exists (select from reconcile_ids r where r.crime_id = c.crime_id)"
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("create temporary table reconcile_ids (crime_id varchar primary key, version varchar) on commit drop")
+        cursor.execute(
+            "copy reconcile_ids (crime_id, version) from stdin with (format csv)", 
+            stream=(block for ids in id_pages for block in _copy_csv_blocks(rows=ids, rows_per_block=10000))
+        )
+        cursor.execute("analyze reconcile_ids")
+        cursor.execute(
+            f"select count(*), count(*) filter (where r.crime_id is null), count(*) filter (where r.version is distinct from c.version and r.crime_id is not null) "
+            f"from {crime_table.name} c left join reconcile_ids r on r.crime_id = c.crime_id where {in_range}"
+        )
+        local_rows, missing_rows, outdated_rows = cursor.fetchone()
+
+        if missing_rows > max_missing_fraction * local_rows:
+            raise Exception(
+                f"Reconciliation found {missing_rows} of {local_rows} records missing from the API, "
+                f"more than max_missing_fraction ({max_missing_fraction}) - nothing was deleted")
+
+        cursor.execute(
+            f"insert into {deletions_table.name} (crime_id, date_of_occurrence, version, run_id, detected_at, deleted) "
+            f"select c.crime_id, c.date_of_occurrence, c.version, {int(run_id)}, now(), {action == 'delete'} "
+            f"from {crime_table.name} c where {missing} "
+            f"on conflict (crime_id) do update set run_id = excluded.run_id, detected_at = excluded.detected_at, deleted = excluded.deleted"
+        )
+        deleted_rows = 0
+        if action == "delete":
+            delete_missing_query = f"delete from {crime_table.name} c where {missing} returning {', '.join(f'c.{column}' for column in CRIME_ROLLUP_SOURCE_COLUMNS)}"
+            rollup_cte = ""
+            if rollup_table_name is not None:
+                deltas_sql = f"select {', '.join(CRIME_ROLLUP_SOURCE_COLUMNS)}, -1 as sign from deleted"
+                rollup_cte = f", rollup_merged as ({_crime_rollup_merge_sql(rollup_table_name=rollup_table_name, deltas_sql=deltas_sql)})"
+            cursor.execute(f"with deleted as ({delete_missing_query}){rollup_cte} select count(*) from deleted")
+            deleted_rows = cursor.fetchone()[0]
+            if rollup_table_name is not None and deleted_rows:
+                _delete_empty_rollup_groups(connection=cursor, rollup_table_name=rollup_table_name)
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    if metrics is not None:
+        metrics.increment("reconcile_missing_rows", missing_rows)
+        metrics.increment("reconcile_outdated_rows", outdated_rows)
+        metrics.increment("rows_deleted", deleted_rows)
+    logger.info(
+        f"Reconciled {local_rows} records in {time.time() - reconcile_start_time:.2f} seconds - {missing_rows} missing from API "
+        f"({'deleted' if action == 'delete' else 'flagged'}), {outdated_rows} with a newer version in API")
+    return deleted_rows
+
+EXPORT_STATISTICS_COLUMNS = ["date_of_occurrence", "ward", "beat"] # row-group min/max written to the Parquet export
+EXPORT_SORT_COLUMNS = ["ward", "beat", "date_of_occurrence"] # rows are clustered so row groups cover few wards and beats
+
+class CrimeParquetExport:
+    """
+    Local Parquet dataset of the crime table for offline analysis, partitioned by month of date_of_occurrence 
+    (hive layout: year=2023/month=1/part-*.parquet) so readers such as pyarrow.dataset or DuckDB can prune months and row groups.
+
+    Every run appends the records upserted since the last export, read from the crime table by (updated_at, crime_id) 
+    after a watermark kept in _export_state.json, as one new file per month. The watermark also keeps the run_id of the 
+    backfill that loaded the crime table: reloaded records keep their updated_at, so when the crime table is backfilled 
+    again (e.g. after it was dropped) the dataset is deleted and exported again from the new table. Rows are sorted by ward, beat and 
+    date_of_occurrence, with min/max statistics on EXPORT_STATISTICS_COLUMNS. A month folder with more than 
+    compact_max_files files is compacted into one file that keeps only the latest version (updated_at) of every record.
+    Files are written under a temporary name (ignored by readers) and renamed once complete.
+
+    Usage example:
+        crime_export = CrimeParquetExport(export_folder_path="etl_project/export")
+        crime_export.export(crime_table=crime_table, engine=engine, logger=pipeline_logging.logger, run_id=42, table_run_id=1)
+
+    Args:
+        export_folder_path: provide a str indicating the path of the folder of the Parquet dataset.
+        row_group_rows: provide an int for the maximum number of rows per row group.
+        compact_max_files: provide an int for the number of files a month folder may have before it is compacted.
+    """
+    def __init__(self, export_folder_path: str, row_group_rows: int = 10000, compact_max_files: int = 8):
+        self.export_folder_path = Path(export_folder_path)
+        self.row_group_rows = row_group_rows
+        self.compact_max_files = compact_max_files
+        self.state_path = self.export_folder_path / "_export_state.json"
+        self.export_folder_path.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def arrow_schema(table: Table) -> pa.Schema:
+        """
+        Returns the Arrow schema of the columns of table (a Table or subquery, timestamps in UTC), so every file of the dataset has the same schema.
+        """
+        fields = []
+        for column in table.columns:
+            if isinstance(column.type, DateTime):
+                arrow_type = pa.timestamp("us", tz="UTC")
+            elif isinstance(column.type, Date):
+                arrow_type = pa.date32()
+            elif isinstance(column.type, Boolean):
+                arrow_type = pa.bool_()
+            elif isinstance(column.type, Integer):
+                arrow_type = pa.int64()
+            elif isinstance(column.type, Float):
+                arrow_type = pa.float64()
+            else:
+                arrow_type = pa.string()
+            fields.append(pa.field(column.name, arrow_type))
+        return pa.schema(fields)
+
+    def read_watermark(self) -> Union[dict, None]:
+        """
+        Returns the updated_at (isoformat) and crime_id of the last exported record with the table_run_id of the crime table, 
+        or None if nothing was exported yet.
+        """
+        if not self.state_path.exists():
+            return None
+        with open(self.state_path) as state_file:
+            return json.load(state_file)
+
+    def reset(self) -> None:
+        """
+        Deletes the month folders and the watermark of the dataset, so the next export writes every record again.
+        """
+        for year_path in self.export_folder_path.glob("year=*"):
+            shutil.rmtree(year_path)
+        self.state_path.unlink(missing_ok=True)
+
+    def _write_parquet(self, table: pa.Table, file_path: Path) -> None:
+        temp_path = file_path.with_name(f".{file_path.name}.tmp") # names starting with . are skipped by dataset readers
+        pq.write_table(
+            table.sort_by([(column, "ascending") for column in EXPORT_SORT_COLUMNS]), 
+            temp_path, 
+            row_group_size=self.row_group_rows, 
+            write_statistics=EXPORT_STATISTICS_COLUMNS)
+        os.replace(temp_path, file_path)
+
+    def export(self, crime_table: Table, engine: Engine, logger: logging.Logger, run_id: int, batch_rows: int = 50000, table_run_id: int = None) -> int:
+        """
+        Appends the records of crime_table updated after the watermark to the dataset, batch_rows records per query, 
+        advancing the watermark after each batch. Dictionary-encoded columns are exported with their values (see decoded_crime_query). 
+        table_run_id is the run_id of the backfill that loaded crime_table (None if unknown): when it differs from the one 
+        of the watermark, the dataset is reset first. A watermark written without table_run_id is kept.
+        Returns the number of records exported.
+        """
+        crime_records = decoded_crime_query(crime_table=crime_table).subquery()
+        schema = self.arrow_schema(table=crime_records)
+        watermark = self.read_watermark()
+        if watermark is not None and watermark.get("table_run_id", table_run_id) != table_run_id:
+            logger.info(f"Crime table was backfilled again (run {table_run_id}, exported from run {watermark['table_run_id']}) - Resetting {self.export_folder_path}")
+            self.reset()
+            watermark = None
+        exported_rows = 0
+        touched_months = set()
+        while True:
+            query = select(crime_records).order_by(crime_records.c.updated_at, crime_records.c.crime_id).limit(batch_rows)
+            if watermark is not None:
+                query = query.where(tuple_(crime_records.c.updated_at, crime_records.c.crime_id) > tuple_(
+                    literal(datetime.fromisoformat(watermark["updated_at"]), DateTime(timezone=True)), 
+                    literal(watermark["crime_id"])))
+            rows = engine.execute(query).all()
+            if not rows:
+                break
+
+            rows_by_month = {}
+            for row in rows:
+                month_start = row["date_of_occurrence"].astimezone(timezone.utc)
+                rows_by_month.setdefault((month_start.year, month_start.month), []).append(row)
+            for (year, month), month_rows in rows_by_month.items():
+                month_path = self.export_folder_path / f"year={year}" / f"month={month}"
+                month_path.mkdir(parents=True, exist_ok=True)
+                month_table = pa.Table.from_arrays(
+                    [pa.array([row[field.name] for row in month_rows], type=field.type) for field in schema], 
+                    schema=schema)
+                self._write_parquet(table=month_table, file_path=month_path / f"part-{run_id:06d}-{uuid.uuid4().hex[:8]}.parquet")
+                touched_months.add(month_path)
+
+            last_row = rows[-1]
+            watermark = {"updated_at": last_row["updated_at"].isoformat(), "crime_id": last_row["crime_id"], "table_run_id": table_run_id}
+            with open(self.state_path.with_name(f".{self.state_path.name}.tmp"), "w") as state_file:
+                json.dump(watermark, state_file)
+            os.replace(self.state_path.with_name(f".{self.state_path.name}.tmp"), self.state_path)
+            exported_rows += len(rows)
+
+        compacted_months = [month_path for month_path in sorted(touched_months) if self.compact(month_path=month_path, schema=schema)]
+        logger.info(f"Exported {exported_rows} records to {self.export_folder_path} - {len(touched_months)} months written, {len(compacted_months)} compacted")
+        return exported_rows
+
+    def compact(self, month_path: Path, schema: pa.Schema) -> bool:
+        """
+        Rewrites the files of month_path as one file with the latest version of every record, 
+        if there are more than compact_max_files files. Returns whether the month was compacted.
+        """
+        file_paths = sorted(month_path.glob("part-*.parquet"))
+        if len(file_paths) <= self.compact_max_files:
+            return False
+        month_df = pa.concat_tables([pq.read_table(file_path, schema=schema) for file_path in file_paths]).to_pandas()
+        month_df = month_df.sort_values(["updated_at", "version"]).drop_duplicates(subset=["crime_id"], keep="last")
+        self._write_parquet(
+            table=pa.Table.from_pandas(month_df, schema=schema, preserve_index=False), 
+            file_path=month_path / f"part-compacted-{uuid.uuid4().hex[:8]}.parquet")
+        for file_path in file_paths:
+            file_path.unlink()
+        return True
+
+def deploy_sql_views(sql_folder_path:str, engine:Engine, logger:logging.Logger, materialized_views:dict[str, list[str]]=None) -> list[str]:
+    """
+    Creates one view per SQL file in sql_folder_path, named after the file. 
+
+    Views listed in materialized_views are created as materialized views with a unique index on the given columns 
+    (required by REFRESH MATERIALIZED VIEW CONCURRENTLY), the others as plain views. The md5 of the SQL file is stored 
+    as the view comment, so a view whose SQL file or kind changed is dropped and re-created.
+
+    Usage example:
+        deploy_sql_views(
+            sql_folder_path="etl_project/sql",
+            engine=engine,
+            logger=pipeline_logging.logger,
+            materialized_views={"ward_crimes_summary": ["ward"]}
+        )
+
+    Returns:
+        A list of str with the names of the views created (materialized views created here are already populated).
+
+    Args:
+        sql_folder_path: provide a str indicating the path of the folder containing the view SQL files.
+        engine: provide the sqlalchemy Engine returned by create_postgres_connection.
+        logger: provide the logger used for the pipeline run.
+        materialized_views: provide a dict of view name to the list of columns uniquely identifying a row of the view.
+    """
+    materialized_views = materialized_views or {}
+    select_views_query = """
+        select c.relname as view, c.relkind as kind, obj_description(c.oid, 'pg_class') as comment
+        from pg_class c join pg_namespace n on n.oid = c.relnamespace
+        where c.relkind in ('v', 'm') and n.nspname = current_schema()
+    """
+    existing_views = {row["view"]: row for row in engine.execute(select_views_query).all()}
+    created_views = []
+
+    for sql_file in sorted(os.listdir(sql_folder_path)):
+        view = sql_file.split(".")[0] # name of view to match the name of the sql file
+        with open(f'{sql_folder_path}/{sql_file}', 'r') as f:
+            sql_query = f.read().strip().rstrip(";")
+        materialized = view in materialized_views
+        kind = "materialized view" if materialized else "view"
+        comment = f"sql_md5:{hashlib.md5(sql_query.encode()).hexdigest()}"
+
+        existing_view = existing_views.get(view)
+        if existing_view is not None:
+            if existing_view["kind"] == ("m" if materialized else "v") and existing_view["comment"] == comment:
+                logger.info(f"View {view} already exists in database")
+                continue
+            logger.info(f"View {view} changed - Dropping view")
+            engine.execute(f"drop {'materialized view' if existing_view['kind'] == 'm' else 'view'} {view}")
+
+        logger.info(f"Creating {kind} {view}")
+        with engine.begin() as connection:
+            connection.execute(f"create {kind} {view} as {sql_query}")
+            if materialized:
+                connection.execute(f"create unique index {view}_unique_idx on {view} ({', '.join(materialized_views[view])})")
+            connection.execute(f"comment on {kind} {view} is '{comment}'")
+        created_views.append(view)
+        logger.info(f"Successfully created {kind} {view}")
+
+    return created_views
+
+def refresh_materialized_views(materialized_views:list[str], engine:Engine, logger:logging.Logger) -> None:
+    """
+    Runs REFRESH MATERIALIZED VIEW CONCURRENTLY for each view, so dashboard queries keep reading the view during the refresh.
+    """
+    for view in materialized_views:
+        refresh_start_time = time.time()
+        engine.execute(f"refresh materialized view concurrently {view}")
+        logger.info(f"Refreshed materialized view {view} in {time.time() - refresh_start_time:.2f} seconds")
+
+class PipelineRunner:
+    """
+    Keeps the resources of the pipeline across runs so that a run without new updates costs a few queries and one API call: 
+    one pooled engine, the sqlalchemy Table objects and names of the existing tables, one logger whose log lines of the current 
+    run are kept in a bounded in-memory buffer, the codes of the dictionary-encoded columns, the page cache, the decode worker processes and the Parquet export. run_forever runs the pipeline on the schedule of the 
+    YAML file until SIGTERM (or SIGINT), letting the current run finish first.
+
+    Usage example:
+        runner = PipelineRunner(pipeline_config=pipeline_config)
+        runner.run_forever()
+
+    Args:
+        pipeline_config: provide a dict with the contents of the pipeline YAML file.
+    """
+    def __init__(self, pipeline_config: dict):
+        self.pipeline_config = pipeline_config
+        config = pipeline_config.get("config")
+        self.engine = create_postgres_connection(
+            username=os.environ.get("DB_USERNAME"), 
+            password=os.environ.get("DB_PASSWORD"), 
+            host=os.environ.get("SERVER_NAME"), 
+            port=os.environ.get("PORT"), 
+            database=os.environ.get("DATABASE_NAME"),
+            pool_size=config.get("max_workers", 1) + 1)
+        self.pipeline_logging = PipelineLogging(
+            pipeline_name=pipeline_config.get("name"), 
+            log_folder_path=config.get("log_folder_path"), 
+            max_buffer_lines=config.get("log_buffer_lines", 10000))
+        self.page_cache = CrimePageCache(
+            cache_folder_path=config.get("cache_folder_path"), 
+            max_bytes=config.get("cache_max_bytes"), 
+            enabled=config.get("use_cache", False))
+        self.crime_export = CrimeParquetExport(
+            export_folder_path=config.get("export_folder_path"), 
+            row_group_rows=config.get("export_row_group_rows", 10000), 
+            compact_max_files=config.get("export_compact_max_files", 8)) if config.get("export_folder_path") else None
+        set_api_client(ApiClient(
+            requests_per_second=config.get("api_requests_per_second"), 
+            max_retries=config.get("api_max_retries", 5), 
+            read_timeout_seconds=config.get("api_timeout_seconds", 120), 
+            pool_maxsize=max(16, config.get("max_workers", 1))))
+        # spawned rather than forked, since the worker threads of a backfill may hold locks at fork time
+        self.decode_executor = ProcessPoolExecutor(
+            max_workers=config.get("decode_workers"), 
+            mp_context=multiprocessing.get_context("spawn")) if config.get("decode_workers") else None
+        self.stop_event = threading.Event()
+        self.reset_metadata()
+
+    def reset_metadata(self) -> None:
+        """
+        Forgets the cached tables and checks, e.g. after a failed run, so that the next run inspects the database again.
+        """
+        self.tables = {}
+        self._table_names = None
+        self._done_checks = set()
+        self.crime_dictionary = CrimeDictionary() # codes of lookup tables that may have been dropped are forgotten too
+
+    def table_exists(self, table_name: str) -> bool:
+        """
+        Returns whether table_name exists, inspecting the database on first use only.
+        """
+        if self._table_names is None:
+            self._table_names = set(inspect(self.engine).get_table_names())
+        return table_name in self._table_names
+
+    def get_table(self, table_name: str, create_table: Callable[[], Table]) -> Table:
+        """
+        Returns the Table of table_name, calling create_table (one of the create_*_table functions) on first use only.
+        """
+        if table_name not in self.tables:
+            self.tables[table_name] = create_table()
+            if self._table_names is not None:
+                self._table_names.add(table_name)
+        return self.tables[table_name]
+
+    def first_time(self, check_name: str) -> bool:
+        """
+        Returns True the first time check_name is passed (until reset_metadata), to run idempotent checks once per runner.
+        """
+        if check_name in self._done_checks:
+            return False
+        self._done_checks.add(check_name)
+        return True
+
+    def run_once(self) -> None:
+        """
+        Runs the pipeline once.
+        """
+        run_pipeline_schedule(pipeline_config=self.pipeline_config, runner=self)
+
+    def stop(self, signum: int = None, frame = None) -> None:
+        """
+        Stops run_forever after the current run (also stops a backfill from starting new windows). Used as signal handler.
+        """
+        self.pipeline_logging.logger.info(f"Stop requested (signal {signum}) - finishing current run")
+        self.stop_event.set()
+
+    def run_forever(self) -> None:
+        """
+        Runs the pipeline every run_seconds (checking every poll_seconds) until stop is called or SIGTERM/SIGINT is received.
+        """
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        schedule_config = self.pipeline_config.get("schedule")
+        scheduler = schedule.Scheduler()
+        scheduler.every(schedule_config.get("run_seconds")).seconds.do(self.run_once)
+        try:
+            while not self.stop_event.is_set():
+                scheduler.run_pending()
+                self.stop_event.wait(schedule_config.get("poll_seconds"))
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """
+        Closes the connections of the engine, the decode worker processes and the log handlers.
+        """
+        self.engine.dispose()
+        if self.decode_executor is not None:
+            self.decode_executor.shutdown()
+        self.pipeline_logging.close()
+
+def run_pipeline_schedule(pipeline_config:dict, runner:PipelineRunner=None):
+    """
+    Runs the pipeline once. Pass the PipelineRunner of a long-lived process to reuse its engine, tables and logger across runs; 
+    without one, a runner is created for this run and closed at the end.
+    """
     # Initializing environment variables
     APP_TOKEN = os.environ.get("APP_TOKEN")
-    DB_USERNAME = os.environ.get("DB_USERNAME")
-    DB_PASSWORD = os.environ.get("DB_PASSWORD")
-    SERVER_NAME = os.environ.get("SERVER_NAME")
-    DATABASE_NAME = os.environ.get("DATABASE_NAME")
-    PORT = os.environ.get("PORT")
 
     # Initializing parameters from YAML file
     config = pipeline_config.get("config")
     days_delta=config.get("days_delta")
+    window_target_rows=config.get("window_target_rows")
     limit=config.get("limit")
     holidays_begin_date=config.get("holidays_begin_date")
     holidays_end_date=config.get("holidays_end_date")
     holidays_data_path=config.get("holidays_data_path")
     chunksize=config.get("chunksize")
     sql_folder_path=config.get("sql_folder_path")
-    log_folder_path=config.get("log_folder_path")
     pipeline_name=pipeline_config.get("name")
     crime_table_name=config.get("crime_table_name")
     logs_table_name=config.get("logs_table_name")
-
-    # Connecting to postgres
-    engine = create_postgres_connection(
-        username=DB_USERNAME, 
-        password=DB_PASSWORD, 
-        host=SERVER_NAME, 
-        port=PORT, 
-        database=DATABASE_NAME)
+    checkpoint_table_name=config.get("checkpoint_table_name", "backfill_checkpoints")
+    metrics_table_name=config.get("metrics_table_name", "run_metrics")
+    prometheus_textfile_path=config.get("prometheus_textfile_path")
+    materialized_views=config.get("materialized_views") or {}
+    max_workers=config.get("max_workers", 1)
+    load_method=config.get("load_method", "insert")
+    partition_months_ahead=config.get("partition_months_ahead", 1)
+    partition_retention_months=config.get("partition_retention_months")
+    partition_retention_action=config.get("partition_retention_action", "drop")
+    reconcile_action=config.get("reconcile_action")
+    reconcile_every_runs=config.get("reconcile_every_runs", 1)
+    reconcile_limit=config.get("reconcile_limit", 50000)
+    reconcile_max_missing_fraction=config.get("reconcile_max_missing_fraction", 0.1)
+    deletions_table_name=config.get("deletions_table_name", "crime_data_deletions")
+    rollup_table_name=config.get("rollup_table_name", "crime_daily_rollup")
+
+    # Connecting to postgres, instantiating console logger and local cache of raw API pages (bypassed when use_cache is false), 
+    # unless a runner of a long-lived process already holds them
+    owns_runner = runner is None
+    if owns_runner:
+        runner = PipelineRunner(pipeline_config=pipeline_config)
+    engine = runner.engine
+    pipeline_logging = runner.pipeline_logging
+    pipeline_logging.clear_logs()
+    page_cache = runner.page_cache
     
     # Creating table in database for pipeline metadata logs (does not re-create table if it already exists)
-    logs_table = create_logs_table(engine=engine)
+    logs_table = runner.get_table(logs_table_name, lambda: create_logs_table(engine=engine))
+
+    # Creating table in database for the metrics of each run (does not re-create table if it already exists)
+    metrics_table = runner.get_table(metrics_table_name, lambda: create_run_metrics_table(engine=engine, table_name=metrics_table_name))
 
     # Extracting next run_id value to be used for writing new records to metadata logs table
     run_id = get_logs_table_run_id(logs_table_name=logs_table_name, engine=engine)
 
-    # Instantiating console logger for pipeline run
-    pipeline_logging = PipelineLogging(pipeline_name=pipeline_name, log_folder_path=log_folder_path)
+    # Instantiating counters and timers for the run and each of its windows
+    metrics = PipelineMetrics()
 
     # Try-except to log any errors during pipeline run
     try:
@@ -567,139 +2628,290 @@ def run_pipeline_schedule(pipeline_config:dict):
 
             pipeline_logging.logger.info("Pipeline start")
             pipeline_start_time = time.time()
+            rows_loaded = 0 # rows upserted in this run, used to skip the materialized view refresh
             
-            # Checking what tables exist in database
+            # Checking what tables exist in database (cached by the runner)
             pipeline_logging.logger.info("Inspecting database tables")
-            inspector = inspect(engine)
             
             # Checking if ward table exists inside of database
-            if 'ward_offices' not in inspector.get_table_names():
+            if not runner.table_exists('ward_offices'):
                 pipeline_logging.logger.info("Extracting ward data")
                 ward_df = extract_csv(csv_file_path="etl_project/data/Ward_Offices.csv")
 
                 pipeline_logging.logger.info("Creating ward table")
-                ward_table = create_ward_table(engine=engine)
+                ward_table = runner.get_table('ward_offices', lambda: create_ward_table(engine=engine))
 
                 pipeline_logging.logger.info("Inserting data records to ward table") 
-                ward_data = ward_df.where(pd.notnull(ward_df), None).to_dict(orient='records')
-                load_data_to_postgres(chunksize=chunksize, data=ward_data, table=ward_table, engine=engine)
+                load_data_to_postgres(chunksize=chunksize, data=ward_df, table=ward_table, engine=engine, load_method=load_method)
+                rows_loaded += len(ward_df)
 
             # Checking if police table exists inside of database
-            if 'police_stations' not in inspector.get_table_names():
+            if not runner.table_exists('police_stations'):
                 pipeline_logging.logger.info("Extracting police data")
                 police_df = extract_csv(csv_file_path="etl_project/data/Police_Stations.csv")
 
                 pipeline_logging.logger.info("Creating police table")
-                police_table = create_police_table(engine=engine)
+                police_table = runner.get_table('police_stations', lambda: create_police_table(engine=engine))
 
                 pipeline_logging.logger.info("Inserting data records to police table")
-                police_data = police_df.where(pd.notnull(police_df), None).to_dict(orient="records")
-                load_data_to_postgres(chunksize=chunksize, data=police_data, table=police_table, engine=engine)
+                load_data_to_postgres(chunksize=chunksize, data=police_df, table=police_table, engine=engine, load_method=load_method)
+                rows_loaded += len(police_df)
 
             # Checking if date table exists inside of database
-            if 'date' not in inspector.get_table_names():
+            if not runner.table_exists('date'):
                 pipeline_logging.logger.info("Generating date data")
                 date_df = generate_date_df(begin_date=holidays_begin_date, end_date=holidays_end_date, holidays_data_path=holidays_data_path)
 
                 pipeline_logging.logger.info("Creating date table")
-                date_table = create_date_table(engine=engine)
+                date_table = runner.get_table('date', lambda: create_date_table(engine=engine))
 
                 pipeline_logging.logger.info("Inserting data records to date table")
-                date_data = date_df.where(pd.notnull(date_df), None).to_dict(orient='records')
-                load_data_to_postgres(chunksize=chunksize, data=date_data, table=date_table, engine=engine)
-
-            # Checking if crime table exists inside of database
-            if 'crime_data' not in inspector.get_table_names():
+                load_data_to_postgres(chunksize=chunksize, data=date_df, table=date_table, engine=engine, load_method=load_method)
+                rows_loaded += len(date_df)
+
+            # Last month for which partitions of the crime table are created ahead of time, and first month kept by retention
+            partitions_end_date = add_months(month_start=datetime.now(timezone.utc), months=partition_months_ahead)
+            retention_start = get_retention_start(retention_months=partition_retention_months) if partition_retention_months is not None else None
+
+            # Creating the lookup tables of the dictionary-encoded crime columns
+            if not all(runner.table_exists(table_name) for table_name in CRIME_DICTIONARY_TABLES.values()):
+                for dictionary_table in create_crime_dictionary_tables(engine=engine).values():
+                    runner.get_table(dictionary_table.name, lambda: dictionary_table)
+
+            # Migrating a crime table created before the derived columns or the dictionary codes, and creating indexes used by 
+            # the pipeline and view queries (does not re-create existing indexes), once per runner
+            crime_table_exists = runner.table_exists(crime_table_name)
+            if crime_table_exists and runner.first_time("crime_table_indexes"):
+                add_crime_derived_columns(crime_table_name=crime_table_name, engine=engine, logger=pipeline_logging.logger, rollup_table_name=rollup_table_name)
+                migrate_crime_table_to_dictionary_codes(crime_table_name=crime_table_name, engine=engine, logger=pipeline_logging.logger, rollup_table_name=rollup_table_name)
+                migrate_crime_table_to_partitions(crime_table_name=crime_table_name, engine=engine, logger=pipeline_logging.logger, end_date=partitions_end_date)
+                create_crime_table_indexes(crime_table_name=crime_table_name, engine=engine, logger=pipeline_logging.logger)
+
+            # Creating the daily rollup of the crime table read by the aggregate views, computed from the crime table when the rollup is new
+            if not runner.table_exists(rollup_table_name):
+                runner.get_table(rollup_table_name, lambda: create_crime_rollup_table(engine=engine, table_name=rollup_table_name))
+                if crime_table_exists:
+                    rebuild_crime_rollup(crime_table_name=crime_table_name, rollup_table_name=rollup_table_name, engine=engine, logger=pipeline_logging.logger)
+
+            # Checking for an unfinished backfill (windows of a previous run that are not complete yet), 
+            # once per runner since a runner only moves on to incremental runs after a successful backfill
+            checkpoint_table = runner.get_table(checkpoint_table_name, lambda: create_backfill_checkpoint_table(engine=engine, table_name=checkpoint_table_name))
+            pending_date_ranges = []
+            backfill_needed = not crime_table_exists
+            if not crime_table_exists:
+                engine.execute(checkpoint_table.delete()) # checkpoints of a dropped crime table are stale
+            elif runner.first_time("backfill_checkpoints"):
+                pending_date_ranges = get_pending_backfill_windows(checkpoint_table_name=checkpoint_table_name, engine=engine)
+                # An empty crime table without any checkpoint (left by a run that failed before recording its windows) is backfilled from the beginning
+                backfill_needed = bool(pending_date_ranges) or (
+                    get_max_update_time_crime_table(crime_table_name=crime_table_name, engine=engine) is None 
+                    and engine.execute(select(func.count()).select_from(checkpoint_table)).scalar() == 0)
+
+            # Backfilling when crime table does not exist or a previous backfill did not finish
+            if backfill_needed:
+                max_updated_at = get_max_update_time_crime_api(APP_TOKEN=APP_TOKEN)
+
+                if pending_date_ranges:
+                    date_ranges = pending_date_ranges
+                    pipeline_logging.logger.info(f"Resuming backfill at window {date_ranges[0]['start_time']} - {len(date_ranges)} windows left")
+                else:
+                    # Extracting crime data from beginning
+                    start_date = get_min_date_crime_api(APP_TOKEN=APP_TOKEN)
+                    if retention_start is not None:
+                        start_date = max(start_date, retention_start.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]) # months before retention are not loaded
+                    end_date = get_max_date_crime_api(APP_TOKEN=APP_TOKEN)
+                    if window_target_rows:
+                        date_ranges = _generate_count_aware_date_ranges(
+                            start_date=start_date, 
+                            end_date=end_date, 
+                            daily_counts=get_daily_counts_crime_api(APP_TOKEN=APP_TOKEN), 
+                            window_target_rows=window_target_rows)
+                    else:
+                        date_ranges = _generate_date_ranges(start_date=start_date, end_date=end_date, days_delta=days_delta)
+
+                    pipeline_logging.logger.info(f"Recording {len(date_ranges)} backfill windows in checkpoint table")
+                    checkpoint_data = [create_backfill_checkpoint_data(date_range=date_range, status="pending", run_id=run_id) for date_range in date_ranges]
+                    load_data_to_postgres(chunksize=chunksize, data=checkpoint_data, table=checkpoint_table, engine=engine)
+
+                # Creating the crime table only once its windows are recorded, so a run failing on the API calls above 
+                # leaves no crime table and the next run starts the backfill again
                 pipeline_logging.logger.info("Creating crime table")
-                crime_table = create_crime_table(engine=engine)
-
-                # Extracting crime data from beginning
-                start_date = get_min_date_crime_api(APP_TOKEN=APP_TOKEN)
-                end_date = get_max_date_crime_api(APP_TOKEN=APP_TOKEN)
-                date_ranges = _generate_date_ranges(start_date=start_date, end_date=end_date, days_delta=days_delta)
-                for date_range in date_ranges:
-                    start_time = date_range['start_time']
-                    end_time = date_range['end_time']
-
-                    pipeline_logging.logger.info(f"Extracting API data - {start_time} - {end_time}")
-                    crime_df = extract_crime_api(
-                        APP_TOKEN=APP_TOKEN, 
-                        column_name="date_of_occurrence",
-                        start_time=start_time, 
-                        end_time=end_time, 
-                        limit=limit
-                    )
-
-                    pipeline_logging.logger.info(f"Transforming API data - {start_time} - {end_time}")
-                    crime_df = transform_crime_data(df=crime_df)
-
-                    pipeline_logging.logger.info(f"Loading API data - {start_time} - {end_time}")
-                    crime_data = crime_df.where(pd.notnull(crime_df), None).to_dict(orient='records')
-                    load_data_to_postgres(chunksize=chunksize, data=crime_data, table=crime_table, engine=engine)
+                crime_table = runner.get_table(crime_table_name, lambda: create_crime_table(engine=engine, table_name=crime_table_name))
+                create_crime_table_indexes(crime_table_name=crime_table_name, engine=engine, logger=pipeline_logging.logger)
+                runner.first_time("crime_table_indexes")
+
+                create_crime_partitions(
+                    crime_table_name=crime_table_name, 
+                    engine=engine, 
+                    logger=pipeline_logging.logger, 
+                    start_date=datetime.strptime(date_ranges[0]['start_time'], '%Y-%m-%dT%H:%M:%S.%f'), 
+                    end_date=partitions_end_date)
+                runner.first_time(f"crime_partitions_{partitions_end_date:%Y_%m}")
+
+                pipeline_logging.logger.info(f"Backfilling {len(date_ranges)} windows with {max_workers} workers")
+                rows_loaded += backfill_crime_data(
+                    APP_TOKEN=APP_TOKEN,
+                    date_ranges=date_ranges,
+                    limit=limit,
+                    chunksize=chunksize,
+                    crime_table=crime_table,
+                    engine=engine,
+                    logger=pipeline_logging.logger,
+                    max_workers=max_workers,
+                    load_method=load_method,
+                    page_cache=page_cache,
+                    max_updated_at=max_updated_at,
+                    checkpoint_table=checkpoint_table,
+                    run_id=run_id,
+                    metrics=metrics,
+                    retention_start=retention_start,
+                    stop_event=runner.stop_event,
+                    rollup_table_name=rollup_table_name,
+                    crime_dictionary=runner.crime_dictionary,
+                    decode_executor=runner.decode_executor
+                )
+                runner.first_time("backfill_checkpoints") # all windows are complete once backfill_crime_data returns
             else:
+                if runner.first_time(f"crime_partitions_{partitions_end_date:%Y_%m}"):
+                    create_crime_partitions(
+                        crime_table_name=crime_table_name, 
+                        engine=engine, 
+                        logger=pipeline_logging.logger, 
+                        start_date=datetime.now(timezone.utc), 
+                        end_date=partitions_end_date)
+
                 pipeline_logging.logger.info("Crime table exists - Checking for new API updates")
                 max_api_str = get_max_update_time_crime_api(APP_TOKEN=APP_TOKEN)
                 max_table = get_max_update_time_crime_table(crime_table_name=crime_table_name, engine=engine)
                 max_api = datetime.strptime(max_api_str, '%Y-%m-%dT%H:%M:%S.%fZ')
                 
-                if max_api > max_table:
+                if max_table is None or max_api > max_table:
                     pipeline_logging.logger.info("New updates exist - Retrieving updated records from API")
 
-                    # Configuring parameters in correct format
-                    min_updated_at_val = max_table + timedelta(milliseconds=1) # ensure that new data does not overlap with current data
+                    # Configuring parameters in correct format (every update of the API when the crime table is empty)
+                    min_updated_at_val = max_table + timedelta(milliseconds=1) if max_table is not None else datetime(1970, 1, 1) # ensure that new data does not overlap with current data
                     start_time = min_updated_at_val.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
                     end_time = max_api_str[:-1]
 
-                    pipeline_logging.logger.info(f"Extracting API data - {start_time} - {end_time}")
-                    crime_df = extract_crime_api(
+                    crime_table = runner.get_table(crime_table_name, lambda: create_crime_table(engine=engine, table_name=crime_table_name)) # does not re-create crime table in this case but returns table information
+                    rows_loaded += load_crime_window(
                         APP_TOKEN=APP_TOKEN, 
                         column_name=":updated_at",
                         start_time=start_time, 
                         end_time=end_time, 
-                        limit=limit
+                        limit=limit,
+                        chunksize=chunksize,
+                        crime_table=crime_table,
+                        engine=engine,
+                        logger=pipeline_logging.logger,
+                        load_method=load_method,
+                        page_cache=page_cache,
+                        max_updated_at=max_api_str,
+                        metrics=metrics,
+                        delete_moved=True,
+                        retention_start=retention_start,
+                        rollup_table_name=rollup_table_name,
+                        crime_dictionary=runner.crime_dictionary,
+                        decode_executor=runner.decode_executor
                     )
-
-                    pipeline_logging.logger.info(f"Transforming API data - {start_time} - {end_time}")
-                    crime_df = transform_crime_data(df=crime_df)
-                    
-                    pipeline_logging.logger.info("Upserting new updates to crime table")
-                    crime_data = crime_df.where(pd.notnull(crime_df), None).to_dict(orient='records')
-                    crime_table = create_crime_table(engine=engine) # does not re-create crime table in this case but returns table information
-                    load_data_to_postgres(chunksize=chunksize, data=crime_data, table=crime_table, engine=engine)
                 else:
                     pipeline_logging.logger.info("No new records to upsert")
+
+                # Removing (or flagging) records that no longer exist in the API, every reconcile_every_runs runs
+                if reconcile_action and run_id % reconcile_every_runs == 0:
+                    rows_loaded += reconcile_crime_data(
+                        APP_TOKEN=APP_TOKEN,
+                        crime_table=runner.get_table(crime_table_name, lambda: create_crime_table(engine=engine, table_name=crime_table_name)),
+                        deletions_table=runner.get_table(deletions_table_name, lambda: create_crime_deletions_table(engine=engine, table_name=deletions_table_name)),
+                        engine=engine,
+                        logger=pipeline_logging.logger,
+                        run_id=run_id,
+                        action=reconcile_action,
+                        limit=reconcile_limit,
+                        max_missing_fraction=reconcile_max_missing_fraction,
+                        metrics=metrics,
+                        rollup_table_name=rollup_table_name
+                    )
                 
-            # Checking what views exist in database
-            pipeline_logging.logger.info("Inspecting database views")
-            inspector = inspect(engine)
-            
-            for sql_file in os.listdir(sql_folder_path):
-                view = sql_file.split(".")[0] # name of view to match the name of the sql file
-
-                if view not in inspector.get_view_names():
-                    pipeline_logging.logger.info(f"View {view} does not exist - Creating view")
-                    with open(f'{sql_folder_path}/{sql_file}', 'r') as f:
-                        sql_query = f.read()
-                        engine.execute(f"create view {view} as {sql_query};")
-                        pipeline_logging.logger.info(f"Successfully created view {view}")
-                else:
-                    pipeline_logging.logger.info(f"View {view} already exists in database")\
+            # Dropping (or detaching) partitions of months older than the retention period, once a month per runner
+            if partition_retention_months is not None and runner.first_time(f"crime_retention_{retention_start:%Y_%m}"):
+                rows_loaded += len(drop_expired_crime_partitions(
+                    crime_table_name=crime_table_name, 
+                    engine=engine, 
+                    logger=pipeline_logging.logger, 
+                    retention_months=partition_retention_months, 
+                    retention_action=partition_retention_action,
+                    rollup_table_name=rollup_table_name))
+
+            # Appending the records upserted since the last export to the local Parquet dataset (export_folder_path)
+            if runner.crime_export is not None:
+                pipeline_logging.logger.info("Exporting upserted records to Parquet")
+                with metrics.timer("export"):
+                    metrics.increment("rows_exported", runner.crime_export.export(
+                        crime_table=runner.get_table(crime_table_name, lambda: create_crime_table(engine=engine, table_name=crime_table_name)),
+                        engine=engine,
+                        logger=pipeline_logging.logger,
+                        run_id=run_id,
+                        batch_rows=config.get("export_batch_rows", 50000),
+                        table_run_id=engine.execute(select(func.min(checkpoint_table.c.run_id))).scalar()))
+
+            # Creating views that do not exist (or whose SQL changed) in database, once per runner
+            created_views = []
+            if runner.first_time("sql_views"):
+                pipeline_logging.logger.info("Inspecting database views")
+                created_views = deploy_sql_views(
+                    sql_folder_path=sql_folder_path, 
+                    engine=engine, 
+                    logger=pipeline_logging.logger, 
+                    materialized_views=materialized_views
+                )
+
+            # Refreshing materialized views that were not created in this run, only if rows were loaded
+            stale_views = [view for view in materialized_views if view not in created_views]
+            if rows_loaded == 0:
+                pipeline_logging.logger.info("No rows changed - Skipping materialized view refresh")
+            elif stale_views:
+                refresh_materialized_views(materialized_views=stale_views, engine=engine, logger=pipeline_logging.logger)
+
+            # Reporting index usage and size of crime table when it changed
+            if runner.first_time("index_usage") or rows_loaded > 0:
+                log_index_usage(table_name=crime_table_name, engine=engine, logger=pipeline_logging.logger)
 
             pipeline_end_time = time.time()
             pipeline_run_time = pipeline_end_time - pipeline_start_time
             pipeline_logging.logger.info(f"Pipeline finished in {pipeline_run_time} seconds")
             pipeline_logging.logger.info("Successful pipeline run")
+            metrics.set("run_seconds", pipeline_run_time)
+            write_run_metrics(
+                metrics=metrics, 
+                run_id=run_id, 
+                status="success", 
+                pipeline_name=pipeline_name, 
+                metrics_table=metrics_table, 
+                engine=engine, 
+                prometheus_textfile_path=prometheus_textfile_path)
             
             # Log pipeline successful run to logs table in postgres
             logs_data = create_logs_data(run_id=run_id, status="success", pipeline_name=pipeline_name, config=config, logs=pipeline_logging.get_logs())
             load_data_to_postgres(chunksize=chunksize, data=logs_data, table=logs_table, engine=engine)
-            pipeline_logging.logger.handlers.clear() # ensure logger handlers are cleared
 
     except BaseException as e:
         pipeline_logging.logger.error(f"Pipeline failed with exception {e}")
+        runner.reset_metadata() # the next run inspects the database again
+        write_run_metrics(
+            metrics=metrics, 
+            run_id=run_id, 
+            status="fail", 
+            pipeline_name=pipeline_name, 
+            metrics_table=metrics_table, 
+            engine=engine, 
+            prometheus_textfile_path=prometheus_textfile_path)
         logs_data = create_logs_data(run_id=run_id, status="fail", pipeline_name=pipeline_name, config=config, logs=pipeline_logging.get_logs())
         load_data_to_postgres(chunksize=chunksize, data=logs_data, table=logs_table, engine=engine)
-        pipeline_logging.logger.handlers.clear()
+
+    finally:
+        if owns_runner:
+            runner.close() # ensure logger handlers are removed and connections closed
 
 if __name__ == "__main__":
     load_dotenv()
@@ -709,12 +2921,5 @@ if __name__ == "__main__":
         with open(yaml_file_path) as yaml_file:
             pipeline_config = yaml.safe_load(yaml_file)
 
-    schedule.every(pipeline_config.get("schedule").get("run_seconds")).seconds.do(
-        run_pipeline_schedule,
-        pipeline_config=pipeline_config
-    )
-
-    while True:
-        schedule.run_pending()
-        time.sleep(pipeline_config.get("schedule").get("poll_seconds"))
+    PipelineRunner(pipeline_config=pipeline_config).run_forever()
     
\ No newline at end of file
@@ -1,4 +1,5 @@
 -- View which combines crime data with the date/calendar data to give us one table with both
+-- dictionary-encoded columns are read from their lookup tables
 SELECT
 	crime_id,
 	created_at,
@@ -28,5 +29,11 @@ SELECT
 	day_of_week,
 	holiday_name
 FROM crime_data c
+left join blocks using (block_id)
+left join iucr_codes using (iucr_id)
+left join primary_descriptions using (primary_description_id)
+left join secondary_descriptions using (secondary_description_id)
+left join location_descriptions using (location_description_id)
+left join fbi_codes using (fbi_cd_id)
 left join date d on
-	date(c.date_of_occurrence) = d.date
\ No newline at end of file
+	c.occurrence_date = d.date
\ No newline at end of file
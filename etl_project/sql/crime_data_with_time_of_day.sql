@@ -1,4 +1,5 @@
 -- View with new column with time of day information
+-- dictionary-encoded columns are read from their lookup tables
 SELECT
 	crime_id,
 	created_at,
@@ -20,11 +21,11 @@ SELECT
 	y_coordinate,
 	latitude,
 	longitude,
-	CASE
-		WHEN extract(hour from date_of_occurrence) >= 0 AND extract(hour from date_of_occurrence) < 6 THEN 'night'
-		WHEN extract(hour from date_of_occurrence) >= 6 AND extract(hour from date_of_occurrence) < 12 THEN 'morning'
-		WHEN extract(hour from date_of_occurrence) >= 12 AND extract(hour from date_of_occurrence) < 18 THEN 'afternoon'
-		WHEN extract(hour from date_of_occurrence) >= 18 AND extract(hour from date_of_occurrence) < 24 THEN 'evening'
-		ELSE 'unknown'
-	END AS time_of_day
-FROM crime_data
\ No newline at end of file
+	time_of_day -- stored by the pipeline (see transform_crime_data)
+FROM crime_data
+left join blocks using (block_id)
+left join iucr_codes using (iucr_id)
+left join primary_descriptions using (primary_description_id)
+left join secondary_descriptions using (secondary_description_id)
+left join location_descriptions using (location_description_id)
+left join fbi_codes using (fbi_cd_id)
\ No newline at end of file
@@ -1,18 +1,19 @@
 -- shows monthly crime growth (as percentage)
+-- reads the daily rollup of crime_data (crime_daily_rollup), so its cost depends on the number of groups, not of crimes
 with crimes_by_month as (
 	select 
-		count(c.crime_id) as crime_amount,
-		date_part('month',c.date_of_occurrence)  as calendar_month,
-		date_part('year',c.date_of_occurrence)  as calendar_year
+		sum(r.crime_count) as crime_amount,
+		date_part('month',r.occurrence_date)  as calendar_month,
+		date_part('year',r.occurrence_date)  as calendar_year
 	from 
-		crime_data c
+		crime_daily_rollup r
 	inner join 
 		date d
 	on 
-		date(c.date_of_occurrence)=d.date
+		r.occurrence_date=d.date
 	group by
-		date_part('month',c.date_of_occurrence), 
-		date_part('year',c.date_of_occurrence)
+		date_part('month',r.occurrence_date), 
+		date_part('year',r.occurrence_date)
 ),
 lag_crimes_by_month as (
 	select
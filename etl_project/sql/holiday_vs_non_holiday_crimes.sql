@@ -1,17 +1,18 @@
 -- shows the average amount of crimes committed on a holiday date vs a non-holiday date
+-- reads the daily rollup of crime_data (crime_daily_rollup), so its cost depends on the number of groups, not of crimes
 with crimes_by_day as (
 	select 
-		count(c.crime_id) as crimes_amount, 
+		sum(r.crime_count) as crimes_amount, 
 		d.date as calendar_date,
 		(case when d.holiday_name is not null
 			then 'Y' else 'N'
 		end) as holiday
 	from 
-		crime_data c
+		crime_daily_rollup r
 	inner join 
 		date d
 	on 
-		date(c.date_of_occurrence)=d.date
+		r.occurrence_date=d.date
 	group by 
 		calendar_date, 
 		holiday
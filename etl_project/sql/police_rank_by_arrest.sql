@@ -1,4 +1,5 @@
 -- rank police districts based on successful arrest ratio
+-- reads the daily rollup of crime_data (crime_daily_rollup), so its cost depends on the number of groups, not of crimes
 with arrest_count as (
 	select 
 		p.district,
@@ -6,29 +7,29 @@ with arrest_count as (
 		p.address,
 		p.zip,
 		p.phone,
-		count(c.crime_id) as total_arrests
+		sum(r.arrest_count) as total_arrests
 	from 
 		police_stations p
 	inner join 
-		crime_data c
+		crime_daily_rollup r
 	on 
-		p.district =  cast(floor(c.beat/100.0) as varchar)
-	where
-		c.arrest='Y'
+		p.district = r.district
 	group by
 		p.district
+	having
+		sum(r.arrest_count) > 0
     -- limit 5
 ),
 total_count as (
 	select 
 		p.district,
-		count(c.crime_id) as total_crimes
+		sum(r.crime_count) as total_crimes
 	from 
 		police_stations p
 	inner join 
-		crime_data c
+		crime_daily_rollup r
 	on 
-		p.district =  cast(floor(c.beat/100.0) as varchar)
+		p.district = r.district
 	group by
 		p.district
     -- limit 5
@@ -1,39 +1,45 @@
 -- shows two of the most popular crime types, crime amount totals, and the rank in total crimes for each ward (legislative district)
+-- reads the daily rollup of crime_data (crime_daily_rollup), so its cost depends on the number of groups, not of crimes
 with dist_popular_crimes as (
 	select distinct
 		w.ward,
 		w.alderman,
-		first_value(c.primary_description) over(
+		first_value(p.primary_description) over(
 			partition by w.ward
-			order by count(c.crime_id) desc
+			order by sum(r.crime_count) desc
 			rows between unbounded preceding and unbounded following
 			) as most_popular_crime,
-		nth_value(c.primary_description, 2) over(
+		nth_value(p.primary_description, 2) over(
 			partition by w.ward
-			order by count(c.crime_id) desc
+			order by sum(r.crime_count) desc
 			rows between unbounded preceding and unbounded following
 			) as second_most_popular_crime
 	from 
 		ward_offices w
 	inner join 
-		crime_data c 
+		crime_daily_rollup r 
 	on 
-		c.ward=w.ward
+		r.ward=w.ward
+	left join
+		primary_descriptions p
+	on
+		p.primary_description_id=r.primary_description_id
 	group by
 		w.ward,
-		c.primary_description
+		r.primary_description_id,
+		p.primary_description
 ),
 dist_total_crimes as (
 	select 
 		w.ward,
-		count(c.crime_id) as total_crimes,
-		dense_rank() over(order by count(c.crime_id) desc) as total_crimes_rank
+		sum(r.crime_count) as total_crimes,
+		dense_rank() over(order by sum(r.crime_count) desc) as total_crimes_rank
 	from 
-		crime_data c
+		crime_daily_rollup r
 	inner join
 		ward_offices w
 	on 
-		c.ward=w.ward
+		r.ward=w.ward
 	group by
 		w.ward	
 )
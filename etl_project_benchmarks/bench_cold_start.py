@@ -0,0 +1,134 @@
+"""
+Measures the cold start of one-shot runs: the wall time of a fresh Python process per command of etl_project.cli,
+including interpreter start-up and imports, as an ECS scheduled task would run it.
+
+The Chicago crimes API is replaced by FakeSocrataServer (passed to the processes with CRIME_API_URL) and the runs
+load a scratch database on the Postgres server given by the pipeline's environment variables (.env), which is dropped afterwards.
+Import of etl_project.pipeline and a one-shot run_pipeline_schedule without the CLI are measured for comparison.
+
+Usage example:
+    python -m etl_project_benchmarks.bench_cold_start --rows 5000 --repeats 5 --output bench_cold_start.json
+"""
+from etl_project import pipeline
+from etl_project_benchmarks.fake_socrata import FakeSocrataServer
+from dotenv import load_dotenv
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import json
+import os
+import platform
+import requests
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import yaml
+
+def time_command(command:list[str], env:dict, repeats:int, before_each=None) -> dict:
+    """
+    Runs command repeats times in a fresh process and returns the exit code of the last run and the min/median wall time.
+    """
+    wall_seconds = []
+    for _ in range(repeats):
+        if before_each is not None:
+            before_each()
+        start_time = time.perf_counter()
+        completed = subprocess.run(command, env=env, cwd=Path(pipeline.__file__).parent.parent, capture_output=True, text=True)
+        wall_seconds.append(time.perf_counter() - start_time)
+    return {
+        "exit_code": completed.returncode,
+        "runs": repeats,
+        "min_seconds": round(min(wall_seconds), 3),
+        "median_seconds": round(statistics.median(wall_seconds), 3),
+    }
+
+def run_benchmark(rows:int, repeats:int, pipeline_config:dict) -> list[dict]:
+    """
+    Backfills rows records with the CLI, then times every command, each in a fresh process.
+    """
+    server = FakeSocrataServer(rows=rows)
+    server.start()
+    admin_engine = pipeline.create_postgres_connection(
+        username=os.environ.get("DB_USERNAME"),
+        password=os.environ.get("DB_PASSWORD"),
+        host=os.environ.get("SERVER_NAME"),
+        port=os.environ.get("PORT"),
+        database=os.environ.get("DATABASE_NAME")).execution_options(isolation_level="AUTOCOMMIT")
+    bench_database = f"crime_cold_start_{os.getpid()}"
+    admin_engine.execute(f"create database {bench_database}")
+
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as temp_folder:
+            pipeline_config["config"]["log_folder_path"] = temp_folder
+            pipeline_config["config"]["cache_folder_path"] = f"{temp_folder}/cache"
+            if pipeline_config["config"].get("export_folder_path"):
+                pipeline_config["config"]["export_folder_path"] = f"{temp_folder}/export"
+            config_path = f"{temp_folder}/pipeline.yaml"
+            with open(config_path, "w") as config_file:
+                yaml.safe_dump(pipeline_config, config_file)
+            env = {**os.environ, "DATABASE_NAME": bench_database, "CRIME_API_URL": server.url}
+            cli = [sys.executable, "-m", "etl_project.cli", "--config", config_path]
+
+            def add_updates():
+                requests.post(server.url.replace("/resource/x2n5-8w5q.json", "/_bench/update?rows=100&changed=100"))
+
+            commands = [
+                ("import etl_project.pipeline", [sys.executable, "-c", "import etl_project.pipeline"], 1, None),
+                ("cli backfill", [*cli, "backfill"], 1, None),
+                ("cli backfill (nothing to backfill)", [*cli, "backfill"], repeats, None),
+                ("cli once (no updates)", [*cli, "once"], repeats, None),
+                ("cli incremental (no updates)", [*cli, "incremental"], repeats, None),
+                ("run_pipeline_schedule without cli (no updates)", [sys.executable, "-c",
+                    "import yaml; from etl_project import pipeline; "
+                    f"pipeline.run_pipeline_schedule(pipeline_config=yaml.safe_load(open({config_path!r})))"], repeats, None),
+                ("cli incremental (100 new, 100 changed records)", [*cli, "incremental"], repeats, add_updates),
+                ("cli refresh-views", [*cli, "refresh-views"], repeats, None),
+            ]
+            for mode, command, command_repeats, before_each in commands:
+                result = {"rows": rows, "mode": mode, **time_command(command=command, env=env, repeats=command_repeats, before_each=before_each)}
+                print(json.dumps(result))
+                results.append(result)
+    finally:
+        admin_engine.execute(f"drop database if exists {bench_database} with (force)")
+        server.stop()
+    return results
+
+def main(argv:list[str]=None) -> None:
+    """
+    Parses the command line (argv, defaults to sys.argv) and runs the benchmark.
+    """
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Measure the cold start of each command of etl_project.cli against a local fake API.")
+    parser.add_argument("--rows", type=int, default=5000, help="records in the fake API")
+    parser.add_argument("--repeats", type=int, default=5, help="runs of each command")
+    parser.add_argument("--config", default=str(Path(pipeline.__file__).with_suffix(".yaml")), help="pipeline YAML file")
+    parser.add_argument("--set", nargs="*", default=[], metavar="KEY=VALUE", help="override config values, e.g. max_workers=8")
+    parser.add_argument("--output", default="bench_cold_start.json", help="path of the JSON file to write results to")
+    args = parser.parse_args(argv)
+
+    with open(args.config) as yaml_file:
+        pipeline_config = yaml.safe_load(yaml_file)
+    pipeline_config["config"].update({
+        "use_cache": False,
+        "partition_retention_months": None, # the fake records are from 2023
+        "reconcile_action": None, # so every run without updates can be skipped
+    })
+    for override in args.set:
+        key, value = override.split("=", 1)
+        pipeline_config["config"][key] = yaml.safe_load(value)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": pipeline_config["config"],
+        "results": run_benchmark(rows=args.rows, repeats=args.repeats, pipeline_config=pipeline_config),
+    }
+    with open(args.output, "w") as output_file:
+        json.dump(report, output_file, indent=2, default=str)
+
+if __name__ == "__main__":
+    main()
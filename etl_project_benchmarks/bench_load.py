@@ -0,0 +1,135 @@
+"""
+Benchmarks load_data_to_postgres with load_method "insert" against "copy".
+
+Each size is loaded twice into a scratch crime table: once into the empty table (all inserts) 
+and once more with the same records (all conflicts, i.e. updates). The scratch table is dropped afterwards.
+
+Usage example:
+    python -m etl_project_benchmarks.bench_load --rows 10000 100000 1000000 --output bench_load.json
+
+Database credentials are read from the same environment variables (.env) as the pipeline.
+"""
+from etl_project.pipeline import create_postgres_connection, create_crime_table, create_crime_partitions, load_data_to_postgres
+from dotenv import load_dotenv
+from datetime import datetime, timedelta
+import argparse
+import json
+import logging
+import os
+import random
+import time
+
+def generate_crime_records(start:int, stop:int, seed:int=0) -> list[dict]:
+    """
+    Returns synthetic records shaped like the output of transform_crime_data encoded by CrimeDictionary (codes of the lookup 
+    tables instead of text), with crime_id row-{start} to row-{stop - 1}.
+    """
+    rnd = random.Random(seed + start)
+    first_date = datetime(2023, 1, 1)
+    records = []
+    for i in range(start, stop):
+        occurrence = first_date + timedelta(minutes=rnd.randrange(0, 365 * 24 * 60))
+        beat = rnd.choice([111, 733, 1024, 2533])
+        records.append({
+            "crime_id": f"row-{i:010d}",
+            "created_at": "2023-11-14T11:02:01.256Z",
+            "updated_at": "2023-11-14T11:02:11.508Z",
+            "version": f"rv-{i}",
+            "case": f"JG{i:06d}",
+            "date_of_occurrence": occurrence.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3],
+            "block_id": rnd.randrange(1, 1000),
+            "iucr_id": rnd.randrange(1, 5),
+            "primary_description_id": rnd.randrange(1, 5),
+            "secondary_description_id": 1,
+            "location_description_id": 1,
+            "arrest": rnd.choice(["Y", "N"]),
+            "domestic": "N",
+            "beat": str(beat),
+            "ward": str(rnd.randrange(1, 51)),
+            "fbi_cd_id": 1,
+            "x_coordinate": "1170859",
+            "y_coordinate": "1858203",
+            "latitude": "41.76638357",
+            "longitude": "-87.649296327",
+            "district": str(beat // 100),
+            "occurrence_date": occurrence.date().isoformat(),
+            "hour": occurrence.hour,
+            "time_of_day": ["night", "morning", "afternoon", "evening"][occurrence.hour // 6],
+            "nearest_station": "6",
+            "station_distance": 5372.5,
+            "grid_cell": 11701858,
+        })
+    return records
+
+def time_load(rows:int, batch_rows:int, chunksize:int, table, engine, load_method:str) -> float:
+    """
+    Returns seconds spent in load_data_to_postgres loading rows records, generated batch_rows at a time (generation is not timed).
+    """
+    elapsed = 0.0
+    for start in range(0, rows, batch_rows):
+        data = generate_crime_records(start=start, stop=min(start + batch_rows, rows))
+        begin = time.perf_counter()
+        load_data_to_postgres(chunksize=chunksize, data=data, table=table, engine=engine, load_method=load_method)
+        elapsed += time.perf_counter() - begin
+    return elapsed
+
+def run_benchmark(rows_list:list[int], load_methods:list[str], chunksize:int, batch_rows:int, table_name:str) -> list[dict]:
+    engine = create_postgres_connection(
+        username=os.environ.get("DB_USERNAME"),
+        password=os.environ.get("DB_PASSWORD"),
+        host=os.environ.get("SERVER_NAME"),
+        port=os.environ.get("PORT"),
+        database=os.environ.get("DATABASE_NAME"))
+
+    results = []
+    for rows in rows_list:
+        for load_method in load_methods:
+            engine.execute(f"drop table if exists {table_name}")
+            table = create_crime_table(engine=engine, table_name=table_name)
+            create_crime_partitions(crime_table_name=table_name, engine=engine, logger=logging.getLogger(__name__), start_date=datetime(2023, 1, 1), end_date=datetime(2023, 12, 31))
+            try:
+                for phase in ["insert", "update"]:
+                    seconds = time_load(rows=rows, batch_rows=batch_rows, chunksize=chunksize, table=table, engine=engine, load_method=load_method)
+                    result = {
+                        "rows": rows,
+                        "load_method": load_method,
+                        "phase": phase,
+                        "chunksize": chunksize,
+                        "seconds": round(seconds, 3),
+                        "rows_per_second": round(rows / seconds, 1),
+                    }
+                    print(json.dumps(result))
+                    results.append(result)
+            finally:
+                engine.execute(f"drop table if exists {table_name}")
+    return results
+
+def main(argv:list[str]=None) -> None:
+    """
+    Parses the command line (argv, defaults to sys.argv) and runs the benchmark.
+    """
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Compare insert and copy upserts in load_data_to_postgres.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--load-methods", nargs="+", default=["insert", "copy"])
+    parser.add_argument("--chunksize", type=int, default=1000)
+    parser.add_argument("--batch-rows", type=int, default=10_000, help="records passed to each load_data_to_postgres call")
+    parser.add_argument("--table-name", default="bench_crime_data")
+    parser.add_argument("--output", help="path of the JSON file to write results to")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(
+        rows_list=args.rows, 
+        load_methods=args.load_methods, 
+        chunksize=args.chunksize, 
+        batch_rows=args.batch_rows, 
+        table_name=args.table_name
+    )
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Offline end-to-end benchmark of the pipeline: a full backfill followed by an incremental run, at several dataset sizes.
+
+The Chicago crimes API is replaced by FakeSocrataServer (etl_project_benchmarks/fake_socrata.py) and every size is 
+loaded into its own scratch database on the Postgres server given by the pipeline's environment variables (.env), 
+which is dropped afterwards. Each size runs in a fresh process so that peak memory is measured per size.
+
+Reported per run: wall time, time spent in each stage (extract, transform, load; summed over worker threads), 
+rows loaded, rows per second, pages fetched, compressed API bytes per record, page decode throughput (pages and MB of JSON per second of decode time, 
+summed over decode workers) and peak RSS of the process.
+
+Usage example:
+    python -m etl_project_benchmarks.bench_pipeline --rows 10000 50000 200000 --output bench_pipeline.json
+"""
+from etl_project import api_client, pipeline
+from etl_project_benchmarks.fake_socrata import FakeSocrataServer
+from dotenv import load_dotenv
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import requests
+import resource
+import tempfile
+import threading
+import time
+import yaml
+
+class StageTimer:
+    """
+    Wraps extract_crime_api_pages, transform_crime_data and load_data_to_postgres in etl_project.pipeline 
+    to add up the time spent in each stage, the pages fetched and the crime rows loaded.
+    """
+    def __init__(self, crime_table_name:str):
+        self.crime_table_name = crime_table_name
+        self._lock = threading.Lock()
+        self.reset()
+        extract, transform, load = pipeline.extract_crime_api_pages, pipeline.transform_crime_data, pipeline.load_data_to_postgres
+
+        def timed_extract(*args, **kwargs):
+            pages = extract(*args, **kwargs)
+            while True:
+                start_time = time.perf_counter()
+                page_df = next(pages, None)
+                self.add("extract", time.perf_counter() - start_time)
+                if page_df is None:
+                    return
+                self.add("pages", 1)
+                yield page_df
+
+        def timed_transform(*args, **kwargs):
+            start_time = time.perf_counter()
+            df = transform(*args, **kwargs)
+            self.add("transform", time.perf_counter() - start_time)
+            return df
+
+        def timed_load(*args, **kwargs):
+            start_time = time.perf_counter()
+            row_counts = load(*args, **kwargs)
+            if kwargs["table"].name == self.crime_table_name:
+                self.add("load", time.perf_counter() - start_time)
+                self.add("rows", len(kwargs["data"]))
+            return row_counts
+
+        pipeline.extract_crime_api_pages = timed_extract
+        pipeline.transform_crime_data = timed_transform
+        pipeline.load_data_to_postgres = timed_load
+
+    def reset(self) -> None:
+        self.totals = {"extract": 0.0, "transform": 0.0, "load": 0.0, "pages": 0, "rows": 0}
+
+    def add(self, key:str, value) -> None:
+        with self._lock:
+            self.totals[key] += value
+
+def run_pipeline_timed(pipeline_config:dict, stage_timer:StageTimer, engine) -> dict:
+    """
+    Runs the pipeline once and returns its timings.
+    """
+    stage_timer.reset()
+    start_time = time.perf_counter()
+    pipeline.run_pipeline_schedule(pipeline_config=pipeline_config)
+    wall_seconds = time.perf_counter() - start_time
+    status = engine.execute(f"select status from {pipeline_config['config']['logs_table_name']} order by run_id desc, timestamp desc limit 1").scalar()
+    run_metrics = dict(engine.execute(
+        f"select metric_name, value from {pipeline_config['config']['metrics_table_name']} "
+        f"where scope = 'run' and run_id = (select max(run_id) from {pipeline_config['config']['metrics_table_name']})").fetchall())
+    decode_seconds = run_metrics.get("decode_seconds", 0.0) # summed over decode workers
+    totals = dict(stage_timer.totals)
+    return {
+        "status": status,
+        "wall_seconds": round(wall_seconds, 3),
+        "stage_seconds": {stage: round(totals[stage], 3) for stage in ["extract", "transform", "load"]},
+        "rows_loaded": totals["rows"],
+        "rows_per_second": round(totals["rows"] / wall_seconds, 1),
+        "pages": totals["pages"],
+        "http_bytes_per_row": round(run_metrics.get("http_bytes", 0) / run_metrics["rows_extracted"], 1) if run_metrics.get("rows_extracted") else None, # compressed
+        "decode_pages_per_second": round(run_metrics.get("pages_decoded", 0) / decode_seconds, 1) if decode_seconds else None,
+        "decode_mb_per_second": round(run_metrics.get("decode_bytes", 0) / 2**20 / decode_seconds, 1) if decode_seconds else None,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1), # peak of the process so far
+    }
+
+def benchmark_size(rows:int, incremental_rows:int, changed_rows:int, pipeline_config:dict) -> list[dict]:
+    """
+    Backfills a dataset of rows records into a scratch database, then runs one incremental run after 
+    incremental_rows records were added and changed_rows records were updated. Runs in its own process.
+    """
+    server = FakeSocrataServer(rows=rows)
+    api_client.CRIME_API_URL = server.start()
+    stage_timer = StageTimer(crime_table_name=pipeline_config["config"]["crime_table_name"])
+
+    admin_engine = pipeline.create_postgres_connection(
+        username=os.environ.get("DB_USERNAME"),
+        password=os.environ.get("DB_PASSWORD"),
+        host=os.environ.get("SERVER_NAME"),
+        port=os.environ.get("PORT"),
+        database=os.environ.get("DATABASE_NAME")).execution_options(isolation_level="AUTOCOMMIT")
+    bench_database = f"crime_bench_{rows}_{os.getpid()}"
+    admin_engine.execute(f"create database {bench_database}")
+    os.environ["DATABASE_NAME"] = bench_database
+    engine = pipeline.create_postgres_connection(
+        username=os.environ.get("DB_USERNAME"),
+        password=os.environ.get("DB_PASSWORD"),
+        host=os.environ.get("SERVER_NAME"),
+        port=os.environ.get("PORT"),
+        database=bench_database)
+
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as temp_folder:
+            pipeline_config["config"]["log_folder_path"] = temp_folder
+            pipeline_config["config"]["cache_folder_path"] = f"{temp_folder}/cache"
+            if pipeline_config["config"].get("export_folder_path"):
+                pipeline_config["config"]["export_folder_path"] = f"{temp_folder}/export"
+
+            backfill = run_pipeline_timed(pipeline_config=pipeline_config, stage_timer=stage_timer, engine=engine)
+            results.append({"rows": rows, "mode": "backfill", **backfill})
+
+            requests.post(server.url.replace("/resource/x2n5-8w5q.json", f"/_bench/update?rows={incremental_rows}&changed={changed_rows}"))
+            incremental = run_pipeline_timed(pipeline_config=pipeline_config, stage_timer=stage_timer, engine=engine)
+            results.append({"rows": rows, "mode": "incremental", **incremental})
+    finally:
+        engine.dispose()
+        admin_engine.execute(f"drop database if exists {bench_database} with (force)")
+        server.stop()
+    return results
+
+def _benchmark_size_process(result_queue, **kwargs) -> None:
+    result_queue.put(benchmark_size(**kwargs))
+
+def main(argv:list[str]=None) -> None:
+    """
+    Parses the command line (argv, defaults to sys.argv) and runs the benchmark.
+    """
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Run a backfill and an incremental run against a local fake API at several dataset sizes.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 50_000, 200_000])
+    parser.add_argument("--incremental-rows", type=int, default=1000, help="records added before the incremental run")
+    parser.add_argument("--changed-rows", type=int, default=1000, help="records updated before the incremental run")
+    parser.add_argument("--config", default=str(Path(pipeline.__file__).with_suffix(".yaml")), help="pipeline YAML file")
+    parser.add_argument("--set", nargs="*", default=[], metavar="KEY=VALUE", help="override config values, e.g. max_workers=8 use_cache=false")
+    parser.add_argument("--output", default="bench_pipeline.json", help="path of the JSON file to write results to")
+    args = parser.parse_args(argv)
+
+    with open(args.config) as yaml_file:
+        pipeline_config = yaml.safe_load(yaml_file)
+    pipeline_config["config"]["use_cache"] = False # measure the API path, not replays from disk
+    pipeline_config["config"]["api_requests_per_second"] = None # the local fake API is not rate limited
+    for override in args.set:
+        key, value = override.split("=", 1)
+        pipeline_config["config"][key] = yaml.safe_load(value)
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for rows in args.rows:
+        # a plain (non-daemon) process, since the fake API server runs in a child process of its own
+        result_queue = context.Queue()
+        process = context.Process(target=_benchmark_size_process, args=(result_queue,), kwargs={
+            "rows": rows, 
+            "incremental_rows": args.incremental_rows, 
+            "changed_rows": args.changed_rows, 
+            "pipeline_config": pipeline_config
+        })
+        process.start()
+        results.extend(result_queue.get())
+        process.join()
+        for result in results[-2:]:
+            print(json.dumps(result))
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": pipeline_config["config"],
+        "results": results,
+    }
+    with open(args.output, "w") as output_file:
+        json.dump(report, output_file, indent=2, default=str)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Local stand-in for the Socrata endpoint of the Chicago crimes dataset, serving synthetic crime records.
+
+Supports the subset of SoQL used by the pipeline: 
+    $select=min(date_of_occurrence) / max(date_of_occurrence) / max(:updated_at) / :*,* / a list of fields (e.g. :id,:version)
+    $select=date_trunc_ymd(date_of_occurrence) as day, count(*) as row_count&$group=day (per-day counts)
+    $where=<date_of_occurrence or :updated_at> between '<start>' and '<end>' [and :id > '<last id>']
+    $order=:id, $limit, $offset
+Responses are gzip-compressed when requested. POST /_bench/update?rows=N&changed=M appends N new records and 
+updates M existing ones (new :updated_at), to simulate new updates between two incremental runs.
+
+Usage example:
+    server = FakeSocrataServer(rows=100_000)
+    server.start()
+    api_client.CRIME_API_URL = server.url
+    ...
+    server.stop()
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from datetime import datetime, timedelta
+import bisect
+import gzip
+import json
+import multiprocessing
+import random
+import re
+
+WHERE_PATTERN = re.compile(r"^(\S+) between '([^']+)' and '([^']+)'(?: and :id > '([^']+)')?$")
+AGGREGATE_PATTERN = re.compile(r"^(min|max)\((\S+)\)$")
+DAILY_COUNT_PATTERN = re.compile(r"^date_trunc_ymd\((\S+)\) as (\w+), count\(\*\) as (\w+)$")
+FIRST_OCCURRENCE = datetime(2023, 1, 1)
+FIRST_UPDATE = datetime(2024, 1, 1)
+
+def _timestamp(value:datetime) -> str:
+    return value.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
+
+def generate_crime_record(i:int, rnd:random.Random, updated_at:datetime) -> dict:
+    """
+    Returns one synthetic record in the format of the API ($select=:*,*), with :id row-{i}. 
+    Like the real API, fields without a value (about 1 in 20 wards) are left out of the record.
+    """
+    occurrence = FIRST_OCCURRENCE + timedelta(minutes=rnd.randrange(0, 365 * 24 * 60))
+    latitude = f"{41.65 + rnd.random() * 0.35:.8f}"
+    longitude = f"{-87.85 + rnd.random() * 0.3:.8f}"
+    record = {
+        ":id": f"row-{i:010d}",
+        ":created_at": _timestamp(updated_at) + "Z",
+        ":updated_at": _timestamp(updated_at) + "Z",
+        ":version": f"rv-{i}-{rnd.randrange(10**6)}",
+        ":@computed_region_awaf_s7ux": str(rnd.randrange(1, 60)),
+        ":@computed_region_6mkv_f3dw": str(rnd.randrange(4000, 30000)),
+        ":@computed_region_vrxf_vc4k": str(rnd.randrange(1, 80)),
+        ":@computed_region_bdys_3d7i": str(rnd.randrange(1, 800)),
+        ":@computed_region_43wa_7qmu": str(rnd.randrange(1, 60)),
+        ":@computed_region_rpca_8um6": str(rnd.randrange(1, 60)),
+        "case_": f"JG{i:07d}",
+        "date_of_occurrence": _timestamp(occurrence),
+        "block": f"0{rnd.randrange(10, 99)}XX S {rnd.choice(['MORGAN', 'STATE', 'HALSTED', 'ASHLAND'])} ST",
+        "_iucr": rnd.choice(["0486", "0820", "1310", "0560", "0460"]),
+        "_primary_decsription": rnd.choice(["THEFT", "BATTERY", "CRIMINAL DAMAGE", "ASSAULT", "MOTOR VEHICLE THEFT"]),
+        "_secondary_description": rnd.choice(["SIMPLE", "TO PROPERTY", "$500 AND UNDER", "DOMESTIC BATTERY SIMPLE"]),
+        "_location_description": rnd.choice(["STREET", "APARTMENT", "RESIDENCE", "SIDEWALK"]),
+        "arrest": rnd.choice(["Y", "N", "N", "N"]),
+        "domestic": rnd.choice(["Y", "N", "N"]),
+        "beat": str(rnd.choice([111, 122, 214, 733, 1024, 1533, 2533])),
+        "ward": str(rnd.randrange(1, 51)),
+        "fbi_cd": rnd.choice(["06", "08B", "14", "04B"]),
+        "x_coordinate": str(rnd.randrange(1100000, 1200000)),
+        "y_coordinate": str(rnd.randrange(1800000, 1950000)),
+        "latitude": latitude,
+        "longitude": longitude,
+        "location": {"latitude": latitude, "longitude": longitude, "human_address": "{\"address\": \"\", \"city\": \"\", \"state\": \"\", \"zip\": \"\"}"},
+    }
+    if rnd.random() < 0.05:
+        del record["ward"]
+    return record
+
+class CrimeDataset:
+    """
+    In-memory synthetic dataset with sorted indexes on date_of_occurrence and :updated_at, so a window lookup is a bisect.
+    """
+    def __init__(self, rows:int, seed:int=0):
+        self.rnd = random.Random(seed)
+        self.records = {}
+        for i in range(rows):
+            self.records[i] = generate_crime_record(i=i, rnd=self.rnd, updated_at=FIRST_UPDATE + timedelta(seconds=i))
+        self.next_id = rows
+        self.last_update = FIRST_UPDATE + timedelta(seconds=rows)
+        self._build_indexes()
+
+    def _build_indexes(self) -> None:
+        self.indexes = {}
+        for column_name in ["date_of_occurrence", ":updated_at"]:
+            keys = sorted((record[column_name][:23], record[":id"], i) for i, record in self.records.items())
+            self.indexes[column_name] = ([key[0] for key in keys], keys)
+        self._window_cache = {}
+
+    def update(self, new_rows:int, changed_rows:int) -> None:
+        for _ in range(new_rows):
+            self.last_update += timedelta(seconds=1)
+            self.records[self.next_id] = generate_crime_record(i=self.next_id, rnd=self.rnd, updated_at=self.last_update)
+            self.next_id += 1
+        for i in self.rnd.sample(range(self.next_id - new_rows), min(changed_rows, self.next_id - new_rows)):
+            self.last_update += timedelta(seconds=1)
+            record = self.records[i]
+            record[":updated_at"] = _timestamp(self.last_update) + "Z"
+            record[":version"] = f"rv-{i}-{self.rnd.randrange(10**6)}"
+            record["arrest"] = "Y"
+        self._build_indexes()
+
+    def window(self, column_name:str, start:str, end:str) -> tuple[list[str], list[int]]:
+        """
+        Returns the :id values (sorted) and record keys of the records with column_name between start and end.
+        """
+        cache_key = (column_name, start, end)
+        if cache_key not in self._window_cache:
+            values, keys = self.indexes[column_name]
+            selected = sorted((key[1], key[2]) for key in keys[bisect.bisect_left(values, start):bisect.bisect_right(values, end)])
+            self._window_cache = {cache_key: ([key[0] for key in selected], [key[1] for key in selected])}
+        return self._window_cache[cache_key]
+
+    def query(self, params:dict[str, str]) -> list[dict]:
+        select = params.get("$select", ":*,*")
+        aggregate = AGGREGATE_PATTERN.match(select)
+        if aggregate:
+            function, column_name = aggregate.groups()
+            values = [record[column_name] for record in self.records.values()]
+            return [{f"{function}_{column_name.lstrip(':')}": min(values) if function == "min" else max(values)}]
+        daily_count = DAILY_COUNT_PATTERN.match(select)
+        if daily_count:
+            column_name, day_alias, count_alias = daily_count.groups()
+            counts = {}
+            for record in self.records.values():
+                day = record[column_name][:10] + "T00:00:00.000"
+                counts[day] = counts.get(day, 0) + 1
+            return [{day_alias: day, count_alias: str(count)} for day, count in sorted(counts.items())]
+
+        where = WHERE_PATTERN.match(params["$where"])
+        if where is None:
+            raise ValueError(f"Unsupported $where {params['$where']}")
+        column_name, start, end, last_id = where.groups()
+        ids, keys = self.window(column_name=column_name, start=start, end=end)
+        first = bisect.bisect_right(ids, last_id) if last_id else 0
+        first += int(params.get("$offset", 0))
+        limit = int(params.get("$limit", 1000))
+        records = [self.records[key] for key in keys[first:first + limit]]
+        if select != ":*,*":
+            fields = select.split(",")
+            records = [{field: record[field] for field in fields if field in record} for record in records]
+        return records
+
+def _make_handler(dataset:CrimeDataset):
+    class FakeSocrataHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1" # keep-alive, like the real API
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status:int, payload) -> None:
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            if "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = gzip.compress(body, compresslevel=1)
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            params = {key: values[0] for key, values in parse_qs(urlsplit(self.path).query).items()}
+            try:
+                self._send(200, dataset.query(params))
+            except (KeyError, ValueError) as e:
+                self._send(400, {"error": True, "message": str(e)})
+
+        def do_POST(self):
+            params = {key: values[0] for key, values in parse_qs(urlsplit(self.path).query).items()}
+            dataset.update(new_rows=int(params.get("rows", 0)), changed_rows=int(params.get("changed", 0)))
+            self._send(200, {"rows": len(dataset.records)})
+
+    return FakeSocrataHandler
+
+def _serve(rows:int, seed:int, port_queue) -> None:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(CrimeDataset(rows=rows, seed=seed)))
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+class FakeSocrataServer:
+    """
+    Runs the fake endpoint in its own process (so serving pages does not compete with the pipeline for the GIL).
+
+    Args:
+        rows: provide an int for the number of synthetic records in the dataset.
+        seed: provide an int for the random seed of the synthetic records.
+    """
+    def __init__(self, rows:int, seed:int=0):
+        self.rows = rows
+        self.seed = seed
+        self.process = None
+        self.url = None
+
+    def start(self) -> str:
+        context = multiprocessing.get_context("spawn")
+        port_queue = context.Queue()
+        self.process = context.Process(target=_serve, args=(self.rows, self.seed, port_queue), daemon=True)
+        self.process.start()
+        port = port_queue.get(timeout=600)
+        self.url = f"http://127.0.0.1:{port}/resource/x2n5-8w5q.json"
+        return self.url
+
+    def stop(self) -> None:
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
@@ -0,0 +1,27 @@
+from etl_project.partitions import add_months, month_partition_suffix
+from datetime import datetime
+import subprocess
+import sys
+
+def test_cli_import_is_lightweight():
+    check_imports = "import sys, etl_project.cli; print(' '.join(module for module in ['pandas', 'sqlalchemy', 'pyarrow', 'schedule'] if module in sys.modules))"
+    imported = subprocess.run([sys.executable, "-c", check_imports], capture_output=True, text=True, check=True).stdout.strip()
+    assert imported == "" # heavy modules are only imported once a run has work to do
+
+def test_month_partition_suffix():
+    assert [month_partition_suffix(add_months(month_start=datetime(2023, 11, 15), months=months)) for months in range(4)] == ["p2023_11", "p2023_12", "p2024_01", "p2024_02"]
+    assert add_months(month_start=datetime(2024, 1, 31), months=-13) == datetime(2022, 12, 1)
+
+class FakeConnection:
+    def __init__(self, results):
+        self.results = results # first result of the queries containing each key
+
+    def run(self, query, **params):
+        return next(result for key, result in self.results.items() if key in query)
+
+def test_get_pending_work_backfills_empty_crime_table_without_checkpoints():
+    from etl_project.cli import get_pending_work
+    pipeline_config = {"config": {"crime_table_name": "crime_data"}}
+    connection = FakeConnection({"to_regclass": [[True]], "max(run_id)": [[3]], "filter (where status": [[0, 0]], "max(updated_at)": [[None]]})
+    assert get_pending_work(pipeline_config=pipeline_config, connection=connection, APP_TOKEN="abc123") == {
+        "run_id": 4, "backfill": True, "reasons": ["table crime_data is empty and has no backfill checkpoints"]}
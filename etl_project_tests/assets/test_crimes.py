@@ -1,6 +1,11 @@
-from etl_project.pipeline import _generate_date_ranges, generate_date_df, extract_csv, transform_crime_data
+from etl_project.pipeline import _generate_date_ranges, _generate_count_aware_date_ranges, _month_partition_bounds, get_retention_start, drop_expired_crime_partitions, generate_date_df, extract_csv, transform_crime_data, decode_crime_page, backfill_crime_data, _copy_csv_blocks, CrimeDictionary, grid_cells_within_radius, GRID_CELL_ROWS, CRIME_API_FIELDS, CRIME_COLUMNS
+from etl_project import pipeline
 import pandas as pd
+from datetime import datetime, date
 import pytest
+import logging
+import json
+from contextlib import contextmanager
 
 def test_extract_csv():
     file_path = "etl_project_tests/data/Police_Stations.csv"
@@ -32,6 +37,41 @@ def test_generate_dates(setup_start_end_times):
     assert len(result) == 2
     assert result == expected
 
+def test_generate_count_aware_dates(setup_start_end_times):
+    start_time, end_time = setup_start_end_times
+    daily_counts = {f"2023-10-{day:02d}": 100 for day in range(1, 15)}
+    daily_counts["2023-10-05"] = 900 # busier than the window target on its own
+    expected = [
+        {'start_time': '2023-10-01T00:00:00.000', 'end_time': '2023-10-04T23:59:59.999'},
+        {'start_time': '2023-10-05T00:00:00.000', 'end_time': '2023-10-05T23:59:59.999'},
+        {'start_time': '2023-10-06T00:00:00.000', 'end_time': '2023-10-10T23:59:59.999'},
+        {'start_time': '2023-10-11T00:00:00.000', 'end_time': '2023-10-14T23:59:59.999'}
+    ]
+    result = _generate_count_aware_date_ranges(start_date=start_time, end_date=end_time, daily_counts=daily_counts, window_target_rows=500)
+    assert result == expected
+
+def test_generate_count_aware_dates_end_at_midnight():
+    daily_counts = {"2023-10-01": 400, "2023-10-02": 400, "2023-10-03": 400}
+    expected = [
+        {'start_time': '2023-10-01T00:00:00.000', 'end_time': '2023-10-02T23:59:59.999'},
+        {'start_time': '2023-10-03T00:00:00.000', 'end_time': '2023-10-03T00:00:00.000'} # records at exactly the end_date are not dropped
+    ]
+    result = _generate_count_aware_date_ranges(start_date="2023-10-01T00:00:00.000", end_date="2023-10-03T00:00:00.000", daily_counts=daily_counts, window_target_rows=1000)
+    assert result == expected
+    result = _generate_count_aware_date_ranges(start_date="2023-10-03T00:00:00.000", end_date="2023-10-03T00:00:00.000", daily_counts=daily_counts, window_target_rows=1000)
+    assert result == expected[1:]
+
+def test_month_partition_bounds():
+    expected = [
+        ('p2023_12', datetime(2023, 12, 1), datetime(2024, 1, 1)),
+        ('p2024_01', datetime(2024, 1, 1), datetime(2024, 2, 1)),
+        ('p2024_02', datetime(2024, 2, 1), datetime(2024, 3, 1))
+    ]
+    assert _month_partition_bounds(start_date=datetime(2023, 12, 15), end_date=datetime(2024, 2, 1)) == expected
+
+def test_get_retention_start():
+    assert get_retention_start(retention_months=13, today=datetime(2024, 1, 20)) == datetime(2022, 12, 1)
+
 @pytest.fixture
 def setup_input_date_df():
     return pd.DataFrame(
@@ -69,6 +109,36 @@ def setup_input_date_df():
         ]
     )
 
+class FakeResult:
+    def __init__(self, rows, rowcount):
+        self.rows = rows
+        self.rowcount = rowcount
+
+    def all(self):
+        return self.rows
+
+class FakePartitionedEngine:
+    def __init__(self, partitions, deleted_rows):
+        self.partitions = partitions
+        self.deleted_rows = deleted_rows
+        self.statements = []
+
+    def execute(self, statement):
+        self.statements.append(statement)
+        return FakeResult(rows=[{"partition_name": partition} for partition in self.partitions], rowcount=self.deleted_rows)
+
+    @contextmanager
+    def begin(self):
+        yield self
+
+def test_drop_expired_crime_partitions_deletes_expired_default_records():
+    engine = FakePartitionedEngine(partitions=["crime_data_default", "crime_data_p2022_11", "crime_data_p2022_12"], deleted_rows=3)
+    expired = drop_expired_crime_partitions(
+        crime_table_name="crime_data", engine=engine, logger=logging.getLogger("test"), retention_months=13, today=datetime(2024, 1, 20), rollup_table_name="crime_daily_rollup")
+    assert expired == ["crime_data_p2022_11", "crime_data_default"] # December 2022 is the first month kept
+    assert "delete from crime_data_default where date_of_occurrence < '2022-12-01T00:00:00'" in engine.statements
+    assert "delete from crime_daily_rollup where occurrence_date < '2022-12-01'" in engine.statements
+
 def test_generate_date_df(setup_input_date_df):
     expected = setup_input_date_df
     df = generate_date_df("2023-01-01", "2023-01-03", ['etl_project/data/holidays/2023.csv'])
@@ -79,23 +149,17 @@ def setup_input_crime_df():
     return pd.DataFrame(
         [
             {
-                ":id":"row-6nmm_trd2~z4v7",
-                ":created_at":"2023-10-09T10:02:17.438Z",
-                ":updated_at":"2023-10-09T10:02:32.402Z",
-                ":version":"rv-hu9i-h33m.mx5k",
-                ":@computed_region_awaf_s7ux":"17",
-                ":@computed_region_6mkv_f3dw":"21559",
-                ":@computed_region_vrxf_vc4k":"66",
-                ":@computed_region_bdys_3d7i":"410",
-                ":@computed_region_43wa_7qmu":"32",
-                ":@computed_region_rpca_8um6":"11",
-                "case_":"JG446391",
+                "crime_id":"row-6nmm_trd2~z4v7",
+                "created_at":"2023-10-09T10:02:17.438Z",
+                "updated_at":"2023-10-09T10:02:32.402Z",
+                "version":"rv-hu9i-h33m.mx5k",
+                "case":"JG446391",
                 "date_of_occurrence":"2023-10-01T00:00:00.000",
                 "block":"070XX S MORGAN ST",
-                "_iucr":"1310",
-                "_primary_decsription":"CRIMINAL DAMAGE",
-                "_secondary_description":"TO PROPERTY",
-                "_location_description":"APARTMENT",
+                "iucr":"1310",
+                "primary_description":"CRIMINAL DAMAGE",
+                "secondary_description":"TO PROPERTY",
+                "location_description":"APARTMENT",
                 "arrest":"N",
                 "domestic":"N",
                 "beat":"733",
@@ -104,10 +168,7 @@ def setup_input_crime_df():
                 "x_coordinate":"1170859",
                 "y_coordinate":"1858203",
                 "latitude":"41.76638357",
-                "longitude":"-87.649296327",
-                "location.latitude":"41.76638357",
-                "location.longitude":"-87.649296327",
-                "location.human_address":"none"
+                "longitude":"-87.649296327"
             }
         ]
     )
@@ -118,5 +179,131 @@ def test_transform_crime_data(setup_input_crime_df):
     assert list(df.columns) == [
         'crime_id', 'created_at', 'updated_at', 'version', 'case','date_of_occurrence', 
         'block', 'iucr', 'primary_description','secondary_description', 'location_description', 
-        'arrest', 'domestic', 'beat', 'ward', 'fbi_cd', 'x_coordinate', 'y_coordinate', 'latitude','longitude'
-        ]
\ No newline at end of file
+        'arrest', 'domestic', 'beat', 'ward', 'fbi_cd', 'x_coordinate', 'y_coordinate', 'latitude','longitude',
+        'district', 'occurrence_date', 'hour', 'time_of_day', 'nearest_station', 'station_distance', 'grid_cell'
+        ]
+    assert str(df['updated_at'].dtype) == 'datetime64[ns, UTC]'
+    assert df['date_of_occurrence'][0] == pd.Timestamp("2023-10-01 00:00:00")
+    assert str(df['ward'].dtype) == 'Int64' and df['ward'][0] == 16
+    assert df['latitude'][0] == 41.76638357
+    assert df['district'][0] == str(df['beat'][0] // 100) # e.g. beat 733 -> district '7'
+    assert df['occurrence_date'][0] == date(2023, 10, 1)
+    assert df['hour'][0] == 0 and df['time_of_day'][0] == 'night'
+    assert str(df['primary_description'].dtype) == 'category'
+    assert df['nearest_station'][0] == '6' and round(df['station_distance'][0]) == 5373 # 7808 S Halsted St
+    assert df['grid_cell'][0] == 1170 * GRID_CELL_ROWS + 1858
+
+def test_transform_crime_data_leaves_input_unchanged():
+    page = pd.DataFrame({"crime_id": ["row-1"], "beat": ["733"]})
+    df = transform_crime_data(page)
+    assert list(page.columns) == ["crime_id", "beat"] and page["beat"][0] == "733"
+    assert df["beat"][0] == 733 and df["ward"].isna().all()
+
+def test_decode_crime_page(setup_input_crime_df):
+    record = {field: setup_input_crime_df[column][0] for field, column in CRIME_API_FIELDS.items() if column != "ward"} # fields without a value are left out by the API
+    record[":@computed_region_awaf_s7ux"] = "17" # fields that are not selected are ignored
+    page_df = decode_crime_page(content=json.dumps([record]).encode())
+    assert list(page_df.columns) == CRIME_COLUMNS
+    assert str(page_df["updated_at"].dtype) == 'datetime64[ns, UTC]'
+    assert str(page_df["beat"].dtype) == 'Int64' and page_df["beat"][0] == 733
+    assert page_df["ward"].isna().all()
+
+    expected = transform_crime_data(setup_input_crime_df.drop(columns=["ward"]))
+    pd.testing.assert_frame_equal(left=transform_crime_data(page_df), right=expected)
+
+def test_police_stations_skip_headquarters():
+    police_stations = pipeline.PoliceStations(csv_file_path="etl_project_tests/data/Police_Stations.csv")
+    assert "Headquarters" not in police_stations.districts
+    nearest_station, station_distance = police_stations.nearest(x=pd.Series([1177731.401]), y=pd.Series([1881697.404])) # at 3510 S Michigan Ave
+    assert nearest_station[0] == '9' and round(station_distance[0]) == 6729 # 3120 S Halsted St
+
+def test_grid_cells_within_radius():
+    cells = grid_cells_within_radius(x=1170859, y=1858203, radius_feet=500)
+    assert sorted(cells) == [1170 * GRID_CELL_ROWS + 1857, 1170 * GRID_CELL_ROWS + 1858, 1171 * GRID_CELL_ROWS + 1857, 1171 * GRID_CELL_ROWS + 1858]
+
+def test_crime_dictionary_encodes_new_values_only(monkeypatch):
+    fetched = []
+    def fake_fetch_codes(column, values, engine):
+        fetched.append((column, values))
+        return {value: 100 + len(value) for value in values}
+
+    crime_dictionary = CrimeDictionary()
+    monkeypatch.setattr(crime_dictionary, "fetch_codes", fake_fetch_codes)
+    page = pd.DataFrame({"crime_id": ["a", "b", "c"], "block": ["X", None, "YY"], "iucr": ["1310"] * 3, "primary_description": ["THEFT", "THEFT", "BATTERY"],
+                         "secondary_description": [None] * 3, "location_description": ["STREET"] * 3, "fbi_cd": ["14"] * 3})
+    encoded = crime_dictionary.encode(crime_df=transform_crime_data(page)[page.columns], engine=None)
+    assert list(encoded.columns) == ["crime_id", "block_id", "iucr_id", "primary_description_id", "secondary_description_id", "location_description_id", "fbi_cd_id"]
+    assert encoded["block_id"].tolist() == [101, pd.NA, 102]
+    assert encoded["primary_description_id"].tolist() == [105, 105, 107]
+    assert encoded["secondary_description_id"].isna().all()
+    assert ("primary_description", ["BATTERY", "THEFT"]) in fetched
+
+    fetched.clear()
+    encoded = crime_dictionary.encode(crime_df=transform_crime_data(page.iloc[:1])[page.columns], engine=None)
+    assert fetched == [] and encoded["block_id"].tolist() == [101] # known values are encoded without any query
+
+def test_backfill_crime_data_isolates_failed_windows(monkeypatch, setup_start_end_times):
+    start_time, end_time = setup_start_end_times
+    date_ranges = _generate_date_ranges(start_date=start_time, end_date=end_time, days_delta=1)
+    loaded_windows = []
+
+    def fake_load_crime_window(start_time, end_time, **kwargs):
+        if start_time == date_ranges[3]['start_time']:
+            raise ValueError("page failed")
+        loaded_windows.append(start_time)
+        return 10
+
+    monkeypatch.setattr(pipeline, "load_crime_window", fake_load_crime_window)
+    with pytest.raises(Exception, match="1 of 14 windows"):
+        backfill_crime_data(
+            APP_TOKEN="abc123", date_ranges=date_ranges, limit=1000, chunksize=1000,
+            crime_table=None, engine=None, logger=logging.getLogger("test"), max_workers=4
+        )
+    assert sorted(loaded_windows) == [r['start_time'] for r in date_ranges if r is not date_ranges[3]]
+
+def test_load_crime_window_skips_records_before_retention(monkeypatch, setup_input_crime_df):
+    page = pd.concat([setup_input_crime_df] * 2, ignore_index=True)
+    page.loc[1, ["crime_id", "date_of_occurrence"]] = ["row-old", "2022-11-30T23:59:59.000"]
+    loaded = []
+
+    def fake_load_data_to_postgres(data, **kwargs):
+        loaded.extend(data["crime_id"])
+        return {"inserted": len(data), "updated": 0, "skipped": 0}
+
+    crime_dictionary = CrimeDictionary()
+    monkeypatch.setattr(crime_dictionary, "fetch_codes", lambda column, values, engine: {value: 1 for value in values})
+    monkeypatch.setattr(pipeline, "extract_crime_api_pages", lambda **kwargs: iter([page]))
+    monkeypatch.setattr(pipeline, "load_data_to_postgres", fake_load_data_to_postgres)
+    row_count = pipeline.load_crime_window(
+        APP_TOKEN="abc123", column_name="date_of_occurrence", start_time="2022-11-27T00:00:00.000", end_time="2023-10-03T23:59:59.999",
+        limit=1000, chunksize=1000, crime_table=None, engine=None, logger=logging.getLogger("test"),
+        retention_start=get_retention_start(retention_months=13, today=datetime(2024, 1, 20)), crime_dictionary=crime_dictionary
+    )
+    assert loaded == ["row-6nmm_trd2~z4v7"] and row_count == 1 # the record of November 2022 is before the retention start (2022-12-01)
+
+def test_load_crime_window_counts_written_rows_as_upserted(monkeypatch, setup_input_crime_df):
+    page = pd.concat([setup_input_crime_df] * 3, ignore_index=True)
+    page["crime_id"] = ["row-1", "row-2", "row-3"]
+
+    crime_dictionary = CrimeDictionary()
+    monkeypatch.setattr(crime_dictionary, "fetch_codes", lambda column, values, engine: {value: 1 for value in values})
+    monkeypatch.setattr(pipeline, "extract_crime_api_pages", lambda **kwargs: iter([page]))
+    monkeypatch.setattr(pipeline, "load_data_to_postgres", lambda data, **kwargs: {"inserted": 1, "updated": 1, "skipped": 1})
+    metrics = pipeline.PipelineMetrics()
+    pipeline.load_crime_window(
+        APP_TOKEN="abc123", column_name=":updated_at", start_time="2023-10-01T00:00:00.000", end_time="2023-10-03T23:59:59.999",
+        limit=1000, chunksize=1000, crime_table=None, engine=None, logger=logging.getLogger("test"), metrics=metrics, crime_dictionary=crime_dictionary
+    )
+    summary = metrics.summary()
+    assert summary["rows_transformed"] == 3 and summary["rows_upserted"] == 2 and summary["rows_skipped"] == 1 # the unchanged record is not upserted
+
+def test_copy_csv_blocks():
+    rows = [
+        ("row-1", 'O"HARE ST, N', 16, None),
+        ("row-2", "", None, "N"),
+    ]
+    blocks = list(_copy_csv_blocks(rows=rows, rows_per_block=1))
+    assert blocks == [
+        '"row-1","O""HARE ST, N","16",\n',
+        '"row-2","",,"N"\n', # empty string stays quoted, None is written as NULL
+    ]
@@ -0,0 +1,60 @@
+from etl_project.pipeline import CrimeParquetExport, EXPORT_STATISTICS_COLUMNS
+from sqlalchemy import Table, Column, String, Integer, DateTime, MetaData
+from datetime import datetime, timezone
+import pyarrow as pa
+import pyarrow.parquet as pq
+import json
+import logging
+
+def make_crime_table():
+    return Table(
+        "crime_data", MetaData(),
+        Column("crime_id", String, primary_key=True),
+        Column("updated_at", DateTime(timezone=True)),
+        Column("version", String),
+        Column("date_of_occurrence", DateTime(timezone=True), primary_key=True),
+        Column("beat", Integer),
+        Column("ward", Integer))
+
+def test_compact_keeps_latest_version(tmp_path):
+    crime_table = make_crime_table()
+    schema = CrimeParquetExport.arrow_schema(table=crime_table)
+    assert schema.field("date_of_occurrence").type == pa.timestamp("us", tz="UTC")
+
+    crime_export = CrimeParquetExport(export_folder_path=str(tmp_path), compact_max_files=1)
+    month_path = tmp_path / "year=2023" / "month=1"
+    month_path.mkdir(parents=True)
+    occurrence = datetime(2023, 1, 5, tzinfo=timezone.utc)
+    for file_number, (updated_at, version) in enumerate([(datetime(2024, 1, 1, tzinfo=timezone.utc), "rv-1"), (datetime(2024, 2, 1, tzinfo=timezone.utc), "rv-2")]):
+        month_table = pa.Table.from_pylist([
+            {"crime_id": "row-1", "updated_at": updated_at, "version": version, "date_of_occurrence": occurrence, "beat": 111, "ward": 2},
+            {"crime_id": f"row-{file_number + 2}", "updated_at": updated_at, "version": "rv-1", "date_of_occurrence": occurrence, "beat": 733, "ward": 1},
+        ], schema=schema)
+        crime_export._write_parquet(table=month_table, file_path=month_path / f"part-{file_number:06d}.parquet")
+
+    assert crime_export.compact(month_path=month_path, schema=schema)
+    file_paths = list(month_path.glob("*.parquet"))
+    assert len(file_paths) == 1
+    compacted = pq.read_table(file_paths[0]).to_pylist()
+    assert [(row["crime_id"], row["version"]) for row in compacted] == [("row-2", "rv-1"), ("row-3", "rv-1"), ("row-1", "rv-2")] # sorted by ward
+
+    row_group = pq.ParquetFile(file_paths[0]).metadata.row_group(0)
+    columns_with_statistics = [row_group.column(i).path_in_schema for i in range(row_group.num_columns) if row_group.column(i).statistics is not None]
+    assert sorted(columns_with_statistics) == sorted(EXPORT_STATISTICS_COLUMNS)
+
+class FakeEngine:
+    def execute(self, query):
+        return type("Result", (), {"all": lambda result: []})() # no records updated after the watermark
+
+def test_export_resets_after_crime_table_is_backfilled_again(tmp_path):
+    crime_export = CrimeParquetExport(export_folder_path=str(tmp_path))
+    month_path = tmp_path / "year=2023" / "month=1"
+    month_path.mkdir(parents=True)
+    (month_path / "part-000001-abcdef12.parquet").write_bytes(b"")
+    crime_export.state_path.write_text(json.dumps({"updated_at": "2024-02-01T00:00:00+00:00", "crime_id": "row-1", "table_run_id": 1}))
+
+    crime_export.export(crime_table=make_crime_table(), engine=FakeEngine(), logger=logging.getLogger("test"), run_id=8, table_run_id=1)
+    assert crime_export.read_watermark()["crime_id"] == "row-1" and month_path.exists()
+
+    crime_export.export(crime_table=make_crime_table(), engine=FakeEngine(), logger=logging.getLogger("test"), run_id=9, table_run_id=9)
+    assert crime_export.read_watermark() is None and not (tmp_path / "year=2023").exists() # reloaded records are exported again
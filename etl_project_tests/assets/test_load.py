@@ -0,0 +1,214 @@
+from etl_project.pipeline import load_data_to_postgres
+from etl_project import pipeline
+from sqlalchemy import Table, Column, String, Integer, DateTime, MetaData
+from sqlalchemy.dialects import postgresql
+from contextlib import contextmanager
+from datetime import datetime
+import pandas as pd
+import pytest
+import logging
+import os
+
+def make_crime_table():
+    return Table(
+        "crime_data", MetaData(),
+        Column("crime_id", String, primary_key=True),
+        Column("date_of_occurrence", DateTime(timezone=True), primary_key=True),
+        Column("version", String),
+        Column("beat", Integer))
+
+CRIME_ROWS = [
+    {"crime_id": "row-1", "date_of_occurrence": datetime(2023, 10, 1, 8), "version": "rv-2", "beat": 733},
+    {"crime_id": "row-2", "date_of_occurrence": datetime(2023, 10, 2, 9), "version": "rv-1", "beat": 111},
+    {"crime_id": "row-3", "date_of_occurrence": datetime(2023, 10, 3, 10), "version": "rv-1", "beat": 2533},
+]
+
+class FakeCursor:
+    def __init__(self, results):
+        self.results = list(results) # fetchone results, in the order of the statements that return rows
+        self.statements = []
+
+    def execute(self, statement, stream=None):
+        self.statements.append(" ".join(statement.split()))
+        if stream is not None:
+            self.copied = "".join(stream)
+
+    def fetchone(self):
+        return self.results.pop(0)
+
+class FakeRawConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.committed = False
+
+    def cursor(self):
+        return self._cursor
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+class FakeCopyEngine:
+    dialect = postgresql.dialect()
+
+    def __init__(self, results):
+        self.cursor = FakeCursor(results=results)
+        self.connection = FakeRawConnection(cursor=self.cursor)
+
+    def raw_connection(self):
+        return self.connection
+
+def test_copy_upsert_counts_and_version_guard():
+    engine = FakeCopyEngine(results=[(2, 1)]) # 2 rows already existed, 1 of them changed, 1 new row
+    row_counts = load_data_to_postgres(chunksize=1000, data=CRIME_ROWS, table=make_crime_table(), engine=engine, load_method="copy", version_column="version")
+    assert row_counts == {"inserted": 1, "updated": 0, "skipped": 2}
+
+    copy_statement, upsert_statement = engine.cursor.statements[1:]
+    assert copy_statement == "copy stage_crime_data (crime_id, date_of_occurrence, version, beat) from stdin with (format csv)"
+    assert engine.cursor.copied.count("\n") == 3
+    assert "on conflict (crime_id, date_of_occurrence) do update set version = excluded.version, beat = excluded.beat " \
+        "where crime_data.version is distinct from excluded.version" in upsert_statement
+    assert engine.connection.committed
+
+def test_copy_upsert_deletes_moved_rows_in_the_same_transaction():
+    engine = FakeCopyEngine(results=[(1,), (1, 3)]) # 1 moved row deleted, then 1 existing row updated and 2 inserted
+    row_counts = load_data_to_postgres(chunksize=1000, data=CRIME_ROWS, table=make_crime_table(), engine=engine, load_method="copy", version_column="version", delete_moved=True)
+    assert row_counts == {"inserted": 2, "updated": 1, "skipped": 0, "moved": 1}
+
+    delete_statement, upsert_statement = engine.cursor.statements[2:]
+    assert "delete from crime_data c using stage_crime_data moved where c.crime_id = moved.crime_id and c.date_of_occurrence <> moved.date_of_occurrence" in delete_statement
+    assert upsert_statement.startswith("with upserted as (insert into crime_data")
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+    def scalar(self):
+        return self.rows[0][0]
+
+class FakeInsertEngine:
+    def __init__(self, results):
+        self.results = list(results) # results of the statements, in order
+        self.statements = []
+        self.params = []
+
+    def execute(self, statement, **params):
+        self.statements.append(" ".join(str(statement.compile(dialect=postgresql.dialect())).split()))
+        self.params.append(params)
+        return FakeResult(rows=self.results.pop(0))
+
+    @contextmanager
+    def begin(self):
+        yield self
+
+def test_insert_upsert_counts_chunks_and_moved_rows():
+    engine = FakeInsertEngine(results=[
+        [(0,)], [("row-1", CRIME_ROWS[0]["date_of_occurrence"])], [("row-1", CRIME_ROWS[0]["date_of_occurrence"])], # chunk 1: row-1 updated
+        [(1,)], [], [("row-2", CRIME_ROWS[1]["date_of_occurrence"])], # chunk 2: row-2 inserted, its old row (other date) deleted
+        [(0,)], [("row-3", CRIME_ROWS[2]["date_of_occurrence"])], [], # chunk 3: row-3 unchanged
+    ])
+    row_counts = load_data_to_postgres(chunksize=1, data=CRIME_ROWS, table=make_crime_table(), engine=engine, version_column="version", delete_moved=True)
+    assert row_counts == {"inserted": 1, "updated": 1, "skipped": 1, "moved": 1}
+
+    delete_statement, _, upsert_statement = engine.statements[:3]
+    assert delete_statement.startswith("with deleted as ( delete from crime_data c using unnest(")
+    assert engine.params[3] == {"crime_ids": ["row-2"], "dates": ["2023-10-02T09:00:00"]}
+    assert "ON CONFLICT (crime_id, date_of_occurrence) DO UPDATE SET version = excluded.version, beat = excluded.beat " \
+        "WHERE crime_data.version IS DISTINCT FROM excluded.version" in upsert_statement
+
+@pytest.fixture
+def postgres_engine():
+    """
+    Engine of a scratch database created on the Postgres server of the pipeline's environment variables (skipped without one) and dropped afterwards.
+    """
+    if not os.environ.get("SERVER_NAME"):
+        pytest.skip("needs a Postgres server (SERVER_NAME, PORT, DB_USERNAME, DB_PASSWORD, DATABASE_NAME)")
+    credentials = {"username": os.environ.get("DB_USERNAME"), "password": os.environ.get("DB_PASSWORD"), "host": os.environ.get("SERVER_NAME"), "port": os.environ.get("PORT")}
+    admin_engine = pipeline.create_postgres_connection(database=os.environ.get("DATABASE_NAME"), **credentials).execution_options(isolation_level="AUTOCOMMIT")
+    test_database = f"crime_test_{os.getpid()}"
+    admin_engine.execute(f"drop database if exists {test_database} with (force)")
+    admin_engine.execute(f"create database {test_database}")
+    engine = pipeline.create_postgres_connection(database=test_database, **credentials)
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+        admin_engine.execute(f"drop database if exists {test_database} with (force)")
+        admin_engine.dispose()
+
+def api_record(crime_id, version, date_of_occurrence, beat, primary_description, arrest):
+    return {
+        "crime_id": crime_id, "created_at": "2023-10-09T10:02:17.438Z", "updated_at": "2023-10-09T10:02:32.402Z", "version": version,
+        "case": f"JG{crime_id[-1]}", "date_of_occurrence": date_of_occurrence, "block": "070XX S MORGAN ST", "iucr": "1310",
+        "primary_description": primary_description, "secondary_description": None, "location_description": "APARTMENT",
+        "arrest": arrest, "domestic": "N", "beat": str(beat), "ward": "16", "fbi_cd": "14",
+        "x_coordinate": "1170859", "y_coordinate": "1858203", "latitude": "41.76638357", "longitude": "-87.649296327"}
+
+def load_page(records, crime_table, engine, load_method, monkeypatch, delete_moved=False):
+    monkeypatch.setattr(pipeline, "extract_crime_api_pages", lambda **kwargs: iter([pd.DataFrame(records)]))
+    return pipeline.load_crime_window(
+        APP_TOKEN="abc123", column_name=":updated_at", start_time="2023-10-01T00:00:00.000", end_time="2023-10-31T23:59:59.999",
+        limit=1000, chunksize=2, crime_table=crime_table, engine=engine, logger=logging.getLogger("test"), load_method=load_method,
+        delete_moved=delete_moved, rollup_table_name="crime_daily_rollup", crime_dictionary=pipeline.CrimeDictionary())
+
+ROLLUP_QUERY = "select occurrence_date, beat, ward, primary_description_id, district, crime_count, arrest_count from {} order by 1, 2, 3, 4"
+
+@pytest.mark.parametrize("load_method", ["insert", "copy"])
+def test_incremental_load_keeps_rollup_and_dictionary_in_sync(postgres_engine, load_method, monkeypatch):
+    engine = postgres_engine
+    pipeline.create_crime_dictionary_tables(engine=engine)
+    crime_table = pipeline.create_crime_table(engine=engine)
+    pipeline.create_crime_partitions(crime_table_name="crime_data", engine=engine, logger=logging.getLogger("test"), start_date=datetime(2023, 10, 1), end_date=datetime(2023, 10, 1))
+    pipeline.create_crime_rollup_table(engine=engine)
+
+    assert load_page([
+        api_record("row-1", "rv-1", "2023-10-01T08:00:00.000", 733, "THEFT", "N"),
+        api_record("row-2", "rv-1", "2023-10-02T09:00:00.000", 111, "BATTERY", "Y"),
+        api_record("row-3", "rv-1", "2023-10-02T10:00:00.000", 733, "THEFT", "N"),
+    ], crime_table=crime_table, engine=engine, load_method=load_method, monkeypatch=monkeypatch) == 3
+
+    upserted = load_page([
+        api_record("row-1", "rv-1", "2023-10-01T08:00:00.000", 733, "THEFT", "N"), # unchanged version, skipped
+        api_record("row-2", "rv-2", "2023-10-02T09:00:00.000", 2533, "BATTERY", "N"), # moves to district 25, no longer an arrest
+        api_record("row-3", "rv-2", "2023-10-05T10:00:00.000", 733, "ROBBERY", "N"), # moves to another day and description
+        api_record("row-4", "rv-1", "2023-10-05T11:00:00.000", 733, "ROBBERY", "Y"),
+    ], crime_table=crime_table, engine=engine, load_method=load_method, monkeypatch=monkeypatch, delete_moved=True)
+    assert upserted == 4 # row-3 and row-4 inserted, row-2 updated, old row of row-3 deleted
+
+    crime_rows = engine.execute(pipeline.decoded_crime_query(crime_table=crime_table).order_by("crime_id")).all()
+    assert [(row["crime_id"], row["version"], row["district"], row["primary_description"]) for row in crime_rows] == [
+        ("row-1", "rv-1", "7", "THEFT"), ("row-2", "rv-2", "25", "BATTERY"), ("row-3", "rv-2", "7", "ROBBERY"), ("row-4", "rv-1", "7", "ROBBERY")]
+
+    # The incrementally maintained rollup matches one computed from scratch, without groups left at zero
+    pipeline.create_crime_rollup_table(engine=engine, table_name="crime_rollup_check")
+    pipeline.rebuild_crime_rollup(crime_table_name="crime_data", rollup_table_name="crime_rollup_check", engine=engine, logger=logging.getLogger("test"))
+    rollup_rows = engine.execute(ROLLUP_QUERY.format("crime_daily_rollup")).all()
+    assert rollup_rows == engine.execute(ROLLUP_QUERY.format("crime_rollup_check")).all()
+    assert [(str(row["occurrence_date"]), row["district"], row["crime_count"], row["arrest_count"]) for row in rollup_rows] == [
+        ("2023-10-01", "7", 1, 0), ("2023-10-02", "25", 1, 0), ("2023-10-05", "7", 2, 1)]
+
+    # Codes of the lookup tables are stable: a new dictionary resolves known values to the codes already stored
+    stored_codes = dict(engine.execute("select primary_description, primary_description_id from primary_descriptions").all())
+    assert sorted(stored_codes) == ["BATTERY", "ROBBERY", "THEFT"]
+    assert pipeline.CrimeDictionary().fetch_codes(column="primary_description", values=["ROBBERY", "THEFT"], engine=engine) == \
+        {"ROBBERY": stored_codes["ROBBERY"], "THEFT": stored_codes["THEFT"]}
+
+def test_derived_station_sql_matches_transform(postgres_engine):
+    engine = postgres_engine
+    police_table = pipeline.create_police_table(engine=engine)
+    load_data_to_postgres(chunksize=1000, data=pipeline.extract_csv(csv_file_path=pipeline.POLICE_STATIONS_CSV_PATH), table=police_table, engine=engine)
+    x, y = pd.Series([1177731, 1170859]), pd.Series([1881697, 1858203]) # at Headquarters, and near the 6th district station
+    nearest_station, station_distance = pipeline.get_police_stations().nearest(x=x, y=y)
+    rows = engine.execute(
+        f"select {pipeline.CRIME_DERIVED_COLUMNS['nearest_station']}, {pipeline.CRIME_DERIVED_COLUMNS['station_distance']} "
+        f"from (values (1177731, 1881697, 1), (1170859, 1858203, 2)) c(x_coordinate, y_coordinate, n) order by n").all()
+    assert [row[0] for row in rows] == list(nearest_station) == ["9", "6"]
+    assert [row[1] for row in rows] == pytest.approx(list(station_distance))
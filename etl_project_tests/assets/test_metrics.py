@@ -0,0 +1,26 @@
+from etl_project.pipeline import PipelineMetrics, write_prometheus_textfile
+
+def test_pipeline_metrics_rolls_up_windows():
+    metrics = PipelineMetrics()
+    for start_time in ["2023-01-01T00:00:00.000", "2023-01-08T00:00:00.000"]:
+        window_metrics = metrics.window(start_time=start_time)
+        window_metrics.increment("rows_upserted", 10)
+        window_metrics.observe_http_request(seconds=0.5, num_bytes=100)
+        with window_metrics.timer("load"):
+            pass
+
+    summary = metrics.summary()
+    assert summary["rows_upserted"] == 20
+    assert summary["http_requests"] == 2
+    assert summary["http_bytes"] == 200
+    assert summary["http_request_seconds_p50"] == 0.5
+    assert summary["load_seconds"] >= 0
+
+    records = metrics.to_records(run_id=1)
+    assert {record["scope"] for record in records} == {"run", "2023-01-01T00:00:00.000", "2023-01-08T00:00:00.000"}
+    assert [record["value"] for record in records if record["scope"] == "2023-01-01T00:00:00.000" and record["metric_name"] == "rows_upserted"] == [10]
+
+def test_write_prometheus_textfile(tmp_path):
+    file_path = tmp_path / "etl.prom"
+    write_prometheus_textfile(file_path=str(file_path), pipeline_name="Chicago Crime ETL", metrics={"rows_upserted": 20})
+    assert file_path.read_text() == '# TYPE etl_pipeline_rows_upserted gauge\netl_pipeline_rows_upserted{pipeline="Chicago Crime ETL"} 20.0\n'
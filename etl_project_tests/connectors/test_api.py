@@ -1,5 +1,5 @@
 from dotenv import load_dotenv
-from etl_project.pipeline import extract_crime_api
+from etl_project.pipeline import extract_crime_api, extract_crime_api_ids
 import os
 import pytest
 from datetime import datetime
@@ -28,8 +28,8 @@ def test_chicago_crimes_pipeline(setup):
     assert len(data) > 0 # asserts data records are retrieved
 
     # asserts date_of_occurence of data extracted is between given date ranges
-    assert datetime.strptime(start_time, '%Y-%m-%dT%H:%M:%S.%f') <= datetime.strptime(min(data['date_of_occurrence']), '%Y-%m-%dT%H:%M:%S.%f')
-    assert datetime.strptime(end_time, '%Y-%m-%dT%H:%M:%S.%f') >= datetime.strptime(max(data['date_of_occurrence']), '%Y-%m-%dT%H:%M:%S.%f')
+    assert datetime.strptime(start_time, '%Y-%m-%dT%H:%M:%S.%f') <= min(data['date_of_occurrence']) # date_of_occurrence is decoded to datetime64
+    assert datetime.strptime(end_time, '%Y-%m-%dT%H:%M:%S.%f') >= max(data['date_of_occurrence'])
 
     data = extract_crime_api(
         APP_TOKEN=APP_TOKEN, 
@@ -39,4 +39,26 @@ def test_chicago_crimes_pipeline(setup):
         limit=limit
     )
 
-    assert len(data) > 0 # asserts data records are retrieved if extraction filtered by :updated_at column 
\ No newline at end of file
+    assert len(data) > 0 # asserts data records are retrieved if extraction filtered by :updated_at column 
+
+
+def test_chicago_crimes_ids(setup):
+    APP_TOKEN = os.environ.get("APP_TOKEN")
+    start_time = '2024-01-01T00:00:00.000'
+    end_time = '2024-01-03T23:59:59.999'
+
+    data = extract_crime_api(
+        APP_TOKEN=APP_TOKEN, 
+        column_name="date_of_occurrence",
+        start_time=start_time, 
+        end_time=end_time, 
+        limit=1000
+    )
+    ids = [
+        id_version
+        for page in extract_crime_api_ids(APP_TOKEN=APP_TOKEN, start_time=start_time, end_time=end_time, limit=500)
+        for id_version in page
+    ]
+
+    assert len(ids) > 0 # asserts ids are retrieved
+    assert sorted(ids) == sorted(zip(data['crime_id'], data['version'])) # asserts the same records as a full extract
@@ -0,0 +1,116 @@
+from etl_project.api_client import ApiClient, TokenBucket
+from etl_project import api_client, pipeline
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+import pytest
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        status, headers, body = self.server.responses.pop(0) if self.server.responses else (200, {}, [])
+        if status == "hang":
+            time.sleep(0.5) # longer than the read timeout of the client
+            status = 200
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.responses = [] # (status, headers, body) of the next requests, then 200 with []
+    server.paths = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/resource/x2n5-8w5q.json"
+
+
+def test_get_retries_throttled_and_failed_requests(stub_server):
+    stub_server.responses = [(503, {}, {}), (429, {"Retry-After": "7"}, {}), (200, {}, [{"max_updated_at": "2024-01-10T10:02:11.508Z"}])]
+    now, sleeps = [0.0], []
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+    api_client = ApiClient(requests_per_second=100, clock=lambda: now[0], sleep=sleep)
+    response = api_client.get(url(stub_server))
+    assert response.json() == [{"max_updated_at": "2024-01-10T10:02:11.508Z"}]
+    assert len(stub_server.paths) == 3
+    assert 0.5 <= sleeps[0] <= 1.0 # jittered backoff of the first retry
+    assert sum(sleeps[1:]) == pytest.approx(7 + 1 / 50) # the 429 pauses the bucket for its Retry-After, then the retry waits for a token at the halved rate
+    assert api_client.token_bucket.rate == pytest.approx(60) # halved on the 429, +10 on the success
+
+
+def test_get_fails_fast_on_client_errors_and_gives_up_after_max_retries(stub_server):
+    stub_server.responses = [(400, {}, {"message": "bad query"})]
+    with pytest.raises(Exception, match="status code 400"):
+        ApiClient(sleep=lambda seconds: None).get(url(stub_server))
+    assert len(stub_server.paths) == 1
+
+    stub_server.responses = [(500, {}, {})] * 3
+    with pytest.raises(Exception, match="status code 500"):
+        ApiClient(max_retries=2, sleep=lambda seconds: None).get(url(stub_server))
+    assert len(stub_server.paths) == 4
+
+
+def test_get_retries_read_timeouts(stub_server):
+    stub_server.responses = [("hang", {}, [])]
+    api_client = ApiClient(read_timeout_seconds=0.1, sleep=lambda seconds: None)
+    assert api_client.get(url(stub_server)).json() == []
+    assert len(stub_server.paths) == 2
+
+
+def test_extract_pages_through_injected_failures(stub_server, monkeypatch):
+    stub_server.responses = [
+        (502, {}, {}), (200, {}, [{":id": "row-1", "ward": "16"}, {":id": "row-2", "ward": "4"}]),
+        (429, {"Retry-After": "0"}, {}), (200, {}, [{":id": "row-3", "ward": "1"}]),
+    ]
+    monkeypatch.setattr(api_client, "CRIME_API_URL", url(stub_server))
+    monkeypatch.setattr(pipeline, "get_api_client", lambda: ApiClient(sleep=lambda seconds: None))
+    pages = list(pipeline.extract_crime_api_pages(APP_TOKEN="abc123", column_name=":updated_at",
+                                                  start_time="2024-01-01T00:00:00.000", end_time="2024-01-07T23:59:59.999", limit=2))
+    assert [list(page_df["crime_id"]) for page_df in pages] == [["row-1", "row-2"], ["row-3"]]
+    assert "row-2" in stub_server.paths[-1] # the retried page continues after the last :id
+
+
+def test_token_bucket_resumes_one_token_after_a_pause():
+    now = [1000.0]
+    def sleep(seconds):
+        now[0] += seconds
+    token_bucket = TokenBucket(requests_per_second=100, clock=lambda: now[0], sleep=sleep)
+    token_bucket.decrease()
+    token_bucket.pause(7)
+    assert token_bucket.acquire() == pytest.approx(7 + 1 / 50)
+    assert token_bucket.acquire() == pytest.approx(1 / 50) # paced at the halved rate, no burst after the pause
+
+
+def test_token_bucket_paces_requests():
+    now = [0.0]
+    def sleep(seconds):
+        now[0] += seconds
+    token_bucket = TokenBucket(requests_per_second=4, capacity=2, clock=lambda: now[0], sleep=sleep)
+    for _ in range(10):
+        token_bucket.acquire()
+    assert now[0] == pytest.approx(2.0) # a burst of 2, then 8 requests at 4 per second
+
+    token_bucket.pause(5)
+    token_bucket.decrease()
+    token_bucket.acquire()
+    assert now[0] == pytest.approx(7.5) # waits out the pause, then half a second at 2 per second
@@ -0,0 +1,61 @@
+from etl_project.pipeline import CrimePageCache
+import pandas as pd
+import pytest
+import os
+
+
+@pytest.fixture
+def setup_pages():
+    return [
+        pd.DataFrame([{":id": "row-1", "ward": "16"}, {":id": "row-2", "ward": None}]),
+        pd.DataFrame([{":id": "row-3", "ward": "4"}]),
+    ]
+
+
+def window(page_cache, pages, start_time="2024-01-01T00:00:00.000"):
+    return list(page_cache.cached_pages(
+        pages=iter(pages),
+        column_name="date_of_occurrence",
+        start_time=start_time,
+        end_time="2024-01-07T23:59:59.999",
+        max_updated_at="2024-01-10T10:02:11.508Z"
+    ))
+
+
+def test_page_cache_replays_window_from_disk(tmp_path, setup_pages):
+    page_cache = CrimePageCache(cache_folder_path=tmp_path, max_bytes=10**8)
+    assert len(window(page_cache, setup_pages)) == 2 # miss: pages come from the API and are written to disk
+
+    def api_pages():
+        raise AssertionError("API called on a cache hit")
+        yield
+
+    cached = list(page_cache.cached_pages(
+        pages=api_pages(),
+        column_name="date_of_occurrence",
+        start_time="2024-01-01T00:00:00.000",
+        end_time="2024-01-07T23:59:59.999",
+        max_updated_at="2024-01-10T10:02:11.508Z"
+    ))
+    assert [list(page_df[":id"]) for page_df in cached] == [["row-1", "row-2"], ["row-3"]]
+    assert cached[0]["ward"][1] is None
+
+
+def test_page_cache_evicts_least_recently_used(tmp_path, setup_pages):
+    page_cache = CrimePageCache(cache_folder_path=tmp_path, max_bytes=10**8)
+    window(page_cache, setup_pages, start_time="2024-01-01T00:00:00.000")
+    window(page_cache, setup_pages, start_time="2024-01-02T00:00:00.000")
+    first_key = CrimePageCache.window_key("date_of_occurrence", "2024-01-01T00:00:00.000", "2024-01-07T23:59:59.999", "2024-01-10T10:02:11.508Z")
+    os.utime(tmp_path / first_key / "_SUCCESS", (0, 0)) # first window was used longest ago
+    window_size = sum(path.stat().st_size for path in (tmp_path / first_key).iterdir())
+
+    page_cache.max_bytes = window_size
+    page_cache.evict()
+    remaining = [path.name for path in tmp_path.iterdir()]
+    assert remaining == [CrimePageCache.window_key("date_of_occurrence", "2024-01-02T00:00:00.000", "2024-01-07T23:59:59.999", "2024-01-10T10:02:11.508Z")]
+
+
+def test_page_cache_bypass(tmp_path, setup_pages):
+    page_cache = CrimePageCache(cache_folder_path=tmp_path / "cache", max_bytes=10**8, enabled=False)
+    assert len(window(page_cache, setup_pages)) == 2
+    assert not (tmp_path / "cache").exists()